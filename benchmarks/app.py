@@ -0,0 +1,166 @@
+"""Offline benchmark of /rasp and /webhook at 10, 1k and 50k volunteers.
+
+The app runs against an in-process fake Telegram Bot API server and a fake
+Firestore, so no credential or network access is needed. For every number of
+volunteers it reports throughput, p50/p99 latency and the peak RSS of the
+process so far.
+
+Usage:
+    python -m benchmarks.app [--volunteers 10,1000,50000] [--requests 200]
+        [--latency 0.005] [--rate-limited 0.0] [--rate-limit 100000]
+"""
+
+import argparse
+import logging
+import os
+import random
+import resource
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+from tests.fakes import FakeTelegramServer, install_fake_firestore
+
+GENDERS = ["M", "F"]
+LANGUAGES = ["en", "cn", "hk"]
+
+
+def volunteer(i: int, rng: random.Random) -> Dict[str, Any]:
+    return dict(
+        chat_id=i,
+        available=True,
+        gender=rng.choice(GENDERS),
+        language=rng.sample(LANGUAGES, rng.randint(1, 2)),
+        location=dict(lat=rng.uniform(1.24, 1.47), long=rng.uniform(103.6, 104.0)),
+    )
+
+
+def start_update(update_id: int, chat_id: int) -> Dict[str, Any]:
+    user = dict(id=chat_id, is_bot=False, first_name="Volunteer")
+    user["username"] = f"new{chat_id}"
+    return dict(
+        update_id=update_id,
+        message=dict(
+            message_id=1,
+            date=1678107080,
+            text="/start",
+            entities=[dict(offset=0, length=6, type="bot_command")],
+            chat=dict(id=chat_id, type="private", username=user["username"]),
+            **{"from": user},
+        ),
+    )
+
+
+def location_update(update_id: int, chat_id: int, rng: random.Random) -> Dict:
+    user = dict(id=chat_id, is_bot=False, first_name="Volunteer")
+    user["username"] = f"volunteer{chat_id}"
+    return dict(
+        update_id=update_id,
+        message=dict(
+            message_id=2,
+            date=1678107080,
+            location=dict(
+                latitude=rng.uniform(1.24, 1.47), longitude=rng.uniform(103.6, 104.0)
+            ),
+            chat=dict(id=chat_id, type="private", username=user["username"]),
+            **{"from": user},
+        ),
+    )
+
+
+def measure(name: str, requests: int, func: Callable[[int], Any]) -> None:
+    timings: List[float] = []
+    started_at = perf_counter()
+    for i in range(requests):
+        request_started_at = perf_counter()
+        func(i)
+        timings.append(perf_counter() - request_started_at)
+    elapsed = perf_counter() - started_at
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[int(len(timings) * 0.99)] * 1000
+    # ru_maxrss is in kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{name:<28} {requests / elapsed:8.1f} req/s   p50 {p50:8.2f} ms"
+        f"   p99 {p99:8.2f} ms   peak RSS {rss:7.1f} MB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--volunteers", default="10,1000,50000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="fake Bot API latency (s)"
+    )
+    parser.add_argument(
+        "--rate-limited", type=float, default=0.0, help="share of 429 responses"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        default="100000",
+        help="TELEGRAM_GLOBAL_RATE_LIMIT and TELEGRAM_CHAT_RATE_LIMIT; the "
+        "default measures the app, not Telegram's 30 messages per second",
+    )
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(args.latency, args.rate_limited).start()
+    os.environ.update(
+        TELEGRAM_BOT_TOKEN="benchmark",
+        TELEGRAM_API_URL=server.url,
+        TELEGRAM_GLOBAL_RATE_LIMIT=args.rate_limit,
+        TELEGRAM_CHAT_RATE_LIMIT=args.rate_limit,
+    )
+    db = install_fake_firestore()
+
+    # imported late so the configuration and fakes above are picked up
+    from src.app import app
+    from src.firebase import available_index
+
+    logging.getLogger().setLevel(logging.WARNING)
+    client = app.test_client()
+    users = db.collection("users")
+    update_ids = iter(range(1, 10**9))
+
+    for count in (int(n) for n in args.volunteers.split(",")):
+        rng = random.Random(460)
+        available_index.stop()
+        users._docs = {f"volunteer{i}": volunteer(i, rng) for i in range(count)}
+        started_at = perf_counter()
+        available_index.start(lambda: users.where("available", "==", True))
+        print(
+            f"\n{count} volunteers (index loaded in "
+            f"{(perf_counter() - started_at) * 1000:.1f} ms)"
+        )
+
+        def rasp(i: int) -> None:
+            body = dict(
+                # a new PWID every time, repeats would be coalesced
+                id=f"{count}-{i}",
+                lat=rng.uniform(1.24, 1.47),
+                long=rng.uniform(103.6, 104.0),
+                gender=rng.choice(GENDERS),
+                language=rng.choice(LANGUAGES),
+            )
+            response = client.post("/rasp", json=body)
+            assert response.status_code == 200, response.data
+
+        def webhook_start(i: int) -> None:
+            update_id = next(update_ids)
+            update = start_update(update_id, 10**7 + update_id)
+            assert client.post("/webhook", json=update).status_code == 200
+
+        def webhook_location(i: int) -> None:
+            update = location_update(next(update_ids), rng.randrange(count), rng)
+            assert client.post("/webhook", json=update).status_code == 200
+
+        measure("/rasp", args.requests, rasp)
+        measure("/webhook /start", args.requests, webhook_start)
+        measure("/webhook location", args.requests, webhook_location)
+
+    print(f"\nfake Bot API calls: {dict(server.calls)}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
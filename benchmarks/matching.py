@@ -0,0 +1,72 @@
+"""Benchmark of volunteer selection for /rasp at 100k available volunteers.
+
+Usage:
+    python -m benchmarks.matching [volunteers]
+"""
+
+import random
+import sys
+from time import perf_counter
+from typing import Callable, List
+
+from src.volunteer_index import AvailableVolunteerIndex
+
+GENDERS = ["M", "F"]
+LANGUAGES = ["en", "cn", "hk"]
+
+
+def build_index(volunteers: int, seed: int = 460) -> AvailableVolunteerIndex:
+    rng = random.Random(seed)
+    index = AvailableVolunteerIndex()
+    for i in range(volunteers):
+        index.update(
+            f"volunteer{i}",
+            dict(
+                available=True,
+                chat_id=i,
+                gender=rng.choice(GENDERS),
+                language=rng.sample(LANGUAGES, rng.randint(1, 2)),
+                location=dict(
+                    lat=rng.uniform(1.24, 1.47), long=rng.uniform(103.6, 104.0)
+                ),
+            ),
+        )
+    return index
+
+
+def timeit(name: str, func: Callable[[], object], repeat: int = 200) -> None:
+    timings: List[float] = []
+    for _ in range(repeat):
+        started_at = perf_counter()
+        func()
+        timings.append(perf_counter() - started_at)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[int(len(timings) * 0.99)] * 1000
+    print(f"{name:<40} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
+
+
+def naive_filter(index: AvailableVolunteerIndex, gender: str, language: str) -> list:
+    return [
+        volunteer
+        for volunteer in index.volunteers().values()
+        if volunteer.get("gender") == gender and language in volunteer["language"]
+    ]
+
+
+def main(volunteers: int) -> None:
+    started_at = perf_counter()
+    index = build_index(volunteers)
+    print(f"indexed {volunteers} volunteers in {perf_counter() - started_at:.2f}s")
+    matcher = index._matcher
+    timeit("match(gender, language)", lambda: matcher.match("F", "hk"))
+    timeit("naive dict filter", lambda: naive_filter(index, "F", "hk"), repeat=20)
+    timeit("select(k=50, 5km)", lambda: index.select(1.35, 103.82, 50, 5))
+    timeit(
+        "select(k=50, 5km, gender, language)",
+        lambda: index.select(1.35, 103.82, 50, 5, "F", "hk"),
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
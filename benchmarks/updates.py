@@ -0,0 +1,40 @@
+"""Microbenchmark of the parse cost of a Telegram update.
+
+For every update type it times building a `TelegramBotUpdate` from a decoded
+JSON body, alone and followed by the lookup of its dispatcher route, and
+reports the mean cost per update.
+
+Usage:
+    python -m benchmarks.updates [updates]
+"""
+
+import sys
+from time import perf_counter
+from typing import Callable
+
+from src.telegram.dispatch import Dispatcher
+from src.telegram.update import TelegramBotUpdate
+from tests.src.telegram.test_update import PAYLOADS
+
+
+def timeit(name: str, func: Callable[[], object], updates: int) -> None:
+    started_at = perf_counter()
+    for _ in range(updates):
+        func()
+    per_update = (perf_counter() - started_at) / updates * 1e6
+    print(f"{name:<40} {per_update:8.3f} us/update")
+
+
+def main(updates: int) -> None:
+    for update_type, payload in PAYLOADS.items():
+        body = {"update_id": 1, update_type: payload}
+        timeit(f"{update_type} parse", lambda: TelegramBotUpdate(body), updates)
+        timeit(
+            f"{update_type} parse + route",
+            lambda: Dispatcher.route(TelegramBotUpdate(body)),
+            updates,
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,34 @@
+# Picked up by gunicorn from the working directory.
+
+# Nothing connects to Firestore or Telegram at import, so the app can be loaded
+# once before forking and shared copy-on-write by the workers.
+preload_app = True
+
+# Security images are leased from an in-memory pool per process, so a single
+# worker keeps the icons of open help requests unique; see
+# `SecurityImageAllocator`. Serve concurrent requests from `src.asgi:app`.
+workers = 1
+
+
+def on_starting(server):
+    from src.config import VOLUNTEER_BACKEND
+
+    # other workers would never hear of a volunteer becoming available
+    if VOLUNTEER_BACKEND in ("sqlite", "memory") and server.cfg.workers > 1:
+        raise RuntimeError(
+            f'VOLUNTEER_BACKEND "{VOLUNTEER_BACKEND}" needs a single worker'
+        )
+
+
+def post_worker_init(worker):
+    from src.app import warm_up
+
+    warm_up()
+
+
+def worker_exit(server, worker):
+    from src.firebase import flush_writes
+    from src.security_images import security_images
+
+    flush_writes()
+    security_images.buffer.close(timeout=5)
@@ -1,4 +1,10 @@
-from src.app import app
+import os
+
+from src.app import app, warm_up
 
 if __name__ == "__main__":
+    # the reloader serves from a child process; warm up only that one, which
+    # also starts escalating help requests and expiring stale ones
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warm_up()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,18 @@
+from src.app import update_deduplicator, warm_up
+from src.config import WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+from src.telegram import bot
+from src.telegram.dispatch import dispatch
+from src.telegram.polling import UpdatePoller
+from src.telegram.update_queue import UpdateQueue
+
+if __name__ == "__main__":
+    # also starts escalating help requests and expiring stale ones
+    warm_up()
+    update_queue = UpdateQueue(
+        dispatch, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE
+    )
+    poller = UpdatePoller(bot, dispatch, update_deduplicator, update_queue)
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        pass
@@ -1,24 +1,66 @@
+import hmac
 import logging
 import os
-from typing import Any, Tuple
+import threading
+from functools import partial
+from time import perf_counter, time
+from typing import Any, Dict, List, Tuple, Union
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 
+from src.config import (
+    ADMIN_TOKEN,
+    DEDUP_BACKEND,
+    DEDUP_TTL,
+    ESCALATION_INTERVAL,
+    HELP_REQUEST_BACKEND,
+    HELP_REQUEST_STATS_WINDOW,
+    MEDIA_WARMUP_CHAT_ID,
+    RASP_BATCH_MAX,
+    RASP_COALESCE_WINDOW,
+    VOLUNTEER_BACKEND,
+    WEBHOOK_ACK_FIRST,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+)
 from src.constants import Message
-from src.firebase import available
-from src.telegram import bot, inline_button_with_callback
-from src.telegram.handlers import (
-    MessageCommandTypes,
-    callback_query_handler,
-    message_handler,
+from src.escalation import escalations
+from src.firebase import (
+    available,
+    db,
+    get_db,
+    select_volunteer_waves,
+    select_volunteers,
 )
-from src.telegram.update import TelegramBotUpdate, TelegramBotUpdateTypes
+from src.help_requests import HelpRequestState, help_requests
+from src.log import BODY, setup_logging
+from src.metrics import RASP_EVENTS, REGISTRY
+from src.pwid_profiles import pwid_profiles
+from src.rest import Json, generate_response_json
+from src.security_images import icon_url, security_images
+from src.telegram import blocking_bot, bot, inline_button_with_callback
+from src.telegram.dedup import FirestoreSeenSet, LocalSeenSet, UpdateDeduplicator
+from src.telegram.dispatch import dispatch
+from src.telegram.outbox import outbox
+from src.telegram.protocol import Bot, run_sync
+from src.telegram.update import TelegramBotUpdate
+from src.telegram.update_queue import UpdateQueue
+from src.telegram.volunteers import retract_broadcast
 
 app = Flask(__name__)
-logging.basicConfig(
-    level=logging.INFO, format="%(levelname)-8s :: (%(name)s) %(message)s"
-)
+setup_logging()
 logger = logging.getLogger(__name__)
+update_queue = UpdateQueue(
+    dispatch, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE
+)
+update_deduplicator = UpdateDeduplicator(
+    LocalSeenSet(ttl=DEDUP_TTL),
+    (
+        FirestoreSeenSet(db, "processed_updates", ttl=DEDUP_TTL)
+        if DEDUP_BACKEND == "firestore"
+        else None
+    ),
+)
 
 
 @app.route("/webhook", methods=["POST"])
@@ -55,31 +97,31 @@ def webhook() -> Tuple[Any, int]:
         Tuple[Any, int]: Flask Response
     """
     body = request.get_json() if request.is_json else None
-    logger.info(f"request body: {body}")
+    logger.info("request body: %s", body, extra=BODY)
     if not body:
         return "Invalid Request Body", 400
 
     update = TelegramBotUpdate(body)
-    response = None
-    if update.type == TelegramBotUpdateTypes.MESSAGE:
-        if update.text == MessageCommandTypes.START:
-            response = message_handler.start(update)
-
-    elif update.type == TelegramBotUpdateTypes.CALLBACK_QUERY:
-        if update.callback_data.get("command") == "gender":
-            response = callback_query_handler.gender_preference(update)
-        elif update.callback_data.get("command") == "language":
-            response = callback_query_handler.language_preference(update)
-        elif update.callback_data.get("command") == "request":
-            response = callback_query_handler.accept_volunteer(update)
-    else:
-        logger.info(f"Unhandled Update Type: {update.type}")
-        response = bot.send_message(update.chat_id, "Invalid input, please try again.")
+    if update_deduplicator.is_duplicate(update.update_id):
+        return "Duplicate update", 200
+
+    if WEBHOOK_ACK_FIRST:
+        if not update_queue.submit(update):
+            # Telegram redelivers the update later
+            update_deduplicator.forget(update.update_id)
+            return "Update queue is full", 503
+        return "Accepted", 200
 
+    try:
+        response = dispatch(update)
+    except Exception:
+        # Telegram redelivers the update after the error response
+        update_deduplicator.forget(update.update_id)
+        raise
     if not response:
         return "No response", 200
 
-    logger.info(repr(response))
+    logger.info("response: %s", response, extra=BODY)
     return response, 200
 
 
@@ -103,48 +145,394 @@ def health() -> Tuple[Any, int]:
     which = request.args.get("which")
     if which == "telegram":
         return bot.get_me(), 200
+    if which == "queue":
+        return update_queue.stats(), 200
+    if which == "outbox":
+        return outbox.stats(), 200
 
     return "Hello, Health!", 200
 
 
-@app.route("/rasp", methods=["POST"])
-def rasp() -> Tuple[Any, int]:
-    body = request.get_json() if request.is_json else None
-    logger.info(f"request body: {body}")
+@app.route("/metrics")
+def metrics() -> Response:
+    """Counters and latency histograms in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
-    if not body:
-        return "Invalid Request Body", 400
 
+def parse_rasp_body(body: Any) -> Union[Tuple[str, float, float], None]:
+    """Returns the (id, long, lat) of a /rasp request body, or None if it is
+    invalid."""
+    if not body:
+        return None
     pwid_id = body.get("id")
     long = body.get("long")
     lat = body.get("lat")
-
     if not pwid_id or not long or not lat:
-        return "Invalid Request Body", 400
+        return None
+    try:
+        return pwid_id, float(long), float(lat)
+    except (TypeError, ValueError):
+        return None
 
-    broadcast_message = Message.BROADCAST_REQUEST.format(
-        f"Long: {long}, Lat {lat}", pwid_id
-    )
-    available_volunteers = [
-        volunteer.get("chat_id") for volunteer in available().values()
-    ]
+
+def parse_rasp_batch(body: Any) -> Union[List[Any], None]:
+    """Returns the events of a /rasp/batch request body, a JSON array or
+    {"events": [...]}, or None if it is invalid."""
+    events = body.get("events") if isinstance(body, dict) else body
+    return events if isinstance(events, list) else None
+
+
+def group_rasp_events(events: List[Any]) -> Tuple[Dict[str, Json], List[Any]]:
+    """Folds a batch of /rasp events by PWID.
+
+    Returns:
+        Tuple[Dict[str, Json], List[Any]]: the last valid event of every PWID,
+            in the order the PWIDs first appear, and the PWID of every event,
+            None for invalid ones.
+    """
+    latest: Dict[str, Json] = {}
+    pwid_ids = []
+    for event in events:
+        parsed = parse_rasp_body(event) if isinstance(event, dict) else None
+        pwid_id = parsed[0] if parsed else None
+        pwid_ids.append(pwid_id)
+        if pwid_id is not None:
+            latest[pwid_id] = event
+    return latest, pwid_ids
+
+
+def rasp_markup(request_id: str) -> Json:
+    """Accept and Decline buttons of a help request alert."""
     inline_keyboard_row_0_buttons = [
         inline_button_with_callback(
             text="Accept",
             callback_command="request",
             callback_value="accept",
+            callback_id=request_id,
         ),
         inline_button_with_callback(
             text="Decline",
             callback_command="request",
             callback_value="reject",
+            callback_id=request_id,
         ),
     ]
-    inline_buttons_markup = [inline_keyboard_row_0_buttons]
-    bot.broadcast(
+    return dict(inline_keyboard=[inline_keyboard_row_0_buttons])
+
+
+def rasp_waves(
+    lat: float,
+    long: float,
+    gender: Union[str, None] = None,
+    language: Union[str, None] = None,
+) -> List[List[int]]:
+    """Chat ids of the alert waves of a help request, reaching further out
+    until every available volunteer is alerted, or a single wave of the
+    nearest volunteers when escalation is off."""
+    if ESCALATION_INTERVAL <= 0:
+        volunteers = select_volunteers(lat, long, gender=gender, language=language)
+        waves = [volunteers] if volunteers else []
+    else:
+        waves = select_volunteer_waves(lat, long, gender=gender, language=language)
+    return [[volunteer.get("chat_id") for volunteer in wave] for wave in waves]
+
+
+async def broadcast_wave(
+    telegram_bot: Bot,
+    request_id: str,
+    message: str,
+    markup: Json,
+    chat_ids: List[int],
+) -> List[Json]:
+    """Alerts a wave of volunteers and records the alerts they received.
+
+    A volunteer may accept while the wave is being sent, before its alerts
+    are recorded and so before they could be retracted. Those alerts are
+    retracted here once the request turns out to be no longer broadcast.
+    """
+    results = await telegram_bot.broadcast(message, chat_ids, markup=markup)
+    recipients = {r["chat_id"]: r["message_id"] for r in results if r.get("message_id")}
+    if not recipients:
+        return results
+    await telegram_bot.offload(help_requests.add_recipients, request_id, recipients)
+    record = await telegram_bot.offload(help_requests.get, request_id)
+    if record and record.get("state") != HelpRequestState.BROADCAST:
+        sent = {str(chat_id): message_id for chat_id, message_id in recipients.items()}
+        retract_broadcast(dict(record, recipients=sent), telegram_bot)
+    return results
+
+
+def escalate(
+    request_id: str, message: str, markup: Json, chat_ids: List[int]
+) -> List[Json]:
+    """Alerts a later wave of volunteers from an escalation worker thread."""
+    return run_sync(broadcast_wave(blocking_bot, request_id, message, markup, chat_ids))
+
+
+def rasp_response(
+    request_id: str,
+    security_image: str,
+    results: List[Json],
+    waves: List[List[int]],
+) -> Json:
+    """Response of /rasp once the first wave of alerts has been sent."""
+    failed = sum(1 for result in results if result.get("error"))
+    logger.info("broadcast to %d volunteers, %d failed", len(results), failed)
+    return generate_response_json(
+        data=dict(
+            request_id=request_id,
+            recipient_count=len(results) - failed,
+            # volunteers alerted later unless someone accepts first
+            escalation_count=sum(len(wave) for wave in waves[1:]),
+            coalesced=False,
+            security_image=dict(name=security_image, url=icon_url(security_image)),
+        )
+    )
+
+
+def coalesced_response(help_request: Json, security_image: str) -> Json:
+    """Response of /rasp for a repeated press folded into an open request."""
+    return generate_response_json(
+        data=dict(
+            request_id=help_request["id"],
+            recipient_count=help_request.get("recipient_count", 0),
+            escalation_count=0,
+            coalesced=True,
+            security_image=dict(name=security_image, url=icon_url(security_image)),
+        )
+    )
+
+
+def rasp_batch_response(pwid_ids: List[Any], responses: Dict[str, Json]) -> Json:
+    """Response of /rasp/batch: the /rasp response of every event, in order.
+    Later events of a PWID in the batch are reported as coalesced."""
+    results = []
+    seen = set()
+    for pwid_id in pwid_ids:
+        if pwid_id is None:
+            RASP_EVENTS.inc("invalid")
+            results.append(
+                generate_response_json(False, dict(error="Invalid Request Body"))
+            )
+            continue
+        response = responses[pwid_id]
+        if pwid_id in seen:
+            RASP_EVENTS.inc("coalesced")
+            response = dict(response, data=dict(response["data"], coalesced=True))
+        seen.add(pwid_id)
+        results.append(response)
+    return generate_response_json(
+        data=dict(results=results, request_count=len(responses))
+    )
+
+
+async def raise_help_request(body: Json, telegram_bot: Bot) -> Json:
+    """Raises the help request of a valid /rasp body and alerts the first
+    wave of volunteers, unless the press is folded into the PWID's open
+    request. Later waves are sent by `escalations`.
+
+    Args:
+        body (Json): /rasp request body, see `parse_rasp_body`.
+        telegram_bot (Bot): bot alerting the first wave.
+    """
+    pwid_id, long, lat = parse_rasp_body(body)  # type: ignore
+    logger.info("id: %s, long: %s, lat: %s", pwid_id, long, lat)
+    # cached by the time a volunteer accepts, see `accepted_request_message`
+    pwid_profiles.prefetch(pwid_id)
+
+    help_request, created = await telegram_bot.offload(
+        help_requests.raise_request,
+        pwid_id,
+        dict(lat=lat, long=long),
+        RASP_COALESCE_WINDOW,
+    )
+    # a press folded in on another worker shows the icon leased by the first
+    security_image: Union[str, None] = help_request.get("security_image")
+    if security_image is None:
+        security_image = await telegram_bot.offload(
+            security_images.allocate, help_request["id"]
+        )
+        await telegram_bot.offload(
+            help_requests.set_security_image, help_request["id"], security_image
+        )
+    if not created:
+        RASP_EVENTS.inc("coalesced")
+        logger.info("press of %s folded into %s", pwid_id, help_request["id"])
+        return coalesced_response(help_request, security_image)
+    RASP_EVENTS.inc("created")
+
+    broadcast_message = Message.BROADCAST_REQUEST.format(
+        f"Long: {long}, Lat {lat}", pwid_id
+    )
+    waves = await telegram_bot.offload(
+        rasp_waves, lat, long, body.get("gender"), body.get("language")
+    )
+    markup = rasp_markup(help_request["id"])
+    results = await broadcast_wave(
+        telegram_bot,
+        help_request["id"],
         broadcast_message,
-        available_volunteers,
-        markup=dict(inline_keyboard=inline_buttons_markup),
+        markup,
+        waves[0] if waves else [],
+    )
+    escalations.schedule(
+        help_request["id"],
+        waves[1:],
+        partial(escalate, help_request["id"], broadcast_message, markup),
     )
-    logger.info(f"id: {pwid_id}, long: {long}, lat: {lat}")
-    return "DUCK", 200
+    return rasp_response(help_request["id"], security_image, results, waves)
+
+
+@app.route("/rasp", methods=["POST"])
+def rasp() -> Tuple[Any, int]:
+    body = request.get_json() if request.is_json else None
+    logger.info("request body: %s", body, extra=BODY)
+
+    if body is None or parse_rasp_body(body) is None:
+        RASP_EVENTS.inc("invalid")
+        return "Invalid Request Body", 400
+    return run_sync(raise_help_request(body, blocking_bot)), 200
+
+
+@app.route("/rasp/batch", methods=["POST"])
+def rasp_batch() -> Tuple[Any, int]:
+    """Raises the help requests of many /rasp events in one call, e.g. from
+    a gateway flushing the presses it buffered while offline.
+
+    Events of one PWID are folded into a single request at the location of
+    the last one.
+
+    Example Request Body:
+        [
+            {"id": "1", "long": 103.85, "lat": 1.29},
+            {"id": "1", "long": 103.86, "lat": 1.29}
+        ]
+    """
+    body = request.get_json() if request.is_json else None
+    logger.info("request body: %s", body, extra=BODY)
+
+    events = parse_rasp_batch(body)
+    if events is None:
+        return "Invalid Request Body", 400
+    if len(events) > RASP_BATCH_MAX:
+        return f"At most {RASP_BATCH_MAX} events per batch", 413
+    latest, pwid_ids = group_rasp_events(events)
+    responses = {
+        pwid_id: run_sync(raise_help_request(event, blocking_bot))
+        for pwid_id, event in latest.items()
+    }
+    return rasp_batch_response(pwid_ids, responses), 200
+
+
+@app.route("/pwids/<pwid_id>/invalidate", methods=["POST"])
+def invalidate_pwid_profile(pwid_id: str) -> Tuple[Any, int]:
+    """Drops this worker's cached profile of a PWID, e.g. after it was
+    changed in Firestore directly."""
+    invalidated = pwid_profiles.invalidate(pwid_id)
+    return generate_response_json(data=dict(id=pwid_id, invalidated=invalidated)), 200
+
+
+def is_admin(token: Union[str, None]) -> bool:
+    """Whether `token`, sent in the X-Admin-Token header, is `ADMIN_TOKEN`."""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def unauthorized() -> Tuple[Json, int]:
+    return generate_response_json(False, "Unauthorized"), 401
+
+
+@app.route("/requests", methods=["GET"])
+def list_help_requests() -> Tuple[Any, int]:
+    """Lists open help requests, oldest first. Requires the admin token, as
+    the requests hold PWID locations and the volunteers alerted.
+
+    Stale requests are expired in the background, see `expire_stale_requests`.
+    """
+    if not is_admin(request.headers.get("X-Admin-Token")):
+        return unauthorized()
+    return open_help_requests(), 200
+
+
+def open_help_requests() -> Json:
+    """Response of /requests."""
+    return generate_response_json(data=help_requests.open_requests())
+
+
+@app.route("/requests/stats", methods=["GET"])
+def help_request_stats() -> Tuple[Any, int]:
+    """Time to accept percentiles of help requests created in the last
+    `window` seconds (default: `HELP_REQUEST_STATS_WINDOW`)."""
+    window = request.args.get("window", type=float)
+    return request_stats(window), 200
+
+
+def request_stats(window: Union[float, None]) -> Json:
+    """Response of /requests/stats for the last `window` seconds."""
+    since = time() - (window or HELP_REQUEST_STATS_WINDOW)
+    return generate_response_json(data=help_requests.stats(since))
+
+
+@app.route("/requests/<request_id>/resolve", methods=["POST"])
+def resolve_help_request_route(request_id: str) -> Tuple[Any, int]:
+    """Resolves an open help request. Requires the admin token."""
+    if not is_admin(request.headers.get("X-Admin-Token")):
+        return unauthorized()
+    return resolve_help_request(request_id)
+
+
+def resolve_help_request(request_id: str) -> Tuple[Json, int]:
+    """Response of /requests/<request_id>/resolve."""
+    record = help_requests.resolve(request_id)
+    if not record:
+        return generate_response_json(False, "Help request is not open"), 409
+    escalations.cancel(request_id)
+    security_images.release(request_id)
+    return generate_response_json(data=record), 200
+
+
+def warm_up() -> None:
+    """Creates this process's clients and caches ahead of the first request.
+
+    gunicorn runs it in every worker once the app is loaded (see
+    `gunicorn.conf.py`), so no request pays for connecting to Firestore,
+    loading the available volunteer index or the first Telegram connection.
+    """
+    started_at = perf_counter()
+    if "firestore" in (VOLUNTEER_BACKEND, HELP_REQUEST_BACKEND, DEDUP_BACKEND):
+        get_db()
+    available()
+    security_images.load()
+    # also expires stale help requests, see `expire_stale_requests`
+    escalations.start()
+    bot.media.load()
+    bot.get_me()
+    if MEDIA_WARMUP_CHAT_ID:
+        threading.Thread(
+            target=warm_up_media, args=(MEDIA_WARMUP_CHAT_ID,), daemon=True
+        ).start()
+    logger.info(
+        "worker %d warmed up in %.2fs", os.getpid(), perf_counter() - started_at
+    )
+
+
+def warm_up_media(chat_id: int) -> int:
+    """Uploads the security images to a chat, so Telegram has their
+    `file_id`s before the first help request is accepted. Photos
+    already uploaded, e.g. before a restart or by another worker, are skipped.
+
+    Args:
+        chat_id (int): chat to upload to, e.g. a private channel.
+
+    Returns:
+        int: number of photos uploaded.
+    """
+    photos = {icon: icon_url(icon) for icon in security_images.icons()}
+    try:
+        uploaded = bot.upload_media(chat_id, photos)
+    except Exception:
+        logger.exception("media warm-up failed")
+        return 0
+    logger.info("uploaded %d of %d photos to %d", uploaded, len(photos), chat_id)
+    return uploaded
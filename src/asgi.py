@@ -0,0 +1,228 @@
+"""ASGI entry point: the routes of `src.app` served from one event loop.
+
+A sync gunicorn worker is held by every request while it waits on Telegram or
+Firestore. Here Telegram is called through `async_bot` and blocking Firestore
+calls run in the default thread pool, so one process keeps hundreds of alerts
+in flight. The handlers and the /rasp flow are the ones of `src.app`, run on
+`async_bot` instead of `blocking_bot`.
+
+Run with e.g.
+    gunicorn -k uvicorn.workers.UvicornWorker src.asgi:app
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Set
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from src.app import (
+    group_rasp_events,
+    is_admin,
+    open_help_requests,
+    parse_rasp_batch,
+    parse_rasp_body,
+    raise_help_request,
+    rasp_batch_response,
+    request_stats,
+    resolve_help_request,
+    unauthorized,
+    update_deduplicator,
+    warm_up,
+)
+from src.config import RASP_BATCH_MAX, WEBHOOK_ACK_FIRST, WEBHOOK_QUEUE_SIZE
+from src.firebase import flush_writes
+from src.log import BODY
+from src.metrics import RASP_EVENTS, REGISTRY
+from src.pwid_profiles import pwid_profiles
+from src.rest import generate_response_json
+from src.telegram.async_bot import async_bot
+from src.telegram.dispatch import build_dispatcher, dispatch_async
+from src.telegram.outbox import outbox
+from src.telegram.update import TelegramBotUpdate
+
+logger = logging.getLogger(__name__)
+
+dispatcher = build_dispatcher(async_bot)
+# updates being handled after their webhook call was acknowledged
+pending_updates: Set["asyncio.Task[Any]"] = set()
+
+
+def respond(body: Any, status: int = 200) -> Response:
+    """Response of a route's body, sent as JSON if it is a dict or a list,
+    like Flask's."""
+    if isinstance(body, (dict, list)):
+        return JSONResponse(body, status)
+    return HTMLResponse(str(body), status)
+
+
+async def get_json(request: Request) -> Any:
+    """The JSON body, or None if the body is not JSON, like Flask's."""
+    if not request.headers.get("content-type", "").startswith("application/json"):
+        return None
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    await asyncio.to_thread(warm_up)
+    await async_bot.get_me()
+    yield
+    if pending_updates:
+        await asyncio.wait(pending_updates, timeout=10)
+    await async_bot.aclose()
+    await asyncio.to_thread(flush_writes)
+
+
+async def process(update: TelegramBotUpdate) -> None:
+    try:
+        await dispatch_async(dispatcher, update)
+    except Exception:
+        logger.exception("failed to process update of type %s", update.type)
+
+
+async def webhook(request: Request) -> Response:
+    """Telegram Bot Webhook Endpoint, see `src.app.webhook`."""
+    body = await get_json(request)
+    logger.info("request body: %s", body, extra=BODY)
+    if not body:
+        return respond("Invalid Request Body", 400)
+
+    update = TelegramBotUpdate(body)
+    if await asyncio.to_thread(update_deduplicator.is_duplicate, update.update_id):
+        return respond("Duplicate update")
+
+    if WEBHOOK_ACK_FIRST:
+        if len(pending_updates) >= WEBHOOK_QUEUE_SIZE:
+            # Telegram redelivers the update later
+            await asyncio.to_thread(update_deduplicator.forget, update.update_id)
+            return respond("Update queue is full", 503)
+        task = asyncio.ensure_future(process(update))
+        pending_updates.add(task)
+        task.add_done_callback(pending_updates.discard)
+        return respond("Accepted")
+
+    try:
+        response = await dispatch_async(dispatcher, update)
+    except Exception:
+        # Telegram redelivers the update after the error response
+        await asyncio.to_thread(update_deduplicator.forget, update.update_id)
+        raise
+    if not response:
+        return respond("No response")
+
+    logger.info("response: %s", response, extra=BODY)
+    return respond(response)
+
+
+async def set_webhook(request: Request) -> Response:
+    webhook_url = f"https://{request.headers.get('host', '')}/webhook"
+    env = os.getenv("FLASK_ENV")
+    if env == "production":
+        await async_bot.set_webhook(webhook_url)
+    return respond(dict(webhook_url=webhook_url, environment=env))
+
+
+async def health(request: Request) -> Response:
+    which = request.query_params.get("which")
+    if which == "telegram":
+        return respond(await async_bot.get_me())
+    if which == "queue":
+        return respond(dict(pending=len(pending_updates), maxsize=WEBHOOK_QUEUE_SIZE))
+    if which == "outbox":
+        return respond(outbox.stats())
+
+    return respond("Hello, Health!")
+
+
+async def metrics(request: Request) -> Response:
+    """Counters and latency histograms in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+async def rasp(request: Request) -> Response:
+    """Broadcasts a help request, see `src.app.rasp`."""
+    body = await get_json(request)
+    logger.info("request body: %s", body, extra=BODY)
+
+    if parse_rasp_body(body) is None:
+        RASP_EVENTS.inc("invalid")
+        return respond("Invalid Request Body", 400)
+    return respond(await raise_help_request(body, async_bot))
+
+
+async def rasp_batch(request: Request) -> Response:
+    """Raises the help requests of many /rasp events, see
+    `src.app.rasp_batch`. The requests of different PWIDs are raised
+    concurrently."""
+    body = await get_json(request)
+    logger.info("request body: %s", body, extra=BODY)
+
+    events = parse_rasp_batch(body)
+    if events is None:
+        return respond("Invalid Request Body", 400)
+    if len(events) > RASP_BATCH_MAX:
+        return respond(f"At most {RASP_BATCH_MAX} events per batch", 413)
+    latest, pwid_ids = group_rasp_events(events)
+    responses = await asyncio.gather(
+        *(raise_help_request(event, async_bot) for event in latest.values())
+    )
+    return respond(rasp_batch_response(pwid_ids, dict(zip(latest, responses))))
+
+
+async def invalidate_pwid_profile(request: Request) -> Response:
+    """See `src.app.invalidate_pwid_profile`."""
+    pwid_id = request.path_params["pwid_id"]
+    invalidated = pwid_profiles.invalidate(pwid_id)
+    return respond(
+        generate_response_json(data=dict(id=pwid_id, invalidated=invalidated))
+    )
+
+
+async def requests(request: Request) -> Response:
+    """See `src.app.list_help_requests`."""
+    if not is_admin(request.headers.get("X-Admin-Token")):
+        return respond(*unauthorized())
+    return respond(await asyncio.to_thread(open_help_requests))
+
+
+async def stats(request: Request) -> Response:
+    """Time to accept percentiles, see `src.app.help_request_stats`."""
+    try:
+        window = float(request.query_params.get("window", ""))
+    except ValueError:
+        window = 0
+    return respond(await asyncio.to_thread(request_stats, window))
+
+
+async def resolve(request: Request) -> Response:
+    """See `src.app.resolve_help_request_route`."""
+    if not is_admin(request.headers.get("X-Admin-Token")):
+        return respond(*unauthorized())
+    request_id = request.path_params["request_id"]
+    return respond(*await asyncio.to_thread(resolve_help_request, request_id))
+
+
+app = Starlette(
+    routes=[
+        Route("/webhook", webhook, methods=["POST"]),
+        Route("/setWebhook", set_webhook),
+        Route("/health", health),
+        Route("/metrics", metrics),
+        Route("/rasp", rasp, methods=["POST"]),
+        Route("/rasp/batch", rasp_batch, methods=["POST"]),
+        Route("/pwids/{pwid_id}/invalidate", invalidate_pwid_profile, methods=["POST"]),
+        Route("/requests", requests),
+        Route("/requests/stats", stats),
+        Route("/requests/{request_id}/resolve", resolve, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
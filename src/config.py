@@ -1,15 +1,93 @@
 import os
+from typing import Union
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-def load_config(config_name: str) -> str:
-    config = os.getenv(config_name)
+def load_config(config_name: str, default: Union[str, None] = None) -> str:
+    config = os.getenv(config_name, default)
     if not config:
         raise Exception(f"{config_name} is not set")
     return config
 
 
-TELEGRAM_BOT_TOKEN = load_config("TELEGRAM_BOT_TOKEN")
+def telegram_bot_token() -> str:
+    """Loads the bot token when it is first needed, so the app can be imported
+    (e.g. by tooling and tests) without it."""
+    return load_config("TELEGRAM_BOT_TOKEN")
+
+
+# e.g. a local Bot API server, or the fake one the benchmarks run
+TELEGRAM_API_URL = load_config("TELEGRAM_API_URL", "https://api.telegram.org")
+# Telegram allows bots roughly 30 messages per second across all chats
+TELEGRAM_GLOBAL_RATE_LIMIT = float(load_config("TELEGRAM_GLOBAL_RATE_LIMIT", "30"))
+# and about one message per second to the same chat, after a short burst
+TELEGRAM_CHAT_RATE_LIMIT = float(load_config("TELEGRAM_CHAT_RATE_LIMIT", "1"))
+TELEGRAM_CHAT_BURST = float(load_config("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_BROADCAST_WORKERS = int(load_config("TELEGRAM_BROADCAST_WORKERS", "16"))
+TELEGRAM_POOL_SIZE = int(load_config("TELEGRAM_POOL_SIZE", "32"))
+TELEGRAM_CONNECT_TIMEOUT = float(load_config("TELEGRAM_CONNECT_TIMEOUT", "3.05"))
+TELEGRAM_READ_TIMEOUT = float(load_config("TELEGRAM_READ_TIMEOUT", "10"))
+TELEGRAM_MAX_RETRIES = int(load_config("TELEGRAM_MAX_RETRIES", "3"))
+RASP_MAX_VOLUNTEERS = int(load_config("RASP_MAX_VOLUNTEERS", "50"))
+RASP_RADIUS_KM = float(load_config("RASP_RADIUS_KM", "5"))
+# repeat /rasp presses of a PWID within this many seconds update the open
+# help request instead of alerting again; 0 treats every press as new
+RASP_COALESCE_WINDOW = float(load_config("RASP_COALESCE_WINDOW", "300"))
+# most events a gateway may post to /rasp/batch at once
+RASP_BATCH_MAX = int(load_config("RASP_BATCH_MAX", "100"))
+# acknowledge webhook updates at once and process them on a worker queue
+WEBHOOK_ACK_FIRST = load_config("WEBHOOK_ACK_FIRST", "0") == "1"
+WEBHOOK_WORKERS = int(load_config("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(load_config("WEBHOOK_QUEUE_SIZE", "1000"))
+# drop redelivered updates; "firestore" also shares seen update ids between workers
+DEDUP_BACKEND = load_config("DEDUP_BACKEND", "local")
+DEDUP_TTL = float(load_config("DEDUP_TTL", "3600"))
+# "firestore", "sqlite" (a local database file) or "memory" (in-process); the
+# local backends only tell their own process of changes, so need one worker
+VOLUNTEER_BACKEND = load_config("VOLUNTEER_BACKEND", "firestore")
+VOLUNTEER_SQLITE_PATH = load_config("VOLUNTEER_SQLITE_PATH", "volunteers.sqlite3")
+# buffer Firestore volunteer updates and commit them in batches
+VOLUNTEER_WRITE_BEHIND = load_config("VOLUNTEER_WRITE_BEHIND", "0") == "1"
+VOLUNTEER_FLUSH_SIZE = int(load_config("VOLUNTEER_FLUSH_SIZE", "100"))
+VOLUNTEER_FLUSH_INTERVAL = float(load_config("VOLUNTEER_FLUSH_INTERVAL", "1"))
+# records are written by a background thread; "category=rate" pairs sample them
+LOG_LEVEL = load_config("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATES = load_config("LOG_SAMPLE_RATES", "body=0.1")
+# log every request, response and update body in full, with personal data
+LOG_FULL_BODIES = load_config("LOG_FULL_BODIES", "0") == "1"
+# alert the best ranked volunteers first, then the next ones every interval
+# seconds until someone accepts; an interval of 0 alerts everybody at once
+ESCALATION_WAVES = [
+    int(size) for size in load_config("ESCALATION_WAVES", "5,15").split(",")
+]
+ESCALATION_INTERVAL = float(load_config("ESCALATION_INTERVAL", "60"))
+# threads sending due waves, so a slow wave holds up neither others nor sweeps
+ESCALATION_WORKERS = int(load_config("ESCALATION_WORKERS", "4"))
+# wave i reaches volunteers within RASP_RADIUS_KM * ESCALATION_RADIUS_GROWTH ** i;
+# the wave after the last size alerts every other available volunteer
+ESCALATION_RADIUS_GROWTH = float(load_config("ESCALATION_RADIUS_GROWTH", "2"))
+# "memory" keeps help requests in-process, e.g. for tests and benchmarks
+HELP_REQUEST_BACKEND = load_config("HELP_REQUEST_BACKEND", "firestore")
+# open help requests older than this many seconds are expired
+HELP_REQUEST_TTL = float(load_config("HELP_REQUEST_TTL", "1800"))
+# /requests/stats reads the newest HELP_REQUEST_STATS_LIMIT requests of the
+# last HELP_REQUEST_STATS_WINDOW seconds (a week) at most
+HELP_REQUEST_STATS_WINDOW = float(load_config("HELP_REQUEST_STATS_WINDOW", "604800"))
+HELP_REQUEST_STATS_LIMIT = int(load_config("HELP_REQUEST_STATS_LIMIT", "10000"))
+# routes exposing help request details (e.g. PWID locations) require this
+# token in their X-Admin-Token header; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# "memory" keeps PWID profiles in-process; cached profiles are reused for
+# PWID_PROFILE_TTL seconds, about as long as a help request stays open; a
+# volunteer who accepts waits at most PWID_PROFILE_TIMEOUT seconds for one
+PWID_PROFILE_BACKEND = load_config("PWID_PROFILE_BACKEND", "firestore")
+PWID_PROFILE_TTL = float(load_config("PWID_PROFILE_TTL", "1800"))
+PWID_PROFILE_CACHE_SIZE = int(load_config("PWID_PROFILE_CACHE_SIZE", "1000"))
+PWID_PROFILE_TIMEOUT = float(load_config("PWID_PROFILE_TIMEOUT", "2"))
+# "memory" forgets the file_ids of sent photos on restart; unless 0, photos
+# are uploaded to the warm-up chat (e.g. a private channel) at startup
+MEDIA_CACHE_BACKEND = load_config("MEDIA_CACHE_BACKEND", "firestore")
+MEDIA_WARMUP_CHAT_ID = int(load_config("MEDIA_WARMUP_CHAT_ID", "0"))
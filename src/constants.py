@@ -12,7 +12,7 @@ class Message:
     )
     ACCEPTED_REQUEST = (
         "Thank you for accepting this request.\n More information will  be provided "
-        "below.\nName: {}\nCaregiver Contact Number: {}\nnLocation: {} \nDisabilities: "
+        "below.\nName: {}\nCaregiver Contact Number: {}\nLocation: {} \nDisabilities: "
         "{}\nPlease show your diagram to the PWID for verification."
     )
     PWID_RESPONSE = (
@@ -22,8 +22,17 @@ class Message:
     BROADCAST_ACCEPTED = (
         "Thank you everyone, this request has been taken and help is already on the way"
     )
+    REQUEST_ALREADY_TAKEN = (
+        "Sorry, this request has already been taken by another volunteer."
+    )
+    REQUEST_DECLINED = "You have declined this request."
     GENDER_REQUEST = (
         "Before lending a hand, please let us know the preferred gender you wish to "
         "help."
     )
     LANGUAGE_POLL_QUESTION = "Please select your preferred language."
+    LOCATION_REQUEST = (
+        "Share your location (or live location) so we can alert you when a PWID "
+        "nearby needs help."
+    )
+    LOCATION_UPDATED = "Thank you, your location has been updated."
@@ -0,0 +1,211 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from src.config import ESCALATION_INTERVAL, ESCALATION_WORKERS, HELP_REQUEST_TTL
+from src.help_requests import HelpRequestState, help_requests
+from src.metrics import ESCALATION_WAVES as ESCALATION_WAVES_SENT
+from src.rest import Json
+from src.security_images import security_images
+
+logger = logging.getLogger(__name__)
+
+SendWave = Callable[[List[int]], Any]
+
+
+def is_broadcast(request_id: str) -> bool:
+    """Whether nobody has accepted a help request yet."""
+    record = help_requests.get(request_id)
+    return record is not None and record.get("state") == HelpRequestState.BROADCAST
+
+
+def expire_stale_requests(max_age: float = HELP_REQUEST_TTL) -> List[Json]:
+    """Expires the help requests open for more than `max_age` seconds and
+    drops their waves and security images."""
+    expired = help_requests.expire_stale(max_age)
+    for record in expired:
+        escalations.cancel(record["id"])
+        security_images.release(record["id"])
+    if expired:
+        logger.info("expired %d stale help requests", len(expired))
+    return expired
+
+
+class EscalationScheduler:
+    def __init__(
+        self,
+        interval: float = ESCALATION_INTERVAL,
+        is_open: Callable[[str], bool] = is_broadcast,
+        sweep: Union[Callable[[], Any], None] = None,
+        sweep_interval: float = 60.0,
+        workers: int = ESCALATION_WORKERS,
+    ) -> None:
+        """Sends the later alert waves of help requests until one is accepted.
+
+        Due waves are kept in a heap ordered by due time. A timer thread
+        sleeps until the earliest one and hands it to a pool of `workers`
+        threads, which send it. `cancel` drops the waves of a request at once;
+        heap entries of cancelled requests are skipped. As a request can be
+        claimed through another worker, `is_open` is also checked before
+        every wave.
+
+        The pool also calls `sweep` every `sweep_interval` seconds, e.g. to
+        expire requests nobody accepted.
+
+        The timer is started lazily on the first `schedule` in each process,
+        or by `start`, so the scheduler can be created at import time before
+        gunicorn forks.
+
+        Args:
+            interval (float, optional): seconds between waves. Defaults to
+                `ESCALATION_INTERVAL`.
+            is_open (Callable[[str], bool], optional): whether a request still
+                waits for a volunteer. Defaults to `is_broadcast`.
+            sweep (Callable[[], Any], optional): periodic job. Defaults to
+                None.
+            sweep_interval (float, optional): seconds between sweeps.
+                Defaults to 60.0.
+            workers (int, optional): threads sending waves. Defaults to
+                `ESCALATION_WORKERS`.
+        """
+        self.interval = interval
+        self.is_open = is_open
+        self.sweep = sweep
+        self.sweep_interval = sweep_interval
+        self.workers = workers
+        self._swept_at = 0.0
+        # due waves as (due_at, sequence, request_id); stale entries are skipped
+        self._due: List[Tuple[float, int, str]] = []
+        self._escalations: Dict[str, Tuple[int, List[List[int]], SendWave]] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Union[threading.Thread, None] = None
+        self._executor: Union[ThreadPoolExecutor, None] = None
+        self._pid: Union[int, None] = None
+
+    def __len__(self) -> int:
+        return len(self._escalations)
+
+    def start(self) -> None:
+        """Starts the timer unless it already runs in this process."""
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid == os.getpid():
+                return
+            # escalations inherited through fork() are the parent's to send
+            self._due = []
+            self._escalations = {}
+            self._swept_at = monotonic()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="escalation"
+            )
+            self._thread = threading.Thread(
+                target=self._run, name="escalation-timer", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def schedule(self, request_id: str, waves: List[List[int]], send: SendWave) -> None:
+        """Sends `waves` one every `interval` seconds, the first one an
+        interval from now, until the request is cancelled.
+
+        Args:
+            request_id (str): help request id.
+            waves (List[List[int]]): chat ids of every later wave, in order.
+            send (SendWave): sends the alert to the chat ids of a wave.
+        """
+        waves = [wave for wave in waves if wave]
+        if not waves:
+            return
+        self.start()
+        with self._condition:
+            self._push(request_id, waves, send)
+            self._condition.notify()
+
+    def _push(self, request_id: str, waves: List[List[int]], send: SendWave) -> None:
+        sequence = next(self._sequence)
+        self._escalations[request_id] = (sequence, waves, send)
+        heapq.heappush(self._due, (monotonic() + self.interval, sequence, request_id))
+
+    def cancel(self, request_id: str) -> bool:
+        """Drops the waves not yet sent of a help request.
+
+        Returns:
+            bool: whether any wave was still pending.
+        """
+        with self._condition:
+            escalation = self._escalations.pop(request_id, None)
+        if escalation is None:
+            return False
+        ESCALATION_WAVES_SENT.inc("cancelled", amount=len(escalation[1]))
+        return True
+
+    def _pop_due(self) -> Union[Tuple[str, List[int], SendWave], None]:
+        """Waits for the next due wave and takes it off the schedule.
+
+        Returns:
+            Union[Tuple[str, List[int], SendWave], None]: the wave, or None
+                if a sweep is due first.
+        """
+        with self._condition:
+            while True:
+                wait: Union[float, None] = None
+                if self.sweep is not None:
+                    wait = self._swept_at + self.sweep_interval - monotonic()
+                    if wait <= 0:
+                        self._swept_at = monotonic()
+                        return None
+                if not self._due:
+                    self._condition.wait(wait)
+                    continue
+                due_at, sequence, request_id = self._due[0]
+                if due_at > monotonic():
+                    due_wait = due_at - monotonic()
+                    self._condition.wait(
+                        due_wait if wait is None else min(wait, due_wait)
+                    )
+                    continue
+                heapq.heappop(self._due)
+                escalation = self._escalations.get(request_id)
+                if escalation is None or escalation[0] != sequence:
+                    continue
+                _, waves, send = self._escalations.pop(request_id)
+                if len(waves) > 1:
+                    self._push(request_id, waves[1:], send)
+                return request_id, waves[0], send
+
+    def _run(self) -> None:
+        executor: ThreadPoolExecutor = self._executor  # type: ignore
+        while True:
+            due = self._pop_due()
+            if due is None:
+                executor.submit(self._sweep)
+            else:
+                executor.submit(self._send, *due)
+
+    def _sweep(self) -> None:
+        try:
+            self.sweep()  # type: ignore
+        except Exception:
+            logger.exception("sweep failed")
+
+    def _send(self, request_id: str, wave: List[int], send: SendWave) -> None:
+        try:
+            if not self.is_open(request_id):
+                self.cancel(request_id)
+                ESCALATION_WAVES_SENT.inc("cancelled")
+                return
+            send(wave)
+            ESCALATION_WAVES_SENT.inc("sent")
+            logger.info("escalated %s to %d more volunteers", request_id, len(wave))
+        except Exception:
+            logger.exception("escalating %s failed", request_id)
+
+
+escalations = EscalationScheduler(sweep=expire_stale_requests)
@@ -1,33 +1,163 @@
+import atexit
+import os
+import threading
 from pathlib import Path
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Union
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.cloud.firestore import Client
+from src.config import (
+    ESCALATION_RADIUS_GROWTH,
+    ESCALATION_WAVES,
+    RASP_MAX_VOLUNTEERS,
+    RASP_RADIUS_KM,
+    VOLUNTEER_BACKEND,
+    VOLUNTEER_FLUSH_INTERVAL,
+    VOLUNTEER_FLUSH_SIZE,
+    VOLUNTEER_SQLITE_PATH,
+    VOLUNTEER_WRITE_BEHIND,
+)
+from src.metrics import FIRESTORE_LATENCY
+from src.rest import Json
+from src.volunteer_index import AvailableVolunteerIndex
+from src.volunteer_repository import (
+    FirestoreVolunteerRepository,
+    InMemoryVolunteerRepository,
+    SQLiteVolunteerRepository,
+    VolunteerRepository,
+    WriteBehindVolunteerRepository,
+)
 
-cred = credentials.Certificate(
-    Path(__file__).parent.joinpath(
-        "fleshid-dc8ed-firebase-adminsdk-cvknm-51a90eaf75.json"
-    )
+if TYPE_CHECKING:
+    from google.cloud.firestore import Client
+
+CREDENTIAL_PATH = Path(__file__).parent.joinpath(
+    "fleshid-dc8ed-firebase-adminsdk-cvknm-51a90eaf75.json"
 )
 
-firebase_admin.initialize_app(cred)
-db: Client = firestore.client()
+_client: Union["Client", None] = None
+_client_lock = threading.Lock()
+
+
+def _reset_client() -> None:
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+# gRPC channels do not survive fork(), so a forked worker makes its own client
+os.register_at_fork(after_in_child=_reset_client)
+
+
+def get_db() -> "Client":
+    """Returns this process's Firestore client, creating it on first use.
+
+    Importing the app neither loads the Firebase SDK nor connects to
+    Firestore; the first caller in each process does.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+                app = firebase_admin.initialize_app(
+                    credentials.Certificate(CREDENTIAL_PATH),
+                    name=f"pwid-{os.getpid()}",
+                )
+                _client = firestore.client(app)
+    return _client
+
+
+class LazyClient:
+    """Stand-in for the Firestore client that resolves `get_db()` on every
+    attribute access."""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_db(), name)
+
+
+db: "Client" = LazyClient()  # type: ignore
+
+volunteers: VolunteerRepository
+if VOLUNTEER_BACKEND == "sqlite":
+    volunteers = SQLiteVolunteerRepository(VOLUNTEER_SQLITE_PATH)
+elif VOLUNTEER_BACKEND == "memory":
+    volunteers = InMemoryVolunteerRepository()
+elif VOLUNTEER_WRITE_BEHIND:
+    volunteers = WriteBehindVolunteerRepository(
+        db, flush_size=VOLUNTEER_FLUSH_SIZE, flush_interval=VOLUNTEER_FLUSH_INTERVAL
+    )
+else:
+    volunteers = FirestoreVolunteerRepository(db)
+
+
+def flush_writes() -> None:
+    """Writes buffered volunteer updates before the process exits.
+
+    Registered with `atexit` and also called by gunicorn's `worker_exit` hook.
+    """
+    if isinstance(volunteers, WriteBehindVolunteerRepository):
+        volunteers.buffer.close(timeout=5)
 
 
+atexit.register(flush_writes)
+
+available_index = AvailableVolunteerIndex()
+
+
+@FIRESTORE_LATENCY.timed("available")
 def available() -> Dict[str, Any]:
-    collection_ref = db.collection("users")
-    docs = collection_ref.get()
-    result = {d.get("username"): d.to_dict() for d in docs if d.get("available")}
-    return result
+    """Returns available volunteers keyed by username.
+
+    Served from `available_index`, which is filled and starts listening for
+    changes on the first call.
+    """
+    available_index.start(volunteers.available_query)
+    return available_index.volunteers()
 
 
+@FIRESTORE_LATENCY.timed("select_volunteers")
+def select_volunteers(
+    lat: float,
+    long: float,
+    gender: Union[str, None] = None,
+    language: Union[str, None] = None,
+    k: int = RASP_MAX_VOLUNTEERS,
+    radius_km: float = RASP_RADIUS_KM,
+) -> List[Json]:
+    """Returns available volunteers ranked for a PWID's location and needs.
+
+    See `AvailableVolunteerIndex.select`.
+    """
+    available_index.start(volunteers.available_query)
+    return available_index.select(lat, long, k, radius_km, gender, language)
+
+
+@FIRESTORE_LATENCY.timed("select_volunteer_waves")
+def select_volunteer_waves(
+    lat: float,
+    long: float,
+    gender: Union[str, None] = None,
+    language: Union[str, None] = None,
+    sizes: List[int] = ESCALATION_WAVES,
+    radius_km: float = RASP_RADIUS_KM,
+    growth: float = ESCALATION_RADIUS_GROWTH,
+) -> List[List[Json]]:
+    """Returns available volunteers ranked into alert waves reaching further
+    out, the last one taking everybody left.
+
+    See `AvailableVolunteerIndex.select_waves`.
+    """
+    available_index.start(volunteers.available_query)
+    return available_index.select_waves(
+        lat, long, sizes, radius_km, growth, gender, language
+    )
+
+
+@FIRESTORE_LATENCY.timed("change_available")
 def change_available(username: str) -> None:
-    doc_ref = db.collection("users").document(username)
-    doc_data = doc_ref.get().to_dict()
-
-    my_field = doc_data["available"]
-    if my_field:
-        doc_ref.update({"available": False})
-    else:
-        doc_ref.update({"available": True})
+    doc_data = volunteers.get(username)
+
+    fields = {"available": not doc_data["available"]}  # type: ignore
+    volunteers.update(username, fields)
+    available_index.update(username, fields)
@@ -0,0 +1,120 @@
+import heapq
+from collections import defaultdict
+from math import asin, cos, floor, radians, sin, sqrt
+from typing import Callable, Dict, Iterator, List, Set, Tuple, Union
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+Cell = Tuple[int, int]
+
+
+def haversine_km(lat1: float, long1: float, lat2: float, long2: float) -> float:
+    """Great-circle distance between two points in kilometres."""
+    d_lat = radians(lat2 - lat1)
+    d_long = radians(long2 - long1)
+    a = (
+        sin(d_lat / 2) ** 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(d_long / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+class GeoIndex:
+    def __init__(self, cell_degrees: float = 0.01) -> None:
+        """Grid bucket index answering nearest-neighbour queries.
+
+        Points are bucketed into `cell_degrees` sized lat/long cells. A query
+        scans rings of cells outwards from the query point and stops as soon
+        as no unscanned cell can hold a closer point, so its cost depends on
+        the density around the point rather than on the size of the index.
+
+        Args:
+            cell_degrees (float, optional): cell size in degrees. Defaults to
+                0.01 (about 1.1 km).
+        """
+        self.cell_degrees = cell_degrees
+        self._cells: Dict[Cell, Set[str]] = defaultdict(set)
+        self._points: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._points
+
+    def _cell(self, lat: float, long: float) -> Cell:
+        return floor(lat / self.cell_degrees), floor(long / self.cell_degrees)
+
+    def add(self, key: str, lat: float, long: float) -> None:
+        self.remove(key)
+        self._points[key] = (lat, long)
+        self._cells[self._cell(lat, long)].add(key)
+
+    def remove(self, key: str) -> None:
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        bucket = self._cells[cell]
+        bucket.discard(key)
+        if not bucket:
+            del self._cells[cell]
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._points.clear()
+
+    def _ring(self, center: Cell, ring: int) -> Iterator[Cell]:
+        i, j = center
+        if ring == 0:
+            yield center
+            return
+        for dj in range(-ring, ring + 1):
+            yield i - ring, j + dj
+            yield i + ring, j + dj
+        for di in range(-ring + 1, ring):
+            yield i + di, j - ring
+            yield i + di, j + ring
+
+    def nearest(
+        self,
+        lat: float,
+        long: float,
+        k: int,
+        radius_km: float,
+        predicate: Union[Callable[[str], bool], None] = None,
+    ) -> List[Tuple[float, str]]:
+        """Finds the `k` nearest points within `radius_km`.
+
+        Args:
+            lat (float): latitude of the query point.
+            long (float): longitude of the query point.
+            k (int): maximum number of points to return.
+            radius_km (float): maximum distance in kilometres.
+            predicate (Callable[[str], bool], optional): only keys for which
+                it returns True are considered. Defaults to None.
+
+        Returns:
+            List[Tuple[float, str]]: (distance in km, key) pairs, closest first.
+        """
+        if k <= 0 or not self._points:
+            return []
+        # the narrowest side of a cell bounds how far away unscanned rings are
+        cell_km = self.cell_degrees * KM_PER_DEGREE * max(cos(radians(lat)), 0.01)
+        max_ring = int(radius_km / cell_km) + 1
+        center = self._cell(lat, long)
+        found: List[Tuple[float, str]] = []
+        for ring in range(max_ring + 1):
+            for cell in self._ring(center, ring):
+                for key in self._cells.get(cell, ()):
+                    if predicate is not None and not predicate(key):
+                        continue
+                    distance = haversine_km(lat, long, *self._points[key])
+                    if distance <= radius_km:
+                        found.append((distance, key))
+            if len(found) >= k:
+                best = heapq.nsmallest(k, found)
+                if best[-1][0] <= ring * cell_km:
+                    return best
+        return heapq.nsmallest(k, found)
@@ -0,0 +1,485 @@
+import bisect
+import secrets
+import threading
+from abc import ABC, abstractmethod
+from enum import StrEnum
+from time import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Set,
+    Tuple,
+    Union,
+)
+
+from src.config import HELP_REQUEST_BACKEND, HELP_REQUEST_STATS_LIMIT
+from src.firebase import db
+from src.metrics import FIRESTORE_LATENCY
+from src.rest import Json
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import Client, CollectionReference, Transaction
+
+
+class HelpRequestState(StrEnum):
+    BROADCAST = "broadcast"
+    CLAIMED = "claimed"
+    RESOLVED = "resolved"
+    EXPIRED = "expired"
+
+
+OPEN_STATES = frozenset([HelpRequestState.BROADCAST, HelpRequestState.CLAIMED])
+# states a request may move to a given state from
+TRANSITIONS: Dict[HelpRequestState, FrozenSet[HelpRequestState]] = {
+    HelpRequestState.CLAIMED: frozenset([HelpRequestState.BROADCAST]),
+    HelpRequestState.RESOLVED: OPEN_STATES,
+    HelpRequestState.EXPIRED: OPEN_STATES,
+}
+
+
+def new_request_id() -> str:
+    """Returns a short id that fits into a button's 64 byte callback_data."""
+    return secrets.token_urlsafe(6)
+
+
+def now() -> float:
+    return round(time(), 3)
+
+
+def percentile(sorted_values: List[float], p: float) -> Union[float, None]:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# locks serialising the requests raised by one PWID, picked by hash
+RAISE_LOCK_STRIPES = 64
+
+
+class HelpRequestStore(ABC):
+    """Stores the help requests raised by `/rasp` and their lifecycle.
+
+    A request is broadcast to volunteers, claimed by the first one to accept
+    and finally resolved, or it expires. The time of every transition is kept
+    as `<state>_at`.
+
+    Example record:
+        {
+            "id": "q1W2e3R4",
+            "pwid_id": "1",
+            "location": {"lat": 1.29, "long": 103.85},
+            "state": "claimed",
+            "created_at": 1679475161.123,
+            "broadcast_at": 1679475161.123,
+            "claimed_at": 1679475170.456,
+            "resolved_at": None,
+            "expired_at": None,
+            "time_to_accept": 9.333,
+            "repeat_count": 2,
+            "location_updated_at": 1679475165.789,
+            "recipient_count": 1,
+            "recipients": {"123456789": 42},
+            "claimed_by": "johndoe",
+            "claimed_chat_id": 123456789,
+            "security_image": "SMILE"
+        }
+
+    `recipients` maps each alerted chat id (as a string) to the message id of
+    the alert it received. `repeat_count` counts the later presses folded into
+    the request by `raise_request`. `security_image` is the icon leased to the
+    request, kept here so every worker shows the same one.
+    """
+
+    def __init__(self) -> None:
+        self._raise_locks = [threading.Lock() for _ in range(RAISE_LOCK_STRIPES)]
+
+    @abstractmethod
+    def create(self, pwid_id: str, location: Json) -> Json:
+        """Creates a broadcast help request and returns its record."""
+
+    @abstractmethod
+    def get(self, request_id: str) -> Union[Json, None]:
+        """Returns the record of a request, or None if there is none."""
+
+    @abstractmethod
+    def find_open(self, pwid_id: str, since: float = 0) -> Union[Json, None]:
+        """Returns the newest open request of a PWID created since `since`."""
+
+    @abstractmethod
+    def update_location(self, request_id: str, location: Json) -> Union[Json, None]:
+        """Moves an open request to a new location and counts the repeat.
+
+        Returns:
+            Union[Json, None]: the updated record, or None if the request does
+                not exist or is no longer open.
+        """
+
+    def raise_request(
+        self, pwid_id: str, location: Json, window: float = 0
+    ) -> Tuple[Json, bool]:
+        """Creates a help request, unless the PWID raised one in the last
+        `window` seconds that is still open. That one is moved to `location`
+        instead, so a repeated press or a retried call doesn't alert the
+        volunteers again.
+
+        Presses of one PWID are serialised within the process, so concurrent
+        retries create a single request.
+
+        Args:
+            pwid_id (str): PWID raising the request.
+            location (Json): {"lat": float, "long": float}.
+            window (float, optional): seconds repeats are folded in. Defaults
+                to 0, always creating a request.
+
+        Returns:
+            Tuple[Json, bool]: the record and whether it was created.
+        """
+        if window <= 0:
+            return self.create(pwid_id, location), True
+        with self._raise_locks[hash(pwid_id) % RAISE_LOCK_STRIPES]:
+            record = self.find_open(pwid_id, time() - window)
+            if record is not None:
+                updated = self.update_location(record["id"], location)
+                if updated is not None:
+                    return updated, False
+            return self.create(pwid_id, location), True
+
+    @abstractmethod
+    def add_recipients(self, request_id: str, recipients: Dict[int, int]) -> None:
+        """Records the alert message id sent to each chat id."""
+
+    @abstractmethod
+    def set_security_image(self, request_id: str, icon: str) -> None:
+        """Records the icon leased to a request."""
+
+    @abstractmethod
+    def open_requests(self) -> List[Json]:
+        """Returns broadcast and claimed requests, oldest first."""
+
+    @abstractmethod
+    def times_to_accept(
+        self, since: float = 0, limit: int = HELP_REQUEST_STATS_LIMIT
+    ) -> List[float]:
+        """Returns the sorted times to accept of the newest `limit` requests
+        created since `since`."""
+
+    @abstractmethod
+    def _transition(
+        self, request_id: str, state: HelpRequestState, fields: Json
+    ) -> Union[Json, None]:
+        """Atomically moves a request to `state` if `TRANSITIONS` allow it.
+
+        Returns:
+            Union[Json, None]: the updated record, or None if the request does
+                not exist or cannot move to `state`.
+        """
+
+    def claim(self, request_id: str, username: str, chat_id: int) -> Union[Json, None]:
+        """Atomically claims a broadcast help request for a volunteer.
+
+        Returns:
+            Union[Json, None]: the claimed record, or None if the request does
+                not exist or was already claimed by someone else.
+        """
+        return self._transition(
+            request_id,
+            HelpRequestState.CLAIMED,
+            dict(claimed_by=username, claimed_chat_id=chat_id),
+        )
+
+    def resolve(self, request_id: str) -> Union[Json, None]:
+        return self._transition(request_id, HelpRequestState.RESOLVED, {})
+
+    def expire(self, request_id: str) -> Union[Json, None]:
+        return self._transition(request_id, HelpRequestState.EXPIRED, {})
+
+    def expire_stale(self, max_age: float) -> List[Json]:
+        """Expires open requests created more than `max_age` seconds ago."""
+        cutoff = time() - max_age
+        expired = []
+        for request in self.open_requests():
+            if request["created_at"] < cutoff:
+                record = self.expire(request["id"])
+                if record:
+                    expired.append(record)
+        return expired
+
+    def stats(self, since: float = 0) -> Json:
+        """Time to accept percentiles, in seconds, of requests created since
+        `since`."""
+        times = self.times_to_accept(since)
+        return dict(
+            accepted=len(times),
+            open=len(self.open_requests()),
+            time_to_accept=dict(
+                p50=percentile(times, 50),
+                p90=percentile(times, 90),
+                p99=percentile(times, 99),
+                max=times[-1] if times else None,
+            ),
+        )
+
+    @staticmethod
+    def _new_record(pwid_id: str, location: Json) -> Json:
+        created_at = now()
+        return dict(
+            id=new_request_id(),
+            pwid_id=pwid_id,
+            location=location,
+            state=HelpRequestState.BROADCAST.value,
+            created_at=created_at,
+            broadcast_at=created_at,
+            claimed_at=None,
+            resolved_at=None,
+            expired_at=None,
+            time_to_accept=None,
+            repeat_count=0,
+            location_updated_at=None,
+            recipient_count=0,
+            recipients={},
+            claimed_by=None,
+            claimed_chat_id=None,
+            security_image=None,
+        )
+
+    @staticmethod
+    def _location_fields(location: Json) -> Json:
+        return dict(location=location, location_updated_at=now())
+
+    @staticmethod
+    def _transition_fields(record: Json, state: HelpRequestState, fields: Json) -> Json:
+        at = now()
+        fields = dict(fields, state=state.value)
+        fields[f"{state.value}_at"] = at
+        if state == HelpRequestState.CLAIMED:
+            fields["time_to_accept"] = round(at - record["created_at"], 3)
+        return fields
+
+    @staticmethod
+    def _can_transition(record: Union[Json, None], state: HelpRequestState) -> bool:
+        return bool(record) and record["state"] in TRANSITIONS[state]  # type: ignore
+
+
+class InMemoryHelpRequestStore(HelpRequestStore):
+    def __init__(self) -> None:
+        """Process-local store, a stand-in for Firestore in tests.
+
+        Open request ids and sorted times to accept are indexed, so neither
+        query scans finished requests.
+        """
+        super().__init__()
+        self._requests: Dict[str, Json] = {}
+        self._open: Set[str] = set()
+        # (created_at, time_to_accept) sorted by creation time
+        self._accepted: List[Any] = []
+        self._lock = threading.Lock()
+
+    def create(self, pwid_id: str, location: Json) -> Json:
+        record = self._new_record(pwid_id, location)
+        with self._lock:
+            self._requests[record["id"]] = record
+            self._open.add(record["id"])
+        return dict(record)
+
+    def get(self, request_id: str) -> Union[Json, None]:
+        with self._lock:
+            record = self._requests.get(request_id)
+            return dict(record) if record else None
+
+    def find_open(self, pwid_id: str, since: float = 0) -> Union[Json, None]:
+        with self._lock:
+            records = [
+                self._requests[i]
+                for i in self._open
+                if self._requests[i]["pwid_id"] == pwid_id
+                and self._requests[i]["created_at"] >= since
+            ]
+            if not records:
+                return None
+            return dict(max(records, key=lambda record: record["created_at"]))
+
+    def update_location(self, request_id: str, location: Json) -> Union[Json, None]:
+        with self._lock:
+            if request_id not in self._open:
+                return None
+            record = self._requests[request_id]
+            record.update(self._location_fields(location))
+            record["repeat_count"] += 1
+            return dict(record)
+
+    def add_recipients(self, request_id: str, recipients: Dict[int, int]) -> None:
+        with self._lock:
+            record = self._requests[request_id]
+            record["recipients"] = {
+                **record["recipients"],
+                **{str(k): v for k, v in recipients.items()},
+            }
+            record["recipient_count"] = len(record["recipients"])
+
+    def set_security_image(self, request_id: str, icon: str) -> None:
+        with self._lock:
+            self._requests[request_id]["security_image"] = icon
+
+    def open_requests(self) -> List[Json]:
+        with self._lock:
+            records = [dict(self._requests[i]) for i in self._open]
+        return sorted(records, key=lambda record: record["created_at"])
+
+    def times_to_accept(
+        self, since: float = 0, limit: int = HELP_REQUEST_STATS_LIMIT
+    ) -> List[float]:
+        with self._lock:
+            start = max(
+                bisect.bisect_left(self._accepted, (since,)),
+                len(self._accepted) - limit,
+            )
+            return sorted(t for _, t in self._accepted[start:])
+
+    def _transition(
+        self, request_id: str, state: HelpRequestState, fields: Json
+    ) -> Union[Json, None]:
+        with self._lock:
+            if not self._can_transition(self._requests.get(request_id), state):
+                return None
+            record = self._requests[request_id]
+            record.update(self._transition_fields(record, state, fields))
+            if state not in OPEN_STATES:
+                self._open.discard(request_id)
+            if state == HelpRequestState.CLAIMED:
+                bisect.insort(
+                    self._accepted, (record["created_at"], record["time_to_accept"])
+                )
+            return dict(record)
+
+
+class FirestoreHelpRequestStore(HelpRequestStore):
+    def __init__(self, client: "Client", collection: str = "help_requests") -> None:
+        """Help requests stored in a Firestore collection.
+
+        Transitions run in a transaction, so only one volunteer can claim a
+        request even when several tap Accept at the same moment on different
+        workers. Queries filter on the indexed `state` and `created_at`
+        fields and only read the fields they need.
+        """
+        super().__init__()
+        self.client = client
+        self.collection_name = collection
+
+    @property
+    def collection(self) -> "CollectionReference":
+        return self.client.collection(self.collection_name)
+
+    @FIRESTORE_LATENCY.timed("help_requests.create")
+    def create(self, pwid_id: str, location: Json) -> Json:
+        record = self._new_record(pwid_id, location)
+        self.collection.document(record["id"]).set(record)
+        return record
+
+    @FIRESTORE_LATENCY.timed("help_requests.get")
+    def get(self, request_id: str) -> Union[Json, None]:
+        return self.collection.document(request_id).get().to_dict()
+
+    @FIRESTORE_LATENCY.timed("help_requests.find_open")
+    def find_open(self, pwid_id: str, since: float = 0) -> Union[Json, None]:
+        # one PWID has few requests, so state and age are filtered here
+        # rather than in a query needing a composite index
+        docs = self.collection.where("pwid_id", "==", pwid_id).stream()
+        records = [
+            record
+            for record in (doc.to_dict() for doc in docs)
+            if record is not None
+            and record["state"] in OPEN_STATES
+            and record["created_at"] >= since
+        ]
+        if not records:
+            return None
+        return max(records, key=lambda record: record["created_at"])
+
+    @FIRESTORE_LATENCY.timed("help_requests.update_location")
+    def update_location(self, request_id: str, location: Json) -> Union[Json, None]:
+        from google.cloud.firestore import transactional
+
+        doc_ref = self.collection.document(request_id)
+
+        @transactional
+        def update_in_transaction(transaction: "Transaction") -> Any:
+            record = doc_ref.get(transaction=transaction).to_dict()
+            if not record or record["state"] not in OPEN_STATES:
+                return None
+            updates = self._location_fields(location)
+            updates["repeat_count"] = record.get("repeat_count", 0) + 1
+            transaction.update(doc_ref, updates)
+            return {**record, **updates}
+
+        return update_in_transaction(self.client.transaction())
+
+    @FIRESTORE_LATENCY.timed("help_requests.update")
+    def add_recipients(self, request_id: str, recipients: Dict[int, int]) -> None:
+        from google.cloud.firestore import Increment
+
+        if not recipients:
+            return
+        fields: Json = {f"recipients.`{k}`": v for k, v in recipients.items()}
+        fields["recipient_count"] = Increment(len(recipients))
+        self.collection.document(request_id).update(fields)
+
+    @FIRESTORE_LATENCY.timed("help_requests.update")
+    def set_security_image(self, request_id: str, icon: str) -> None:
+        self.collection.document(request_id).update(dict(security_image=icon))
+
+    def _query_states(self, states: Iterable[str]) -> List[Json]:
+        docs = self.collection.where("state", "in", list(states)).stream()
+        records = [record for record in (doc.to_dict() for doc in docs) if record]
+        return sorted(records, key=lambda record: record["created_at"])
+
+    @FIRESTORE_LATENCY.timed("help_requests.open")
+    def open_requests(self) -> List[Json]:
+        return self._query_states(state.value for state in OPEN_STATES)
+
+    @FIRESTORE_LATENCY.timed("help_requests.times_to_accept")
+    def times_to_accept(
+        self, since: float = 0, limit: int = HELP_REQUEST_STATS_LIMIT
+    ) -> List[float]:
+        from google.cloud.firestore import Query
+
+        docs = (
+            self.collection.where("created_at", ">=", since)
+            .order_by("created_at", direction=Query.DESCENDING)
+            .limit(limit)
+            .select(["time_to_accept"])
+            .stream()
+        )
+        times = ((doc.to_dict() or {}).get("time_to_accept") for doc in docs)
+        return sorted(t for t in times if t is not None)
+
+    @FIRESTORE_LATENCY.timed("help_requests.transition")
+    def _transition(
+        self, request_id: str, state: HelpRequestState, fields: Json
+    ) -> Union[Json, None]:
+        from google.cloud.firestore import transactional
+
+        doc_ref = self.collection.document(request_id)
+
+        @transactional
+        def transition_in_transaction(transaction: "Transaction") -> Any:
+            record = doc_ref.get(transaction=transaction).to_dict()
+            if not self._can_transition(record, state):
+                return None
+            updates = self._transition_fields(record, state, fields)  # type: ignore
+            transaction.update(doc_ref, updates)
+            return {**record, **updates}  # type: ignore
+
+        return transition_in_transaction(self.client.transaction())
+
+
+help_requests: HelpRequestStore = (
+    InMemoryHelpRequestStore()
+    if HELP_REQUEST_BACKEND == "memory"
+    else FirestoreHelpRequestStore(db)
+)
@@ -0,0 +1,172 @@
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Union
+
+from src.config import LOG_FULL_BODIES, LOG_LEVEL, LOG_SAMPLE_RATES
+
+LOG_FORMAT = "%(levelname)-8s :: (%(name)s) %(message)s"
+
+# `extra` of records that log request, response or update bodies
+BODY = dict(category="body")
+
+# values of these keys identify a person
+PII_KEYS = {"username", "first_name", "last_name", "phone_number", "chat_id"}
+# the `id` of these objects is a user's chat id
+PII_OBJECTS = {"chat", "from", "user"}
+
+
+def pseudonym(value: Any) -> str:
+    """Replaces a value with a short stable hash, so the records of one person
+    can still be correlated."""
+    return "~" + hashlib.sha1(str(value).encode()).hexdigest()[:8]
+
+
+def redact(value: Any, key: Union[str, None] = None) -> Any:
+    """Returns a copy of a JSON-like value with personal data pseudonymized.
+
+    Args:
+        value (Any): value to redact.
+        key (Union[str, None], optional): key of the value in its parent.
+
+    Returns:
+        Any: the redacted copy.
+    """
+    if isinstance(value, dict):
+        return {
+            k: (
+                pseudonym(v)
+                if k in PII_KEYS or (k == "id" and key in PII_OBJECTS)
+                else redact(v, k)
+            )
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(v, key) for v in value]
+    return value
+
+
+def parse_sample_rates(config: str) -> Dict[str, float]:
+    """Parses `category=rate` pairs, e.g. "body=0.1,src.telegram=0.5"."""
+    rates = {}
+    for pair in filter(None, config.split(",")):
+        category, _, rate = pair.partition("=")
+        rates[category.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: Dict[str, float]) -> None:
+        """Keeps a random share of the records of each category.
+
+        A record's category is its `category` extra, else its logger name.
+        Warnings and errors are always kept.
+
+        Args:
+            rates (Dict[str, float]): share of records kept per category.
+                Categories without a rate are kept in full.
+        """
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        category = getattr(record, "category", record.name)
+        rate = self.rates.get(category, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Pseudonymizes personal data in the arguments of a record."""
+        if isinstance(record.args, dict):
+            record.args = redact(record.args)
+        elif record.args:
+            record.args = tuple(redact(arg) for arg in record.args)
+        return True
+
+
+class BackgroundQueueHandler(QueueHandler):
+    def __init__(self, *handlers: logging.Handler) -> None:
+        """Hands records to a background thread that formats and writes them
+        with `handlers`.
+
+        Unlike `QueueHandler`, records are queued unformatted, so neither
+        `%`-formatting nor I/O runs on the logging thread. The listener is
+        started lazily in each process, as a thread does not survive fork().
+        """
+        super().__init__(queue.SimpleQueue())
+        self.handlers = handlers
+        self.listener: Union[QueueListener, None] = None
+        self._pid: Union[int, None] = None
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # records inherited through fork() were the parent's to write
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(
+                self.queue, *self.handlers, respect_handler_level=True
+            )
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.start()
+        super().enqueue(record)
+
+    def stop(self) -> None:
+        """Writes the queued records and stops the listener."""
+        if self._pid == os.getpid() and self.listener is not None:
+            self.listener.stop()
+            self._pid = None
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    sample_rates: str = LOG_SAMPLE_RATES,
+    full_bodies: bool = LOG_FULL_BODIES,
+) -> BackgroundQueueHandler:
+    """Routes the root logger through a `BackgroundQueueHandler`.
+
+    Records are sampled on the calling thread, which is cheap, and redacted,
+    formatted and written to stderr on the listener thread.
+
+    Args:
+        level (str, optional): root log level. Defaults to `LOG_LEVEL`.
+        sample_rates (str, optional): `category=rate` pairs. Defaults to
+            `LOG_SAMPLE_RATES`.
+        full_bodies (bool, optional): log every body unredacted, for
+            debugging. Defaults to `LOG_FULL_BODIES`.
+
+    Returns:
+        BackgroundQueueHandler: the installed handler.
+    """
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler = BackgroundQueueHandler(stream)
+    if not full_bodies:
+        handler.addFilter(SamplingFilter(parse_sample_rates(sample_rates)))
+        stream.addFilter(RedactingFilter())
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    atexit.register(handler.stop)
+    return handler
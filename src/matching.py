@@ -0,0 +1,133 @@
+from collections import defaultdict
+from typing import Callable, Dict, FrozenSet, Iterable, List, Set, Tuple, Union
+
+Languages = Union[str, Iterable[str], None]
+
+
+def _languages(languages: Languages) -> FrozenSet[str]:
+    if not languages:
+        return frozenset()
+    if isinstance(languages, str):
+        return frozenset([languages])
+    return frozenset(languages)
+
+
+class PreferenceMatcher:
+    def __init__(self) -> None:
+        """Inverted indexes of volunteers by gender and language preference.
+
+        Each preference value maps to the set of volunteer keys holding it, so
+        matching a PWID's needs is a set intersection whose cost depends on
+        the number of matching volunteers, not on the number of volunteers.
+        """
+        self._by_gender: Dict[str, Set[str]] = defaultdict(set)
+        self._by_language: Dict[str, Set[str]] = defaultdict(set)
+        self._preferences: Dict[str, Tuple[Union[str, None], FrozenSet[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._preferences)
+
+    def add(self, key: str, gender: Union[str, None], languages: Languages) -> None:
+        """Indexes a volunteer's preferences, replacing previous ones.
+
+        Args:
+            key (str): volunteer key, e.g. username.
+            gender (str, optional): `GenderPreference` value.
+            languages (Languages): one or more `LanguagePreference` values.
+        """
+        preferences = (gender, _languages(languages))
+        if self._preferences.get(key) == preferences:
+            return
+        self.remove(key)
+        self._preferences[key] = preferences
+        if gender:
+            self._by_gender[gender].add(key)
+        for language in preferences[1]:
+            self._by_language[language].add(key)
+
+    def remove(self, key: str) -> None:
+        preferences = self._preferences.pop(key, None)
+        if preferences is None:
+            return
+        gender, languages = preferences
+        if gender:
+            self._discard(self._by_gender, gender, key)
+        for language in languages:
+            self._discard(self._by_language, language, key)
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], value: str, key: str) -> None:
+        keys = index[value]
+        keys.discard(key)
+        if not keys:
+            del index[value]
+
+    def clear(self) -> None:
+        self._by_gender.clear()
+        self._by_language.clear()
+        self._preferences.clear()
+
+    def _indexes(
+        self, gender: Union[str, None], language: Union[str, None]
+    ) -> List[Set[str]]:
+        indexes = []
+        if gender:
+            indexes.append(self._by_gender.get(gender, set()))
+        if language:
+            indexes.append(self._by_language.get(language, set()))
+        return indexes
+
+    def match(
+        self, gender: Union[str, None] = None, language: Union[str, None] = None
+    ) -> Union[Set[str], None]:
+        """Finds volunteers matching every given need.
+
+        Args:
+            gender (str, optional): PWID's gender.
+            language (str, optional): PWID's language.
+
+        Returns:
+            Union[Set[str], None]: matching volunteer keys, or None when no
+                need was given and every volunteer matches.
+        """
+        indexes = self._indexes(gender, language)
+        if not indexes:
+            return None
+        smallest, *others = sorted(indexes, key=len)
+        return smallest.intersection(*others)
+
+    def predicate(
+        self, gender: Union[str, None] = None, language: Union[str, None] = None
+    ) -> Union[Callable[[str], bool], None]:
+        """Returns an O(1) membership test for volunteers matching every need.
+
+        Unlike `match`, nothing is materialised, which is cheaper when only a
+        few candidates (e.g. the nearest ones) need to be checked.
+
+        Returns:
+            Union[Callable[[str], bool], None]: the test, or None when no need
+                was given and every volunteer matches.
+        """
+        indexes = self._indexes(gender, language)
+        if not indexes:
+            return None
+        return lambda key: all(key in keys for keys in indexes)
+
+    def rank(
+        self,
+        keys: Iterable[str],
+        gender: Union[str, None] = None,
+        language: Union[str, None] = None,
+    ) -> List[str]:
+        """Orders `keys` with volunteers matching every need first.
+
+        The order within each group is kept, so ranking a list sorted by
+        distance gives the closest matching volunteers first.
+        """
+        matches = self.match(gender, language)
+        if matches is None:
+            return list(keys)
+        keys = list(keys)
+        return [key for key in keys if key in matches] + [
+            key for key in keys if key not in matches
+        ]
@@ -0,0 +1,261 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Lines of the metric's samples in the Prometheus text format."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        """Monotonically increasing count, e.g. of requests."""
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        key = tuple(str(label) for label in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(tuple(str(label) for label in labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {value}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        """Value that goes up and down, e.g. a queue depth."""
+        super().__init__(name, help, labels)
+
+    def dec(self, *labels: Any, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Distribution of observed values, e.g. latencies in seconds.
+
+        An observation costs a binary search over the bucket bounds and an
+        increment, so histograms are cheap enough to leave on in production.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: bucket counts (last one is +Inf), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        key = tuple(str(label) for label in labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *labels: Any) -> int:
+        counts, _ = self._values.get(tuple(str(label) for label in labels), ([], []))
+        return sum(counts)
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        """Observes the duration of the `with` block."""
+        started_at = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started_at, *labels)
+
+    def timed(self, *labels: Any) -> Callable:
+        """Decorator observing the duration of every call."""
+
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.time(*labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), total[0]))
+                for key, (counts, total) in self._values.items()
+            )
+        for key, (counts, total) in values:
+            label_names = self.label_names + ("le",)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(label_names, key + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        """Collection of metrics rendered in the Prometheus text format.
+
+        Metrics are kept per process, so every gunicorn worker reports its own
+        series.
+        """
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+TELEGRAM_REQUESTS = REGISTRY.register(
+    Counter(
+        "telegram_requests_total",
+        "Telegram Bot API calls by method and outcome.",
+        ["method", "status"],
+    )
+)
+TELEGRAM_LATENCY = REGISTRY.register(
+    Histogram(
+        "telegram_request_duration_seconds",
+        "Telegram Bot API call latency, including retries.",
+        ["method"],
+    )
+)
+FIRESTORE_LATENCY = REGISTRY.register(
+    Histogram(
+        "firestore_operation_duration_seconds",
+        "Firestore operation latency.",
+        ["operation"],
+    )
+)
+UPDATES = REGISTRY.register(
+    Counter("telegram_updates_total", "Telegram updates handled by type.", ["type"])
+)
+UPDATE_LATENCY = REGISTRY.register(
+    Histogram(
+        "telegram_update_duration_seconds",
+        "Time to handle a Telegram update by type.",
+        ["type"],
+    )
+)
+BROADCAST_LATENCY = REGISTRY.register(
+    Histogram(
+        "broadcast_duration_seconds",
+        "Time to fan a message out to every recipient.",
+        buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+    )
+)
+BROADCAST_MESSAGES = REGISTRY.register(
+    Counter(
+        "broadcast_messages_total",
+        "Broadcast messages by outcome.",
+        ["status"],
+    )
+)
+OUTBOX_DEPTH = REGISTRY.register(
+    Gauge(
+        "telegram_outbox_depth",
+        "Outbound Telegram messages waiting for a send slot by priority.",
+        ["priority"],
+    )
+)
+OUTBOX_WAIT = REGISTRY.register(
+    Histogram(
+        "telegram_outbox_wait_seconds",
+        "Time outbound Telegram messages waited for a send slot by priority.",
+        ["priority"],
+    )
+)
+RASP_EVENTS = REGISTRY.register(
+    Counter(
+        "rasp_events_total",
+        "Help request button presses by outcome.",
+        ["outcome"],
+    )
+)
+PWID_PROFILE_CACHE = REGISTRY.register(
+    Counter(
+        "pwid_profile_cache_total",
+        "PWID profile lookups by cache result.",
+        ["result"],
+    )
+)
+MEDIA_CACHE = REGISTRY.register(
+    Counter(
+        "telegram_media_cache_total",
+        "Telegram file_id lookups by result.",
+        ["result"],
+    )
+)
+ESCALATION_WAVES = REGISTRY.register(
+    Counter(
+        "escalation_waves_total",
+        "Later alert waves of help requests by outcome.",
+        ["outcome"],
+    )
+)
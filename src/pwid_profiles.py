@@ -0,0 +1,244 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import monotonic
+from typing import TYPE_CHECKING, Dict, Tuple, Union
+
+from src.config import (
+    PWID_PROFILE_BACKEND,
+    PWID_PROFILE_CACHE_SIZE,
+    PWID_PROFILE_TTL,
+)
+from src.firebase import db
+from src.metrics import FIRESTORE_LATENCY, PWID_PROFILE_CACHE
+from src.rest import Json
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import Client, CollectionReference
+
+
+class PwidProfileStore(ABC):
+    """Stores the profiles caregivers keep of their PWIDs, keyed by the id
+    the PWID's micro:bit sends to `/rasp`.
+
+    Example document:
+        {
+            "id": "1",
+            "name": "Jane Tan",
+            "caregiver_contact": "+65 9123 4567",
+            "disabilities": ["autism", "non-verbal"],
+            "updated_at": 1679475161
+        }
+    """
+
+    @abstractmethod
+    def get(self, pwid_id: str) -> Union[Json, None]:
+        """Returns the profile of a PWID, or None if there is none."""
+
+    @abstractmethod
+    def set(self, pwid_id: str, profile: Json) -> None:
+        """Creates or replaces the profile of a PWID."""
+
+
+class InMemoryPwidProfileStore(PwidProfileStore):
+    def __init__(self) -> None:
+        """Process-local store, a stand-in for Firestore in tests."""
+        self._profiles: Dict[str, Json] = {}
+        self._lock = threading.Lock()
+
+    def get(self, pwid_id: str) -> Union[Json, None]:
+        with self._lock:
+            profile = self._profiles.get(pwid_id)
+            return dict(profile) if profile else None
+
+    def set(self, pwid_id: str, profile: Json) -> None:
+        with self._lock:
+            self._profiles[pwid_id] = dict(profile, id=pwid_id)
+
+
+class FirestorePwidProfileStore(PwidProfileStore):
+    def __init__(self, client: "Client", collection: str = "pwids") -> None:
+        """Profiles stored in a Firestore collection, one document per PWID."""
+        self.client = client
+        self.collection_name = collection
+
+    @property
+    def collection(self) -> "CollectionReference":
+        return self.client.collection(self.collection_name)
+
+    @FIRESTORE_LATENCY.timed("pwids.get")
+    def get(self, pwid_id: str) -> Union[Json, None]:
+        return self.collection.document(pwid_id).get().to_dict()
+
+    @FIRESTORE_LATENCY.timed("pwids.set")
+    def set(self, pwid_id: str, profile: Json) -> None:
+        self.collection.document(pwid_id).set(dict(profile, id=pwid_id))
+
+
+class CachedPwidProfileStore(PwidProfileStore):
+    def __init__(
+        self,
+        store: PwidProfileStore,
+        maxsize: int = PWID_PROFILE_CACHE_SIZE,
+        ttl: float = PWID_PROFILE_TTL,
+        workers: int = 2,
+    ) -> None:
+        """`PwidProfileStore` with a bounded in-process cache in front.
+
+        Profiles, and the absence of one, are kept for `ttl` seconds; beyond
+        `maxsize` the least recently used one is evicted. `/rasp` calls
+        `prefetch`, which loads the profile on a background thread while the
+        alert goes out, so it is cached by the time a volunteer accepts.
+        A `get` while the profile is still loading waits for that load
+        instead of starting another one, for at most its `timeout`.
+
+        `set` writes through and refreshes the cache. Profiles changed
+        elsewhere are dropped with `invalidate`; other processes see the
+        change once their copy expires.
+
+        Args:
+            store (PwidProfileStore): store the profiles are loaded from.
+            maxsize (int, optional): maximum number of cached profiles.
+                Defaults to `PWID_PROFILE_CACHE_SIZE`.
+            ttl (float, optional): seconds a profile is cached. Defaults to
+                `PWID_PROFILE_TTL`.
+            workers (int, optional): threads prefetching profiles. Defaults
+                to 2.
+        """
+        self.store = store
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.workers = workers
+        # pwid id: (expires_at, profile), least recently used first
+        self._cache: "OrderedDict[str, Tuple[float, Union[Json, None]]]" = OrderedDict()
+        self._loading: Dict[str, "Future[Union[Json, None]]"] = {}
+        self._lock = threading.Lock()
+        self._executor: Union[ThreadPoolExecutor, None] = None
+        self._pid: Union[int, None] = None
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Prefetch threads of this process, started on first use."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # threads and loads inherited through fork() are gone
+                    self._loading = {}
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="pwid-prefetch"
+                    )
+                    self._pid = os.getpid()
+        return self._executor  # type: ignore
+
+    def _cached(self, pwid_id: str) -> Tuple[bool, Union[Json, None]]:
+        entry = self._cache.get(pwid_id)
+        if entry is None:
+            return False, None
+        if entry[0] <= monotonic():
+            del self._cache[pwid_id]
+            return False, None
+        self._cache.move_to_end(pwid_id)
+        return True, entry[1]
+
+    def _store(self, pwid_id: str, profile: Union[Json, None]) -> None:
+        self._cache[pwid_id] = (monotonic() + self.ttl, profile)
+        self._cache.move_to_end(pwid_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def _load(self, pwid_id: str) -> "Future[Union[Json, None]]":
+        """Returns the pending load of a profile, registering a new one if
+        there is none. Must be called with `_lock` held."""
+        future = self._loading.get(pwid_id)
+        if future is None:
+            future = Future()
+            self._loading[pwid_id] = future
+        return future
+
+    def _run_load(self, pwid_id: str, future: "Future[Union[Json, None]]") -> None:
+        try:
+            profile = self.store.get(pwid_id)
+        except Exception as error:
+            with self._lock:
+                if self._loading.get(pwid_id) is future:
+                    del self._loading[pwid_id]
+            future.set_exception(error)
+            return
+        with self._lock:
+            # a profile invalidated while loading may be stale, don't keep it
+            if self._loading.get(pwid_id) is future:
+                del self._loading[pwid_id]
+                self._store(pwid_id, profile)
+        future.set_result(profile)
+
+    def get(
+        self, pwid_id: str, timeout: Union[float, None] = None
+    ) -> Union[Json, None]:
+        """Returns the profile of a PWID, from the cache if it is there.
+
+        Args:
+            pwid_id (str): id of the PWID.
+            timeout (float, optional): seconds to wait for a profile that is
+                not cached. Defaults to None, waiting as long as the load
+                takes.
+
+        Raises:
+            TimeoutError: if the profile did not load within `timeout`.
+            Exception: the error of the underlying store, if it failed.
+        """
+        executor = self.executor
+        with self._lock:
+            hit, profile = self._cached(pwid_id)
+            if hit:
+                PWID_PROFILE_CACHE.inc("hit")
+                return dict(profile) if profile else None
+            loading = pwid_id in self._loading
+            future = self._load(pwid_id)
+        PWID_PROFILE_CACHE.inc("wait" if loading else "miss")
+        if not loading:
+            if timeout is None:
+                self._run_load(pwid_id, future)
+            else:
+                executor.submit(self._run_load, pwid_id, future)
+        profile = future.result(timeout)
+        return dict(profile) if profile else None
+
+    def prefetch(self, pwid_id: str) -> None:
+        """Loads a profile into the cache in the background, unless it is
+        cached or already loading."""
+        executor = self.executor
+        with self._lock:
+            if self._cached(pwid_id)[0] or pwid_id in self._loading:
+                return
+            future = self._load(pwid_id)
+        executor.submit(self._run_load, pwid_id, future)
+
+    def set(self, pwid_id: str, profile: Json) -> None:
+        self.store.set(pwid_id, profile)
+        with self._lock:
+            self._loading.pop(pwid_id, None)
+            self._store(pwid_id, dict(profile, id=pwid_id))
+
+    def invalidate(self, pwid_id: str) -> bool:
+        """Drops the cached profile of a PWID, e.g. after its caregiver
+        changed it.
+
+        Returns:
+            bool: whether a profile was cached or loading.
+        """
+        with self._lock:
+            cached = self._cache.pop(pwid_id, None) is not None
+            loading = self._loading.pop(pwid_id, None) is not None
+        return cached or loading
+
+
+pwid_profiles = CachedPwidProfileStore(
+    InMemoryPwidProfileStore()
+    if PWID_PROFILE_BACKEND == "memory"
+    else FirestorePwidProfileStore(db)
+)
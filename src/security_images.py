@@ -0,0 +1,197 @@
+import atexit
+import heapq
+import logging
+import threading
+from time import time
+from typing import Any, Dict, List, Tuple, Union
+
+from src.config import HELP_REQUEST_TTL
+from src.firebase import db
+from src.rest import Json
+from src.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+ICON_URL = (
+    "https://firebasestorage.googleapis.com/v0/b/fleshid-dc8ed.appspot.com/o/"
+    "{}.png?alt=media"
+)
+DEFAULT_ICON = "SMILE"
+
+
+def icon_url(icon: str) -> str:
+    return ICON_URL.format(icon)
+
+
+class SecurityImageAllocator:
+    def __init__(
+        self,
+        client: Any,
+        collection: str = "icon_names",
+        lease_ttl: float = HELP_REQUEST_TTL,
+        sync_interval: float = 5.0,
+    ) -> None:
+        """Leases security images (icons) to help requests from an in-memory
+        pool.
+
+        The pool is read once from `icon_names` and kept in a heap ordered by
+        `updated_at`, so the least recently used free icon is handed out in
+        O(log n) without a network call. An icon is leased to one request at a
+        time until the request is released or `lease_ttl` seconds pass. Only
+        when every icon is leased is the lease closest to expiry taken over.
+
+        Changes are written back to `icon_names` in batches by a
+        `WriteBehindBuffer`. Icons another worker marked unavailable less than
+        `lease_ttl` ago are treated as leased until then.
+
+        The pool is per process and leases are not claimed atomically in
+        Firestore, so two workers started together can lease the same icon to
+        different requests. Run a single worker, as the Dockerfile does;
+        several ASGI requests are served concurrently by one worker anyway.
+        The icon of a request is stored on it (see `HelpRequestStore`), so
+        repeated presses show the same icon on whichever worker they land.
+
+        Example doc (id = `value`):
+            {
+                "available": True,
+                "updated_at": 1679475161,
+                "value": "SMILE"
+            }
+
+        Args:
+            client (Client): Firestore client.
+            collection (str, optional): collection of icons. Defaults to
+                "icon_names".
+            lease_ttl (float, optional): seconds a lease lasts. Defaults to
+                `HELP_REQUEST_TTL`.
+            sync_interval (float, optional): seconds between writes back to
+                `collection`. Defaults to 5.0.
+        """
+        self.client = client
+        self.collection_name = collection
+        self.lease_ttl = lease_ttl
+        self.buffer = WriteBehindBuffer(
+            client, collection, flush_interval=sync_interval
+        )
+        # free icons as (updated_at, icon); stale entries are skipped
+        self._free: List[Tuple[float, str]] = []
+        self._freed_at: Dict[str, float] = {}
+        # leases as (expires_at, request_id); stale entries are skipped
+        self._expiries: List[Tuple[float, str]] = []
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self) -> None:
+        """Reads the icon pool from Firestore, once."""
+        if self.loaded:
+            return
+        docs = self.client.collection(self.collection_name).stream()
+        icons = [doc.to_dict() for doc in docs]
+        with self._lock:
+            if self.loaded:
+                return
+            now = time()
+            for icon in icons:
+                updated_at = icon.get("updated_at") or 0
+                if icon.get("available", True) or updated_at + self.lease_ttl <= now:
+                    self._free_icon(icon["value"], updated_at)
+                else:
+                    # leased by another worker, keyed apart from request ids
+                    value = icon["value"]
+                    self._lease(value, f"~{value}", updated_at + self.lease_ttl)
+            self.loaded = True
+            logger.info("security image pool loaded with %d icons", len(icons))
+
+    def _free_icon(self, icon: str, updated_at: float) -> None:
+        self._freed_at[icon] = updated_at
+        heapq.heappush(self._free, (updated_at, icon))
+
+    def _lease(self, icon: str, request_id: str, expires_at: float) -> None:
+        self._freed_at.pop(icon, None)
+        self._leases[request_id] = (icon, expires_at)
+        heapq.heappush(self._expiries, (expires_at, request_id))
+
+    def _is_current(self, expires_at: float, request_id: str) -> bool:
+        lease = self._leases.get(request_id)
+        return lease is not None and lease[1] == expires_at
+
+    def _expire(self, now: float) -> None:
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, request_id = heapq.heappop(self._expiries)
+            if self._is_current(expires_at, request_id):
+                icon, _ = self._leases.pop(request_id)
+                self._free_icon(icon, expires_at)
+
+    def _pop_free(self) -> Union[str, None]:
+        while self._free:
+            updated_at, icon = heapq.heappop(self._free)
+            if self._freed_at.get(icon) == updated_at:
+                return icon
+        return None
+
+    def _take_over(self) -> Union[str, None]:
+        while self._expiries:
+            expires_at, request_id = heapq.heappop(self._expiries)
+            if self._is_current(expires_at, request_id):
+                icon, _ = self._leases.pop(request_id)
+                logger.warning("every icon is leased, reusing %s", icon)
+                return icon
+        return None
+
+    def allocate(self, request_id: str) -> str:
+        """Leases an icon to a help request.
+
+        Returns:
+            str: icon name, the same one on repeated calls for a request.
+        """
+        self.load()
+        now = time()
+        with self._lock:
+            lease = self._leases.get(request_id)
+            if lease is not None:
+                return lease[0]
+            self._expire(now)
+            icon = self._pop_free() or self._take_over()
+            if icon is None:
+                return DEFAULT_ICON
+            self._lease(icon, request_id, now + self.lease_ttl)
+        self.buffer.update(icon, dict(available=False, updated_at=int(now)))
+        return icon
+
+    def release(self, request_id: str) -> Union[str, None]:
+        """Returns a help request's icon to the pool.
+
+        Returns:
+            Union[str, None]: the released icon, or None if the request holds
+                no lease.
+        """
+        now = time()
+        with self._lock:
+            lease = self._leases.pop(request_id, None)
+            if lease is None:
+                return None
+            icon = lease[0]
+            self._free_icon(icon, now)
+        self.buffer.update(icon, dict(available=True, updated_at=int(now)))
+        return icon
+
+    def icons(self) -> List[str]:
+        """Returns the names of all icons in the pool."""
+        self.load()
+        with self._lock:
+            leased = {icon for icon, _ in self._leases.values()}
+            return sorted(leased.union(self._freed_at))
+
+    def leases(self) -> Json:
+        """Returns the icon leased to each request."""
+        with self._lock:
+            return {
+                request_id: icon
+                for request_id, (icon, _) in self._leases.items()
+                if not request_id.startswith("~")
+            }
+
+
+security_images = SecurityImageAllocator(db)
+atexit.register(security_images.buffer.close, timeout=5)
@@ -1,30 +1,87 @@
-import json
 import logging
-from typing import List, Union
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Any, Callable, Coroutine, Dict, List, Tuple, TypeVar, Union
 
 import requests
 
-from src.config import TELEGRAM_BOT_TOKEN
+from src.config import (
+    TELEGRAM_API_URL,
+    TELEGRAM_BROADCAST_WORKERS,
+    telegram_bot_token,
+)
+from src.metrics import (
+    BROADCAST_LATENCY,
+    BROADCAST_MESSAGES,
+    TELEGRAM_LATENCY,
+    TELEGRAM_REQUESTS,
+)
+from src.log import BODY
 from src.rest import Json, generate_response_json
+from src.telegram.callback_data import encode_callback_data
+from src.telegram.media import MediaCache, media_cache, photo_file_id
+from src.telegram.outbox import Outbox, Priority
+from src.telegram.outbox import outbox as default_outbox
+from src.telegram.protocol import (
+    Markup,
+    broadcast_result,
+    callback_answer_payload,
+    edit_result,
+    edit_text_payload,
+    message_payload,
+    message_result,
+    poll_payload,
+    run_sync,
+)
+from src.telegram.ratelimit import TokenBucket
+from src.telegram.transport import HttpTransport, Transport
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
 
-class TelegramApiWrapper:
-    def __init__(self, token: str) -> None:
-        self.token = token
 
-    def _post_json(self, json: Json, url: str) -> Json:
-        """Sends a POST request to the Telegram API."""
-        r = requests.post(url, json=json)
-        print(f"{url} :: {json}")
-        logger.info(f"{url} :: {json}")
-        logger.info(f"{r.status_code} :: {r.json()}")
-        return r.json()
+class TelegramApiBase:
+    def __init__(self, token: Union[str, None] = None) -> None:
+        """Token, URLs and metrics of the blocking and async API wrappers."""
+        self._token = token
+
+    @property
+    def token(self) -> str:
+        """Bot token, `TELEGRAM_BOT_TOKEN` unless given."""
+        if self._token is None:
+            self._token = telegram_bot_token()
+        return self._token
+
+    def _record(self, method: str, resp: Json) -> Json:
+        if resp.get("ok"):
+            TELEGRAM_REQUESTS.inc(method, "ok")
+        else:
+            TELEGRAM_REQUESTS.inc(method, resp.get("error_code", "error"))
+            logger.info("%s :: %s", method, resp)
+        return resp
 
     def get_url(self, method: str) -> str:
         """Returns the Telegram API URL for a given method."""
-        return f"https://api.telegram.org/bot{self.token}/{method}"
+        return f"{TELEGRAM_API_URL}/bot{self.token}/{method}"
+
+
+class TelegramApiWrapper(TelegramApiBase):
+    def __init__(
+        self,
+        token: Union[str, None] = None,
+        transport: Union[Transport, None] = None,
+    ) -> None:
+        super().__init__(token)
+        self.transport = transport or HttpTransport()
+
+    def _post_json(self, json: Json, url: str) -> Json:
+        """Sends a POST request to the Telegram API."""
+        method = url.rsplit("/", 1)[-1]
+        with TELEGRAM_LATENCY.time(method):
+            resp = self.transport.post(url, json)
+        return self._record(method, resp)
 
     def get_me(self) -> Json:
         """Returns basic information about the bot in form of a user object.
@@ -98,16 +155,25 @@ class TelegramApiWrapper:
         """
         return self._post_json({"url": webhook_url}, self.get_url("setWebhook"))
 
-    def delete_webhook(self) -> Json:
+    def delete_webhook(self, drop_pending_updates: bool = True) -> Json:
         """Deletes the webhook url for the bot.
 
         Refer to Telegram API for necessary parameters.
         https://core.telegram.org/bots/api#deletewebhook
         """
         return self._post_json(
-            {"drop_pending_updates": True}, self.get_url("deleteWebhook")
+            {"drop_pending_updates": drop_pending_updates},
+            self.get_url("deleteWebhook"),
         )
 
+    def get_updates(self, json: Json) -> Json:
+        """Receives incoming updates using long polling.
+
+        Refer to Telegram API for necessary parameters.
+        https://core.telegram.org/bots/api#getupdates
+        """
+        return self._post_json(json, self.get_url("getUpdates"))
+
     def send_photo(self, chat_id: int, photo_url: str) -> Json:
         """Send a photo to a telegram chat.
 
@@ -120,14 +186,58 @@ class TelegramApiWrapper:
 
 
 class TelegramBot:
-    def __init__(self, token: str) -> None:
-        self.api = TelegramApiWrapper(token)
+    def __init__(
+        self,
+        token: Union[str, None] = None,
+        rate_limiter: Union[TokenBucket, None] = None,
+        broadcast_workers: int = TELEGRAM_BROADCAST_WORKERS,
+        transport: Union[Transport, None] = None,
+        outbox: Union[Outbox, None] = None,
+        media: Union[MediaCache, None] = None,
+    ) -> None:
+        """Telegram Bot API client.
+
+        Every method posting to a chat takes a send slot of `outbox` first,
+        so alerts go out ahead of routine messages and the bot stays under
+        Telegram's global and per-chat limits. Calls that don't post to a
+        chat, like answering a callback query, are sent at once.
+
+        Args:
+            token (str, optional): bot token. Defaults to `TELEGRAM_BOT_TOKEN`.
+            rate_limiter (TokenBucket, optional): global limit of a dedicated
+                outbox. Defaults to None.
+            broadcast_workers (int, optional): concurrent sends of a fan-out.
+                Defaults to `TELEGRAM_BROADCAST_WORKERS`.
+            transport (Transport, optional): transport to the API.
+            outbox (Outbox, optional): outbound scheduler. Defaults to the
+                process-wide `outbox`, or a new one limited by `rate_limiter`.
+            media (MediaCache, optional): `file_id`s of sent photos. Defaults
+                to the process-wide `media_cache`.
+        """
+        self.api = TelegramApiWrapper(token, transport)
+        if outbox is None:
+            outbox = Outbox(rate_limiter) if rate_limiter else default_outbox
+        self.outbox = outbox
+        self.media = media_cache if media is None else media
+        self.broadcast_workers = broadcast_workers
+
+    def _send(
+        self,
+        priority: Priority,
+        chat_id: Union[int, None],
+        call: Callable[..., Json],
+        *args: Any,
+    ) -> Json:
+        """Posts `call(*args)` once `outbox` grants a slot."""
+        self.outbox.acquire(priority, chat_id)
+        return call(*args)
 
     def send_message(
         self,
         chat_id: int,
         msg: str,
-        markup: Union[str, None] = None,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
     ) -> Json:
         """Sends a message to a telegram chat.
 
@@ -137,38 +247,82 @@ class TelegramBot:
         Args:
             chat_id (int): The chat id of the chat to send this message to.
             msg (str): The message to be sent.
-            markup (str, optional): The reply markup type of the message. Defaults
-                to None.
+            markup (Markup, optional): The reply markup of the message.
+                Defaults to None.
+            priority (Priority, optional): outbound class of the message.
+                Defaults to `Priority.FOLLOW_UP`.
 
         Returns:
             Json: a json payload for response containing response from
                 telegram api.
         """
-        payload = dict(
-            chat_id=int(chat_id),
-            text=msg,
-            parse_mode="HTML",
-        )
-        if markup:
-            payload["reply_markup"] = markup
-
-        resp = self.api.send_message(payload)
-        success = resp.get("ok")
-        if success:
-            try:
-                resp_result = resp.get("result")  # type: ignore
-                resp_chat_id = resp_result.get("chat").get("id")  # type: ignore
-                resp_message_id = resp_result.get("message_id")  # type: ignore
-                data = dict(chat_id=resp_chat_id, message_id=resp_message_id)
-            except AttributeError:
-                data = dict(error="Invalid response from telegram api")
-        else:
-            data = dict(error=resp.get("description"))
+        payload = message_payload(chat_id, msg, markup)
+        resp = self._send(priority, int(chat_id), self.api.send_message, payload)
+        return message_result(resp)
+
+    def send_photo(
+        self,
+        chat_id: int,
+        photo_url: str,
+        priority: Priority = Priority.FOLLOW_UP,
+        media_key: Union[str, None] = None,
+    ) -> Json:
+        """Sends a photo to a telegram chat.
+
+        Once Telegram has the photo it is sent by its `file_id`, see
+        `MediaCache`. An id Telegram rejects is forgotten and the photo is
+        sent from `photo_url` again.
+
+        Args:
+            chat_id (int): The chat id of the chat to send the photo to.
+            photo_url (str): URL Telegram fetches the photo from.
+            priority (Priority, optional): outbound class of the photo.
+                Defaults to `Priority.FOLLOW_UP`.
+            media_key (str, optional): key of the photo in `media`, e.g. the
+                name of a security image. Defaults to `photo_url`.
 
-        return generate_response_json(success, data)
+        Returns:
+            Json: response from telegram api.
+        """
+        key = media_key or photo_url
+        file_id = self.media.get(key)
+        if file_id:
+            resp = self._send(priority, chat_id, self.api.send_photo, chat_id, file_id)
+            if resp.get("ok"):
+                return resp
+            self.media.forget(key)
+        resp = self._send(priority, chat_id, self.api.send_photo, chat_id, photo_url)
+        self._remember_photo(key, resp)
+        return resp
+
+    def _remember_photo(self, key: str, resp: Json) -> None:
+        file_id = photo_file_id(resp) if resp.get("ok") else None
+        if file_id:
+            self.media.set(key, file_id)
+
+    def upload_media(self, chat_id: int, photos: Dict[str, str]) -> int:
+        """Sends the photos Telegram has no `file_id` for yet to a chat and
+        deletes them again, so later sends already reuse their ids.
+
+        Args:
+            chat_id (int): chat to upload to, e.g. a private channel.
+            photos (Dict[str, str]): photo URLs by their `media` key.
 
-    def send_photo(self, chat_id: int, photo_url: str):
-        return self.api.send_photo(chat_id, photo_url)
+        Returns:
+            int: number of photos uploaded.
+        """
+        uploaded = 0
+        for key, photo_url in photos.items():
+            if self.media.get(key):
+                continue
+            resp = self.send_photo(chat_id, photo_url, Priority.ONBOARDING, key)
+            if not resp.get("ok"):
+                continue
+            uploaded += 1
+            message_id = resp["result"].get("message_id")
+            if message_id is not None:
+                self.delete_message(chat_id, message_id, Priority.ONBOARDING)
+        return uploaded
 
     def send_poll(
         self,
@@ -177,8 +331,11 @@ class TelegramBot:
         options: List[str],
         allows_multiple_answers: bool = False,
         open_period: int = 600,
-        protect_content: bool = True,
-        markup: Union[str, None] = None,
+        is_anonymous: bool = True,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+        *,
+        protect_content: bool = False,
     ) -> Json:
         """Sends a poll to a telegram chat.
 
@@ -191,64 +348,140 @@ class TelegramBot:
                 multiple answers. Defaults to False.
             open_period (int, optional): Amount of time in seconds the poll will
                 be active after creation. Defaults to 600.
-            protect_content (bool, optional): True, if the poll needs to be sent
-                anonymously. Defaults to True.
-            markup (str, optional): The reply markup type of the message. Defaults
-                to None.
+            is_anonymous (bool, optional): True, if the poll needs to be
+                anonymous. Answers to anonymous polls are not sent to the bot.
+                Defaults to True.
+            markup (Markup, optional): The reply markup of the message.
+                Defaults to None.
+            priority (Priority, optional): outbound class of the poll. Defaults
+                to `Priority.FOLLOW_UP`.
+            protect_content (bool, optional): True, if the poll cannot be
+                forwarded or saved. Keyword only. Defaults to False.
 
         Returns:
             Json: a json payload for response containing response from telegram api.
         """
-        poll = dict(
-            chat_id=chat_id,
-            question=question,
-            options=options,
-            is_anonymous=protect_content,
-            type="regular",
-            allows_multiple_answers=allows_multiple_answers,
-            open_period=open_period,
-            reply_markup=markup,
+        poll = poll_payload(
+            chat_id,
+            question,
+            options,
+            allows_multiple_answers,
+            open_period,
+            is_anonymous,
+            protect_content,
+            markup,
         )
-        poll = {k: v for k, v in poll.items() if v is not None}
-        logger.info(f"Sending poll: {poll}")
-        self.api.send_poll(poll)
+        logger.info("Sending poll: %s", poll, extra=BODY)
+        return self._send(priority, chat_id, self.api.send_poll, poll)
 
-    def broadcast(self, message: str, chat_ids: List[int], markup=None) -> None:
+    def _broadcast_one(
+        self, chat_id: int, message: str, markup: Markup, priority: Priority
+    ) -> Json:
+        started_at = monotonic()
+        try:
+            resp = self.send_message(chat_id, message, markup, priority)
+        except requests.RequestException as e:
+            resp = generate_response_json(False, dict(error=str(e)))
+        return broadcast_result(chat_id, resp, started_at)
+
+    def broadcast(
+        self,
+        message: str,
+        chat_ids: List[int],
+        markup: Markup = None,
+        priority: Priority = Priority.ALERT,
+    ) -> List[Json]:
         """Broadcast Message to list of Users
 
+        Messages are sent concurrently from a thread pool while `outbox` keeps
+        the bot under Telegram's global send limit, so a broadcast takes
+        roughly `len(chat_ids) / rate` seconds.
+
         Args:
             message (str): message to broadcast
-            users (List[str]): list of user's chat id
+            chat_ids (List[int]): list of user's chat id
+            markup (Markup, optional): reply markup sent with every message.
+                Defaults to None.
+            priority (Priority, optional): outbound class of the messages.
+                Defaults to `Priority.ALERT`.
+
+        Returns:
+            List[Json]: one result per chat id, in the same order, containing
+                `chat_id`, `message_id`, `error` and `latency` in seconds.
+        """
+        with BROADCAST_LATENCY.time():
+            results = self._fan_out(
+                lambda chat_id: self._broadcast_one(chat_id, message, markup, priority),
+                chat_ids,
+            )
+        for result in results:
+            BROADCAST_MESSAGES.inc("error" if result["error"] else "ok")
+        return results
+
+    def _fan_out(self, func: Callable[[Any], Json], items: List[Any]) -> List[Json]:
+        if not items:
+            return []
+        workers = max(1, min(self.broadcast_workers, len(items)))
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="broadcast"
+        ) as executor:
+            return list(executor.map(func, items))
+
+    def _edit_one(
+        self, chat_id: int, message_id: int, text: str, priority: Priority
+    ) -> Json:
+        resp = self.edit_message_text(chat_id, message_id, text, priority=priority)
+        return edit_result(chat_id, message_id, resp)
+
+    def edit_messages(
+        self,
+        text: str,
+        messages: List[Tuple[int, int]],
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> List[Json]:
+        """Replaces the text of many messages concurrently, e.g. to retract a
+        broadcast. Editing the text also removes the inline keyboard.
+
+        Args:
+            text (str): new message text.
+            messages (List[Tuple[int, int]]): (chat id, message id) pairs.
+            priority (Priority, optional): outbound class of the edits.
+                Defaults to `Priority.FOLLOW_UP`.
+
+        Returns:
+            List[Json]: one result per message, in the same order, containing
+                `chat_id`, `message_id` and `error`.
         """
-        for chat_id in chat_ids:
-            self.send_message(chat_id, message, markup)
+        return self._fan_out(
+            lambda message: self._edit_one(message[0], message[1], text, priority),
+            messages,
+        )
 
-    def send_chat_action(self, chat_id: int, action: str) -> Json:
+    def send_chat_action(
+        self, chat_id: int, action: str, priority: Priority = Priority.FOLLOW_UP
+    ) -> Json:
         json = {
             "chat_id": chat_id,
             "action": action,
         }
-        return self.api.send_chat_action(json)
+        return self._send(priority, chat_id, self.api.send_chat_action, json)
 
-    def delete_message(self, chat_id: int, message_id: int) -> Json:
+    def delete_message(
+        self, chat_id: int, message_id: int, priority: Priority = Priority.FOLLOW_UP
+    ) -> Json:
         json = {
             "chat_id": chat_id,
             "message_id": message_id,
         }
-        return self.api.delete_message(json)
+        return self._send(priority, chat_id, self.api.delete_message, json)
 
     def answer_callback_query(
         self,
-        callback_query_id: int,
+        callback_query_id: str,
         text: Union[str, None] = None,
         show_alert: bool = False,
     ) -> Json:
-        json = {
-            "callback_query_id": callback_query_id,
-            "show_alert": show_alert,
-        }
-        if text:
-            json["text"] = text  # type: ignore
+        json = callback_answer_payload(callback_query_id, text, show_alert)
         return self.api.answer_callback_query(json)
 
     def edit_message_text(
@@ -257,47 +490,194 @@ class TelegramBot:
         message_id: int,
         text: str,
         parse_mode: Union[str, None] = None,
+        priority: Priority = Priority.FOLLOW_UP,
     ) -> Json:
-        json = {
-            "chat_id": chat_id,
-            "message_id": message_id,
-            "text": text,
-        }
-        if parse_mode:
-            json["parse_mode"] = parse_mode
-        return self.api.edit_message_text(json)
+        json = edit_text_payload(chat_id, message_id, text, parse_mode)
+        return self._send(priority, chat_id, self.api.edit_message_text, json)
 
     def edit_message_reply_markup(
         self,
         chat_id: int,
         message_id: int,
-        reply_markup: Union[str, None] = None,
+        reply_markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
     ) -> Json:
         json = {
             "chat_id": chat_id,
             "message_id": message_id,
             "reply_markup": reply_markup,
         }
-        return self.api.edit_message_reply_markup(json)
+        return self._send(priority, chat_id, self.api.edit_message_reply_markup, json)
 
     def set_webhook(self, webhook_url: str) -> Json:
         return self.api.set_webhook(webhook_url)
 
-    def delete_webhook(self) -> Json:
-        return self.api.delete_webhook()
+    def delete_webhook(self, drop_pending_updates: bool = True) -> Json:
+        return self.api.delete_webhook(drop_pending_updates)
+
+    def get_updates(
+        self,
+        offset: Union[int, None] = None,
+        limit: int = 100,
+        timeout: int = 30,
+        allowed_updates: Union[List[str], None] = None,
+    ) -> Json:
+        """Receives a batch of incoming updates using long polling.
+
+        Refer to Telegram API for necessary parameters.
+        https://core.telegram.org/bots/api#getupdates
+
+        Args:
+            offset (int, optional): identifier of the first update to return.
+                Every update with a lower identifier is confirmed. Defaults to
+                None.
+            limit (int, optional): maximum number of updates, 1-100. Defaults
+                to 100.
+            timeout (int, optional): seconds to wait for an update. Defaults to
+                30.
+            allowed_updates (List[str], optional): update types to receive.
+                Defaults to None.
+
+        Returns:
+            Json: response from telegram api.
+        """
+        json = dict(
+            offset=offset,
+            limit=limit,
+            timeout=timeout,
+            allowed_updates=allowed_updates,
+        )
+        return self.api.get_updates({k: v for k, v in json.items() if v is not None})
 
     def get_me(self) -> Json:
         return self.api.get_me()
 
 
+class BlockingBot:
+    def __init__(self, telegram_bot: TelegramBot) -> None:
+        """`Bot` of a sync worker, on a `TelegramBot`.
+
+        Every method calls `telegram_bot` right away and blocks, so the
+        coroutines of the handlers never suspend and `run_sync` runs them to
+        completion on the calling thread.
+
+        Args:
+            telegram_bot (TelegramBot): bot the calls are made with.
+        """
+        self.bot = telegram_bot
+
+    async def send_message(
+        self,
+        chat_id: int,
+        msg: str,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        return self.bot.send_message(chat_id, msg, markup, priority)
+
+    async def send_photo(
+        self,
+        chat_id: int,
+        photo_url: str,
+        priority: Priority = Priority.FOLLOW_UP,
+        media_key: Union[str, None] = None,
+    ) -> Json:
+        return self.bot.send_photo(chat_id, photo_url, priority, media_key)
+
+    async def send_poll(
+        self,
+        chat_id: int,
+        question: str,
+        options: List[str],
+        allows_multiple_answers: bool = False,
+        open_period: int = 600,
+        is_anonymous: bool = True,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+        *,
+        protect_content: bool = False,
+    ) -> Json:
+        return self.bot.send_poll(
+            chat_id,
+            question,
+            options,
+            allows_multiple_answers,
+            open_period,
+            is_anonymous,
+            markup,
+            priority,
+            protect_content=protect_content,
+        )
+
+    async def answer_callback_query(
+        self,
+        callback_query_id: str,
+        text: Union[str, None] = None,
+        show_alert: bool = False,
+    ) -> Json:
+        return self.bot.answer_callback_query(callback_query_id, text, show_alert)
+
+    async def edit_message_text(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        parse_mode: Union[str, None] = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        return self.bot.edit_message_text(
+            chat_id, message_id, text, parse_mode, priority
+        )
+
+    async def edit_message_reply_markup(
+        self,
+        chat_id: int,
+        message_id: int,
+        reply_markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        return self.bot.edit_message_reply_markup(
+            chat_id, message_id, reply_markup, priority
+        )
+
+    async def broadcast(
+        self,
+        message: str,
+        chat_ids: List[int],
+        markup: Markup = None,
+        priority: Priority = Priority.ALERT,
+    ) -> List[Json]:
+        return self.bot.broadcast(message, chat_ids, markup, priority)
+
+    async def edit_messages(
+        self,
+        text: str,
+        messages: List[Tuple[int, int]],
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> List[Json]:
+        return self.bot.edit_messages(text, messages, priority)
+
+    async def offload(self, func: Callable[..., T], *args: Any) -> T:
+        return func(*args)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> None:
+        threading.Thread(target=run_sync, args=(coro,), daemon=True).start()
+
+
 def inline_button_with_callback(
-    text: str, callback_command: str, callback_value: str
+    text: str,
+    callback_command: str,
+    callback_value: str,
+    callback_id: Union[str, None] = None,
 ) -> Json:
     a = dict(
         text=text,
-        callback_data=json.dumps(dict(command=callback_command, value=callback_value)),
+        callback_data=encode_callback_data(
+            callback_command, callback_value, callback_id
+        ),
     )
     return a
 
 
-bot = TelegramBot(TELEGRAM_BOT_TOKEN)
+bot = TelegramBot()
+blocking_bot = BlockingBot(bot)
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    List,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from src.config import TELEGRAM_BROADCAST_WORKERS
+from src.metrics import BROADCAST_LATENCY, BROADCAST_MESSAGES, TELEGRAM_LATENCY
+from src.rest import Json
+from src.telegram import TelegramApiBase
+from src.telegram.media import MediaCache, media_cache, photo_file_id
+from src.telegram.outbox import Outbox, Priority
+from src.telegram.outbox import outbox as default_outbox
+from src.telegram.protocol import (
+    Markup,
+    broadcast_result,
+    callback_answer_payload,
+    edit_result,
+    edit_text_payload,
+    message_payload,
+    message_result,
+    poll_payload,
+)
+from src.telegram.ratelimit import TokenBucket
+from src.telegram.transport import AsyncHttpTransport, AsyncTransport
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class AsyncTelegramApi(TelegramApiBase):
+    def __init__(
+        self,
+        token: Union[str, None] = None,
+        transport: Union[AsyncTransport, None] = None,
+    ) -> None:
+        """Telegram API calls from an event loop.
+
+        Args:
+            token (str, optional): bot token. Defaults to `TELEGRAM_BOT_TOKEN`.
+            transport (AsyncTransport, optional): transport to the API.
+                Defaults to a new `AsyncHttpTransport`.
+        """
+        super().__init__(token)
+        self.transport = transport or AsyncHttpTransport()
+
+    async def call(self, method: str, json: Json) -> Json:
+        """Sends a POST request to a Telegram API method, e.g. "sendMessage".
+
+        Refer to Telegram API for necessary parameters.
+        https://core.telegram.org/bots/api#available-methods
+        """
+        with TELEGRAM_LATENCY.time(method):
+            resp = await self.transport.post(self.get_url(method), json)
+        return self._record(method, resp)
+
+
+class AsyncTelegramBot:
+    def __init__(
+        self,
+        token: Union[str, None] = None,
+        rate_limiter: Union[TokenBucket, None] = None,
+        broadcast_workers: int = TELEGRAM_BROADCAST_WORKERS,
+        transport: Union[AsyncTransport, None] = None,
+        outbox: Union[Outbox, None] = None,
+        media: Union[MediaCache, None] = None,
+    ) -> None:
+        """`Bot` for an event loop.
+
+        Sends the same payloads as `TelegramBot` and takes send slots of the
+        same `outbox`, but awaits them, and runs its fan-outs as
+        `broadcast_workers` tasks at a time instead of threads.
+
+        Args:
+            token (str, optional): bot token. Defaults to `TELEGRAM_BOT_TOKEN`.
+            rate_limiter (TokenBucket, optional): global limit of a dedicated
+                outbox. Defaults to None.
+            broadcast_workers (int, optional): concurrent sends of a fan-out.
+                Defaults to `TELEGRAM_BROADCAST_WORKERS`.
+            transport (AsyncTransport, optional): transport to the API.
+            outbox (Outbox, optional): outbound scheduler. Defaults to the
+                process-wide `outbox`, or a new one limited by `rate_limiter`.
+            media (MediaCache, optional): `file_id`s of sent photos. Defaults
+                to the process-wide `media_cache`.
+        """
+        self.api = AsyncTelegramApi(token, transport)
+        if outbox is None:
+            outbox = Outbox(rate_limiter) if rate_limiter else default_outbox
+        self.outbox = outbox
+        self.media = media_cache if media is None else media
+        self.broadcast_workers = broadcast_workers
+        # tasks that outlive the call they were started by, see `spawn`
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    async def _send(
+        self, priority: Priority, chat_id: Union[int, None], method: str, json: Json
+    ) -> Json:
+        """Posts `json` to `method` once `outbox` grants a slot."""
+        await self.outbox.acquire_async(priority, chat_id)
+        return await self.api.call(method, json)
+
+    async def send_message(
+        self,
+        chat_id: int,
+        msg: str,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        """Sends a message to a telegram chat, see `TelegramBot.send_message`."""
+        payload = message_payload(chat_id, msg, markup)
+        resp = await self._send(priority, int(chat_id), "sendMessage", payload)
+        return message_result(resp)
+
+    async def send_photo(
+        self,
+        chat_id: int,
+        photo_url: str,
+        priority: Priority = Priority.FOLLOW_UP,
+        media_key: Union[str, None] = None,
+    ) -> Json:
+        """Sends a photo to a telegram chat, see `TelegramBot.send_photo`."""
+        key = media_key or photo_url
+        file_id = self.media.get(key)
+        if file_id:
+            json = dict(chat_id=chat_id, photo=file_id)
+            resp = await self._send(priority, chat_id, "sendPhoto", json)
+            if resp.get("ok"):
+                return resp
+            self.media.forget(key)
+        json = dict(chat_id=chat_id, photo=photo_url)
+        resp = await self._send(priority, chat_id, "sendPhoto", json)
+        file_id = photo_file_id(resp) if resp.get("ok") else None
+        if file_id:
+            self.media.set(key, file_id)
+        return resp
+
+    async def send_poll(
+        self,
+        chat_id: int,
+        question: str,
+        options: List[str],
+        allows_multiple_answers: bool = False,
+        open_period: int = 600,
+        is_anonymous: bool = True,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+        *,
+        protect_content: bool = False,
+    ) -> Json:
+        """Sends a poll to a telegram chat, see `TelegramBot.send_poll`."""
+        poll = poll_payload(
+            chat_id,
+            question,
+            options,
+            allows_multiple_answers,
+            open_period,
+            is_anonymous,
+            protect_content,
+            markup,
+        )
+        return await self._send(priority, chat_id, "sendPoll", poll)
+
+    async def answer_callback_query(
+        self,
+        callback_query_id: str,
+        text: Union[str, None] = None,
+        show_alert: bool = False,
+    ) -> Json:
+        json = callback_answer_payload(callback_query_id, text, show_alert)
+        return await self.api.call("answerCallbackQuery", json)
+
+    async def edit_message_text(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        parse_mode: Union[str, None] = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        json = edit_text_payload(chat_id, message_id, text, parse_mode)
+        return await self._send(priority, chat_id, "editMessageText", json)
+
+    async def edit_message_reply_markup(
+        self,
+        chat_id: int,
+        message_id: int,
+        reply_markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        json = dict(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+        return await self._send(priority, chat_id, "editMessageReplyMarkup", json)
+
+    async def _broadcast_one(
+        self, chat_id: int, message: str, markup: Markup, priority: Priority
+    ) -> Json:
+        started_at = monotonic()
+        resp = await self.send_message(chat_id, message, markup, priority)
+        return broadcast_result(chat_id, resp, started_at)
+
+    async def broadcast(
+        self,
+        message: str,
+        chat_ids: List[int],
+        markup: Markup = None,
+        priority: Priority = Priority.ALERT,
+    ) -> List[Json]:
+        """Broadcast Message to list of Users, see `TelegramBot.broadcast`."""
+        with BROADCAST_LATENCY.time():
+            results = await self._fan_out(
+                lambda chat_id: self._broadcast_one(chat_id, message, markup, priority),
+                chat_ids,
+            )
+        for result in results:
+            BROADCAST_MESSAGES.inc("error" if result["error"] else "ok")
+        return results
+
+    async def _fan_out(
+        self, func: Callable[[Any], Awaitable[Json]], items: List[Any]
+    ) -> List[Json]:
+        semaphore = asyncio.Semaphore(max(1, self.broadcast_workers))
+
+        async def run(item: Any) -> Json:
+            async with semaphore:
+                return await func(item)
+
+        return list(await asyncio.gather(*(run(item) for item in items)))
+
+    async def _edit_one(
+        self, chat_id: int, message_id: int, text: str, priority: Priority
+    ) -> Json:
+        resp = await self.edit_message_text(
+            chat_id, message_id, text, priority=priority
+        )
+        return edit_result(chat_id, message_id, resp)
+
+    async def edit_messages(
+        self,
+        text: str,
+        messages: List[Tuple[int, int]],
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> List[Json]:
+        """Replaces the text of many messages, see `TelegramBot.edit_messages`."""
+        return await self._fan_out(
+            lambda message: self._edit_one(message[0], message[1], text, priority),
+            messages,
+        )
+
+    async def set_webhook(self, webhook_url: str) -> Json:
+        return await self.api.call("setWebhook", {"url": webhook_url})
+
+    async def get_me(self) -> Json:
+        return await self.api.call("getMe", {})
+
+    async def offload(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.to_thread(func, *args)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self) -> None:
+        """Waits for spawned tasks and closes the connections of this loop."""
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=10)
+        await self.api.transport.aclose()
+
+
+async_bot = AsyncTelegramBot()
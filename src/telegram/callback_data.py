@@ -0,0 +1,65 @@
+import json
+from typing import Dict, Union
+
+from src.rest import Json
+
+# Telegram limits a button's callback_data to 64 bytes
+MAX_CALLBACK_DATA_BYTES = 64
+SEPARATOR = ":"
+
+COMMAND_CODES: Dict[str, str] = {
+    "gender": "g",
+    "language": "l",
+    "request": "r",
+}
+VALUE_CODES: Dict[str, Dict[str, str]] = {
+    "request": {"accept": "a", "reject": "x"},
+}
+COMMANDS = {code: command for command, code in COMMAND_CODES.items()}
+VALUES = {
+    command: {code: value for value, code in codes.items()}
+    for command, codes in VALUE_CODES.items()
+}
+
+
+def encode_callback_data(
+    command: str, value: str, callback_id: Union[str, None] = None
+) -> str:
+    """Packs a button's command, value and optional id into callback_data.
+
+    The format is `<command code>:<value code>[:<id>]`, e.g. `r:a:q1W2e3R4`
+    for accepting help request q1W2e3R4, which leaves room for an id in every
+    button.
+
+    Raises:
+        ValueError: if a part contains the separator or the result does not
+            fit in 64 bytes.
+    """
+    command_code = COMMAND_CODES.get(command, command)
+    parts = [command_code, VALUE_CODES.get(command, {}).get(value, value)]
+    if callback_id:
+        parts.append(callback_id)
+    if any(SEPARATOR in part for part in parts[:2]):
+        raise ValueError(f"callback command and value cannot contain {SEPARATOR!r}")
+    data = SEPARATOR.join(parts)
+    if len(data.encode()) > MAX_CALLBACK_DATA_BYTES:
+        raise ValueError(f"callback_data is longer than 64 bytes: {data}")
+    return data
+
+
+def decode_callback_data(data: str) -> Json:
+    """Unpacks callback_data into `command`, `value` and, if any, `id`.
+
+    Buttons sent before the compact format carry JSON, which is still read.
+    """
+    if data.startswith("{"):
+        return json.loads(data)
+    command_code, _, rest = data.partition(SEPARATOR)
+    value_code, _, callback_id = rest.partition(SEPARATOR)
+    command = COMMANDS.get(command_code, command_code)
+    callback_data = dict(
+        command=command, value=VALUES.get(command, {}).get(value_code, value_code)
+    )
+    if callback_id:
+        callback_data["id"] = callback_id
+    return callback_data
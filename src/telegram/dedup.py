@@ -0,0 +1,153 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic, time
+from typing import Any, Union
+
+logger = logging.getLogger(__name__)
+
+
+class SeenSet(ABC):
+    """Set of recently seen keys used to drop redelivered updates."""
+
+    @abstractmethod
+    def add(self, key: str) -> bool:
+        """Marks `key` as seen.
+
+        Returns:
+            bool: True if `key` had not been seen before.
+        """
+
+    @abstractmethod
+    def discard(self, key: str) -> None:
+        """Forgets `key`, so it is processed again if redelivered."""
+
+
+class LocalSeenSet(SeenSet):
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0) -> None:
+        """In-process seen set with a fixed size and a time to live.
+
+        Keys are kept in insertion order, so expired and least recently added
+        keys are evicted from the front in O(1).
+
+        Args:
+            maxsize (int, optional): maximum number of keys kept. Defaults to
+                10000.
+            ttl (float, optional): seconds a key is kept. Defaults to 3600.0.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _evict(self, now: float) -> None:
+        while self._seen:
+            key, expires_at = next(iter(self._seen.items()))
+            if expires_at > now and len(self._seen) < self.maxsize:
+                return
+            del self._seen[key]
+
+    def add(self, key: str) -> bool:
+        now = monotonic()
+        with self._lock:
+            expires_at = self._seen.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._seen.pop(key, None)
+            self._evict(now)
+            self._seen[key] = now + self.ttl
+            return True
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._seen.pop(key, None)
+
+
+class FirestoreSeenSet(SeenSet):
+    def __init__(
+        self, client: Any, collection: str = "processed_updates", ttl: float = 3600.0
+    ) -> None:
+        """Seen set shared by every worker through a Firestore collection.
+
+        `create` fails if the document exists, which makes marking a key as
+        seen atomic across processes. Documents carry an `expires_at` field
+        for a Firestore TTL policy to clean them up.
+
+        Args:
+            client (Client): Firestore client.
+            collection (str, optional): collection to store keys in. Defaults
+                to "processed_updates".
+            ttl (float, optional): seconds a key is kept. Defaults to 3600.0.
+        """
+        self.client = client
+        self.collection_name = collection
+        self.ttl = ttl
+
+    @property
+    def collection(self) -> Any:
+        return self.client.collection(self.collection_name)
+
+    def add(self, key: str) -> bool:
+        from google.api_core.exceptions import AlreadyExists
+
+        try:
+            self.collection.document(key).create(
+                dict(created_at=int(time()), expires_at=int(time() + self.ttl))
+            )
+        except AlreadyExists:
+            return False
+        return True
+
+    def discard(self, key: str) -> None:
+        self.collection.document(key).delete()
+
+
+class UpdateDeduplicator:
+    def __init__(self, local: SeenSet, shared: Union[SeenSet, None] = None) -> None:
+        """Drops Telegram updates that were already received.
+
+        Telegram redelivers an update when the webhook is slow or fails, so
+        updates are marked as seen by `update_id` when they are received. The
+        local set answers repeats cheaply; the optional shared set catches
+        redeliveries that land on another worker.
+
+        Args:
+            local (SeenSet): in-process seen set.
+            shared (SeenSet, optional): seen set shared between workers.
+                Defaults to None.
+        """
+        self.local = local
+        self.shared = shared
+
+    def is_duplicate(self, update_id: Union[int, None]) -> bool:
+        """Marks an update as seen and tells if it was seen before."""
+        if update_id is None:
+            return False
+        key = str(update_id)
+        if not self.local.add(key):
+            logger.info("dropping duplicate update %s", update_id)
+            return True
+        if self.shared is not None:
+            try:
+                if not self.shared.add(key):
+                    logger.info("dropping duplicate update %s", update_id)
+                    return True
+            except Exception:
+                logger.exception("shared seen set unavailable")
+        return False
+
+    def forget(self, update_id: Union[int, None]) -> None:
+        """Lets an update that could not be processed be redelivered."""
+        if update_id is None:
+            return
+        key = str(update_id)
+        self.local.discard(key)
+        if self.shared is not None:
+            try:
+                self.shared.discard(key)
+            except Exception:
+                logger.exception("shared seen set unavailable")
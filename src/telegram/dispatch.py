@@ -0,0 +1,140 @@
+from typing import Any, Callable, Coroutine, Dict, Tuple, Union
+
+from src.metrics import UPDATE_LATENCY, UPDATES
+from src.rest import Json
+from src.telegram import blocking_bot
+from src.telegram.handlers import (
+    CallbackQueryHandler,
+    MessageCommandTypes,
+    MessageHandler,
+    PollAnswerHandler,
+)
+from src.telegram.protocol import Bot, run_sync
+from src.telegram.update import (
+    MESSAGE_TYPES,
+    TelegramBotUpdate,
+    TelegramBotUpdateTypes,
+)
+
+Handler = Callable[[TelegramBotUpdate], Coroutine[Any, Any, Union[Json, None]]]
+RouteKey = Tuple[Union[str, None], Union[str, None]]
+
+LOCATION = "location"
+
+
+class Dispatcher:
+    def __init__(self) -> None:
+        """Routes updates to registered handlers with a dict lookup.
+
+        Every update maps to a (type, key) route: the text of a message (or
+        `LOCATION` for a shared location) or the command of a callback query.
+        Handlers are coroutines, registered with decorators, e.g.
+
+            @dispatcher.command("/start")
+            async def start(update): ...
+
+        or by calling the decorator on a bound method. `dispatch` returns the
+        coroutine of the handler, which the caller runs.
+        """
+        self._routes: Dict[RouteKey, Handler] = {}
+        self._fallback: Union[Handler, None] = None
+
+    @staticmethod
+    def route(update: TelegramBotUpdate) -> RouteKey:
+        if update.type in MESSAGE_TYPES:
+            return update.type, LOCATION if update.location else update.text
+        if update.type == TelegramBotUpdateTypes.CALLBACK_QUERY:
+            return update.type, update.callback_data.get("command")
+        return update.type, None
+
+    def on(self, *routes: RouteKey) -> Callable[[Handler], Handler]:
+        """Registers a handler for the given (type, key) routes."""
+
+        def decorator(handler: Handler) -> Handler:
+            for route in routes:
+                self._routes[route] = handler
+            return handler
+
+        return decorator
+
+    def command(self, text: str) -> Callable[[Handler], Handler]:
+        """Registers a handler for messages with the given text, e.g. /start."""
+        return self.on((TelegramBotUpdateTypes.MESSAGE, text))
+
+    def location(self) -> Callable[[Handler], Handler]:
+        """Registers a handler for shared locations, including the edits a
+        live location is delivered as."""
+        return self.on(*((update_type, LOCATION) for update_type in MESSAGE_TYPES))
+
+    def callback(self, command: str) -> Callable[[Handler], Handler]:
+        """Registers a handler for callback queries of the given command."""
+        return self.on((TelegramBotUpdateTypes.CALLBACK_QUERY, command))
+
+    def on_type(self, update_type: str) -> Callable[[Handler], Handler]:
+        """Registers a handler for every update of a type without route keys,
+        e.g. poll answers."""
+        return self.on((update_type, None))
+
+    def fallback(self, handler: Handler) -> Handler:
+        """Registers the handler of updates of types without any route."""
+        self._fallback = handler
+        return handler
+
+    def dispatch(
+        self, update: TelegramBotUpdate
+    ) -> Union[Coroutine[Any, Any, Union[Json, None]], None]:
+        handler = self._routes.get(self.route(update))
+        if handler is not None:
+            return handler(update)
+        if update.type in MESSAGE_TYPES + (TelegramBotUpdateTypes.CALLBACK_QUERY,):
+            return None
+        return self._fallback(update) if self._fallback else None
+
+
+def build_dispatcher(bot: Bot) -> Dispatcher:
+    """Routes of the bot's handlers, replying with `bot`."""
+    message_handler = MessageHandler(bot)
+    callback_query_handler = CallbackQueryHandler(bot)
+    poll_answer_handler = PollAnswerHandler(bot)
+
+    dispatcher = Dispatcher()
+    dispatcher.location()(message_handler.location)
+    dispatcher.command(MessageCommandTypes.START)(message_handler.start)
+    dispatcher.callback("gender")(callback_query_handler.gender_preference)
+    dispatcher.callback("language")(callback_query_handler.language_preference)
+    dispatcher.callback("request")(callback_query_handler.accept_volunteer)
+    dispatcher.on_type(TelegramBotUpdateTypes.POLL_ANSWER)(
+        poll_answer_handler.language_preference
+    )
+    dispatcher.fallback(message_handler.unhandled)
+    return dispatcher
+
+
+dispatcher = build_dispatcher(blocking_bot)
+
+
+def dispatch(update: TelegramBotUpdate) -> Union[Json, None]:
+    """Routes a Telegram Bot Update to its handler and runs it on the
+    calling thread.
+
+    Args:
+        update (TelegramBotUpdate): update to handle.
+
+    Returns:
+        Union[Json, None]: the handler's response, if any.
+    """
+    UPDATES.inc(update.type)
+    with UPDATE_LATENCY.time(update.type):
+        handling = dispatcher.dispatch(update)
+        return run_sync(handling) if handling is not None else None
+
+
+async def dispatch_async(
+    dispatcher: Dispatcher, update: TelegramBotUpdate
+) -> Union[Json, None]:
+    """Routes a Telegram Bot Update to its handler and awaits it, e.g. on
+    a dispatcher of `AsyncTelegramBot`."""
+    UPDATES.inc(update.type)
+    with UPDATE_LATENCY.time(update.type):
+        handling = dispatcher.dispatch(update)
+        return await handling if handling is not None else None
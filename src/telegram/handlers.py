@@ -1,106 +1,251 @@
+import logging
 from time import time
+from typing import Union
 
 from src.constants import Message
-from src.firebase import db
+from src.escalation import escalations
+from src.firebase import available_index, volunteers
+from src.help_requests import help_requests
 from src.rest import Json
-from src.telegram import TelegramBot, bot
-from src.telegram.update import TelegramBotUpdate
+from src.security_images import DEFAULT_ICON, icon_url
+from src.telegram.outbox import Priority
+from src.telegram.protocol import Bot
+from src.telegram.update import TelegramBotUpdate, TelegramBotUpdateTypes
 from src.telegram.volunteers import (
     GenderPreference,
     LanguagePreference,
     OnboardingState,
+    accepted_request_message,
     request_volunteer_gender,
     request_volunteer_language,
+    request_volunteer_location,
+    retract_broadcast,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class MessageCommandTypes:
     START = "/start"
 
 
 class MessageHandler:
-    def __init__(self, bot: TelegramBot):
+    def __init__(self, bot: Bot):
+        """Handlers of messages.
+
+        Like every handler they are coroutines of `bot` calls, so the same
+        code runs on an event loop with `AsyncTelegramBot` and in a sync
+        worker with `BlockingBot`. Repository calls are blocking and go
+        through `bot.offload`.
+        """
         self.bot = bot
 
-    def start(self, update: TelegramBotUpdate) -> Json:
+    async def start(self, update: TelegramBotUpdate) -> Union[Json, None]:
         username = update.username
-        doc_ref = db.collection("users").document(username)
-        doc = doc_ref.get()
-        if doc.exists:
-            return self.bot.send_message(
-                update.chat_id,
-                Message.START_BOT_USER_ALREADY_EXIST,
-            )
-        first_name = update.first_name
         chat_id = update.chat_id
-        doc_ref.set(
+        if not username or chat_id is None:
+            return None
+        created = await self.bot.offload(
+            volunteers.create,
+            username,
             dict(
                 username=username,
-                first_name=first_name,
+                first_name=update.first_name,
                 chat_id=chat_id,
                 available=False,
                 onboarding_state=OnboardingState.NEW.value,
                 created_at=int(time()),
                 updated_at=int(time()),
+            ),
+        )
+        if not created:
+            return await self.bot.send_message(
+                chat_id,
+                Message.START_BOT_USER_ALREADY_EXIST,
+                priority=Priority.ONBOARDING,
             )
+        return await request_volunteer_gender(chat_id, self.bot)
+
+    async def location(self, update: TelegramBotUpdate) -> Union[Json, None]:
+        """Stores the volunteer's last-known location.
+
+        A live location is sent once as a message and then keeps updating as
+        edits of that message, which are stored without replying.
+        """
+        username = update.username
+        chat_id = update.chat_id
+        location = update.location
+        if not username or chat_id is None or not location:
+            return None
+        fields = dict(
+            location=dict(
+                lat=float(location["latitude"]),
+                long=float(location["longitude"]),
+                updated_at=int(time()),
+            ),
+            updated_at=int(time()),
+        )
+        await self.bot.offload(volunteers.update, username, fields)
+        available_index.update(username, fields)
+        if update.type == TelegramBotUpdateTypes.EDITED_MESSAGE:
+            return None
+        return await self.bot.send_message(
+            chat_id,
+            Message.LOCATION_UPDATED,
+            markup=dict(remove_keyboard=True),
+            priority=Priority.ONBOARDING,
         )
-        return request_volunteer_gender(chat_id)
+
+    async def unhandled(self, update: TelegramBotUpdate) -> Union[Json, None]:
+        logger.info("Unhandled Update Type: %s", update.type)
+        if update.is_private and update.chat_id is not None:
+            return await self.bot.send_message(
+                update.chat_id,
+                "Invalid input, please try again.",
+                priority=Priority.ONBOARDING,
+            )
+        return None
 
 
 class CallbackQueryHandler:
-    def __init__(self, bot: TelegramBot):
+    def __init__(self, bot: Bot):
         self.bot = bot
 
-    def gender_preference(self, update: TelegramBotUpdate) -> Json:
-        callback_data = update.callback_data
+    async def gender_preference(self, update: TelegramBotUpdate) -> Union[Json, None]:
         username = update.username
-        doc_ref = db.collection("users").document(username)
-        doc_ref.update(
+        chat_id = update.chat_id
+        if not username or chat_id is None or update.callback_query_id is None:
+            return None
+        await self.bot.offload(
+            volunteers.update,
+            username,
             dict(
-                gender=GenderPreference(callback_data.get("value")).value,
+                gender=GenderPreference(update.callback_data["value"]).value,
                 updated_at=int(time()),
-            )
+            ),
         )
-        bot.answer_callback_query(update.callback_query_id)
-        return request_volunteer_language(update.chat_id)
+        await self.bot.answer_callback_query(update.callback_query_id)
+        return await request_volunteer_language(chat_id, self.bot)
 
-    def language_preference(self, update: TelegramBotUpdate) -> Json:
-        callback_data = update.callback_data
+    async def language_preference(self, update: TelegramBotUpdate) -> Union[Json, None]:
         username = update.username
-        doc_ref = db.collection("users").document(username)
-        doc_ref.update(
-            dict(
-                available=True,
-                language=LanguagePreference(callback_data.get("value")).value,
-                updated_at=int(time()),
-            )
+        chat_id = update.chat_id
+        if not username or chat_id is None or update.callback_query_id is None:
+            return None
+        fields = dict(
+            available=True,
+            language=LanguagePreference(update.callback_data["value"]).value,
+            updated_at=int(time()),
         )
-        bot.answer_callback_query(update.callback_query_id)
-        return self.bot.send_message(
-            update.chat_id,
+        await self.bot.offload(volunteers.update, username, fields)
+        available_index.update(
+            username,
+            dict(fields, username=username, chat_id=chat_id),
+        )
+        await self.bot.answer_callback_query(update.callback_query_id)
+        await self.bot.send_message(
+            chat_id,
             Message.ONBOARD_SUCCESS.format(username),
+            priority=Priority.ONBOARDING,
         )
+        return await request_volunteer_location(chat_id, self.bot)
 
-    def accept_volunteer(self, update: TelegramBotUpdate) -> Json:
+    async def accept_volunteer(self, update: TelegramBotUpdate) -> Union[Json, None]:
         callback_data = update.callback_data
+        if callback_data.get("value") == "reject":
+            return await self.decline_request(update)
+
         username = update.username
-        doc_ref = db.collection("users").document(username)
-        doc_ref.update(
-            dict(
-                available=False,
-                updated_at=int(time()),
+        chat_id = update.chat_id
+        message_id = update.message_id
+        callback_query_id = update.callback_query_id
+        if (
+            not username
+            or chat_id is None
+            or message_id is None
+            or callback_query_id is None
+        ):
+            return None
+        request_id = callback_data.get("id")
+        request = None
+        if request_id:
+            # first accept wins, everybody else's alert is retracted
+            request = await self.bot.offload(
+                help_requests.claim, request_id, username, chat_id
             )
+            if request is None:
+                await self.bot.answer_callback_query(
+                    callback_query_id,
+                    text=Message.REQUEST_ALREADY_TAKEN,
+                    show_alert=True,
+                )
+                return await self.bot.edit_message_text(
+                    chat_id, message_id, Message.BROADCAST_ACCEPTED
+                )
+            escalations.cancel(request_id)
+            retract_broadcast(request, self.bot)
+            await self.bot.edit_message_reply_markup(
+                chat_id, message_id, dict(inline_keyboard=[])
+            )
+
+        fields = dict(
+            available=False,
+            updated_at=int(time()),
         )
-        bot.answer_callback_query(update.callback_query_id)
-        self.bot.send_message(
-            update.chat_id,
-            Message.ACCEPTED_REQUEST,
+        await self.bot.offload(volunteers.update, username, fields)
+        available_index.update(username, fields)
+        await self.bot.answer_callback_query(callback_query_id)
+        await self.bot.send_message(
+            chat_id,
+            await self.bot.offload(accepted_request_message, request),
         )
-        return self.bot.send_photo(
-            update.chat_id,
-            photo_url="https://firebasestorage.googleapis.com/v0/b/fleshid-dc8ed.appspot.com/o/microbit-duck.png?alt=media",
+        # the security image the PWID's device shows, sent by file_id once known
+        icon = (request or {}).get("security_image") or DEFAULT_ICON
+        return await self.bot.send_photo(chat_id, icon_url(icon), media_key=icon)
+
+    async def decline_request(self, update: TelegramBotUpdate) -> Union[Json, None]:
+        chat_id = update.chat_id
+        message_id = update.message_id
+        if chat_id is None or message_id is None or update.callback_query_id is None:
+            return None
+        await self.bot.answer_callback_query(update.callback_query_id)
+        return await self.bot.edit_message_text(
+            chat_id, message_id, Message.REQUEST_DECLINED
         )
 
 
-message_handler = MessageHandler(bot)
-callback_query_handler = CallbackQueryHandler(bot)
+class PollAnswerHandler:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+
+    async def language_preference(self, update: TelegramBotUpdate) -> Union[Json, None]:
+        """Stores the languages chosen in the poll sent by
+        `request_volunteer_language` and completes onboarding.
+
+        The options are `LanguagePreference` in order. A retracted vote has no
+        options and is ignored.
+        """
+        options = list(LanguagePreference)
+        languages = [
+            options[i].value for i in update.option_ids if 0 <= i < len(options)
+        ]
+        username = update.username
+        chat_id = update.user_id
+        if not languages or not username or chat_id is None:
+            return None
+        fields = dict(
+            available=True,
+            language=languages[0] if len(languages) == 1 else languages,
+            updated_at=int(time()),
+        )
+        await self.bot.offload(volunteers.update, username, fields)
+        available_index.update(
+            username,
+            dict(fields, username=username, chat_id=chat_id),
+        )
+        await self.bot.send_message(
+            chat_id,
+            Message.ONBOARD_SUCCESS.format(username),
+            priority=Priority.ONBOARDING,
+        )
+        return await request_volunteer_location(chat_id, self.bot)
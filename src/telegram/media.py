@@ -0,0 +1,110 @@
+import hashlib
+import logging
+import threading
+from time import time
+from typing import TYPE_CHECKING, Any, Dict, Union
+
+from src.config import MEDIA_CACHE_BACKEND
+from src.firebase import db
+from src.metrics import MEDIA_CACHE
+from src.rest import Json
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import CollectionReference
+
+logger = logging.getLogger(__name__)
+
+
+def photo_file_id(resp: Json) -> Union[str, None]:
+    """Returns the `file_id` of the largest size of a sent photo, if any."""
+    result = resp.get("result")
+    photo = result.get("photo") if isinstance(result, dict) else None
+    if not photo:
+        return None
+    return max(photo, key=lambda size: size.get("width", 0)).get("file_id")
+
+
+class MediaCache:
+    def __init__(self, client: Any = None, collection: str = "telegram_media") -> None:
+        """`file_id`s of media the bot has sent, keyed by their source.
+
+        Telegram keeps every file a bot sends and returns its `file_id`.
+        Sending that id instead of the file's URL saves Telegram fetching the
+        file again. Keys are a source URL or a name, e.g. of a security image.
+
+        With a Firestore `client` the ids are also stored in `collection`, one
+        document per key, so they survive restarts and are shared between
+        workers. They are read once, on first use.
+
+        Example doc (id = sha1 of `key`):
+            {
+                "key": "SMILE",
+                "file_id": "AgACAgUAAxkDAAIB...",
+                "updated_at": 1679475161
+            }
+
+        Args:
+            client (Client, optional): Firestore client. Defaults to None,
+                keeping the ids in memory only.
+            collection (str, optional): collection of ids. Defaults to
+                "telegram_media".
+        """
+        self.client = client
+        self.collection_name = collection
+        self._file_ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.loaded = client is None
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+    @property
+    def collection(self) -> "CollectionReference":
+        return self.client.collection(self.collection_name)
+
+    @staticmethod
+    def _doc_id(key: str) -> str:
+        # URLs contain slashes, which document ids may not
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def load(self) -> None:
+        """Reads the stored ids, once."""
+        if self.loaded:
+            return
+        docs = [doc.to_dict() or {} for doc in self.collection.stream()]
+        with self._lock:
+            if self.loaded:
+                return
+            for doc in docs:
+                if doc.get("key") and doc.get("file_id"):
+                    self._file_ids.setdefault(doc["key"], doc["file_id"])
+            self.loaded = True
+        logger.info("media cache loaded with %d file ids", len(docs))
+
+    def get(self, key: str) -> Union[str, None]:
+        self.load()
+        file_id = self._file_ids.get(key)
+        MEDIA_CACHE.inc("hit" if file_id else "miss")
+        return file_id
+
+    def set(self, key: str, file_id: str) -> None:
+        with self._lock:
+            if self._file_ids.get(key) == file_id:
+                return
+            self._file_ids[key] = file_id
+        if self.client is not None:
+            self.collection.document(self._doc_id(key)).set(
+                dict(key=key, file_id=file_id, updated_at=int(time()))
+            )
+
+    def forget(self, key: str) -> None:
+        """Drops an id Telegram rejected, e.g. one of another bot."""
+        with self._lock:
+            if self._file_ids.pop(key, None) is None:
+                return
+        MEDIA_CACHE.inc("rejected")
+        if self.client is not None:
+            self.collection.document(self._doc_id(key)).delete()
+
+
+media_cache = MediaCache(db if MEDIA_CACHE_BACKEND == "firestore" else None)
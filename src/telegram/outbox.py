@@ -0,0 +1,305 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+from enum import IntEnum
+from time import monotonic
+from typing import Callable, Dict, List, Tuple, Union
+
+from src.config import (
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_CHAT_RATE_LIMIT,
+    TELEGRAM_GLOBAL_RATE_LIMIT,
+)
+from src.metrics import OUTBOX_DEPTH, OUTBOX_WAIT
+from src.rest import Json
+from src.telegram.ratelimit import TokenBucket
+
+# at most this many per-chat buckets are kept before idle ones are dropped
+MAX_CHAT_BUCKETS = 10000
+
+
+class Priority(IntEnum):
+    """Classes of outbound messages, most urgent first."""
+
+    ALERT = 0
+    FOLLOW_UP = 1
+    ONBOARDING = 2
+
+
+class _Waiter:
+    __slots__ = ("priority", "chat_id", "enqueued_at", "grant", "cancelled")
+
+    def __init__(
+        self, priority: Priority, chat_id: Union[int, None], grant: Callable[[], None]
+    ) -> None:
+        self.priority = priority
+        self.chat_id = chat_id
+        self.enqueued_at = monotonic()
+        self.grant = grant
+        self.cancelled = False
+
+
+class Outbox:
+    def __init__(
+        self,
+        global_limiter: Union[TokenBucket, None] = None,
+        chat_rate: float = TELEGRAM_CHAT_RATE_LIMIT,
+        chat_burst: float = TELEGRAM_CHAT_BURST,
+    ) -> None:
+        """Priority scheduler of outbound Telegram messages.
+
+        Every message takes a send slot before it is posted. A slot needs a
+        token of `global_limiter`, shared by all chats, and one of the chat's
+        own bucket, so a chat gets `chat_rate` messages per second after a
+        burst of `chat_burst`. When nothing waits and both tokens are there
+        the slot is taken at once; otherwise the caller waits and a scheduler
+        thread hands out slots in `Priority` order, oldest first within a
+        class. A message held back by its chat's limit doesn't hold back the
+        messages to other chats.
+
+        Callers post their message themselves once they hold a slot, so
+        blocking threads and event loop tasks can share one outbox.
+
+        The scheduler is started lazily in each process, so the outbox can be
+        created at import time before gunicorn forks.
+
+        Args:
+            global_limiter (TokenBucket, optional): limit across all chats.
+                Defaults to `TELEGRAM_GLOBAL_RATE_LIMIT` messages per second.
+            chat_rate (float, optional): messages per second to one chat.
+                Defaults to `TELEGRAM_CHAT_RATE_LIMIT`.
+            chat_burst (float, optional): messages one chat may get at once.
+                Defaults to `TELEGRAM_CHAT_BURST`.
+        """
+        self.global_limiter = global_limiter or TokenBucket(TELEGRAM_GLOBAL_RATE_LIMIT)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        # waiting messages as (priority, sequence, waiter)
+        self._waiting: List[Tuple[int, int, _Waiter]] = []
+        self._chats: Dict[int, TokenBucket] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Union[threading.Thread, None] = None
+        self._pid: Union[int, None] = None
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self.sent = {priority: 0 for priority in Priority}
+        self.total_wait = {priority: 0.0 for priority in Priority}
+        self.max_wait = {priority: 0.0 for priority in Priority}
+
+    def start(self) -> None:
+        """Starts the scheduler unless it already runs in this process."""
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid == os.getpid():
+                return
+            # waiters inherited through fork() belong to the parent's threads
+            self._waiting = []
+            self._chats = {}
+            self._reset_stats()
+            self._thread = threading.Thread(
+                target=self._run, name="telegram-outbox", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def acquire(
+        self, priority: Priority = Priority.FOLLOW_UP, chat_id: Union[int, None] = None
+    ) -> float:
+        """Blocks until a message to `chat_id` may be sent.
+
+        Args:
+            priority (Priority, optional): class of the message. Defaults to
+                `Priority.FOLLOW_UP`.
+            chat_id (int, optional): recipient chat, None for calls that are
+                only globally limited. Defaults to None.
+
+        Returns:
+            float: seconds waited.
+        """
+        granted = threading.Event()
+        waiter = self._enqueue(priority, chat_id, granted.set)
+        if waiter is not None:
+            granted.wait()
+            return monotonic() - waiter.enqueued_at
+        return 0.0
+
+    async def acquire_async(
+        self, priority: Priority = Priority.FOLLOW_UP, chat_id: Union[int, None] = None
+    ) -> float:
+        """Waits without blocking the event loop until a message to `chat_id`
+        may be sent, see `acquire`."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def set_granted() -> None:
+            if granted.done():
+                return
+            granted.set_result(None)
+
+        def grant() -> None:
+            try:
+                loop.call_soon_threadsafe(set_granted)
+            except RuntimeError:
+                # the loop was closed while the message waited
+                pass
+
+        waiter = self._enqueue(priority, chat_id, grant)
+        if waiter is None:
+            return 0.0
+        try:
+            await granted
+        except asyncio.CancelledError:
+            waiter.cancelled = True
+            raise
+        return monotonic() - waiter.enqueued_at
+
+    def _enqueue(
+        self,
+        priority: Priority,
+        chat_id: Union[int, None],
+        grant: Callable[[], None],
+    ) -> Union[_Waiter, None]:
+        """Takes a slot at once if possible, otherwise queues a waiter.
+
+        Returns:
+            Union[_Waiter, None]: the queued waiter, None if the slot was
+                taken.
+        """
+        priority = Priority(priority)
+        self.start()
+        with self._condition:
+            if not self._waiting and not self._take(chat_id):
+                self._record(priority, 0.0)
+                return None
+            waiter = _Waiter(priority, chat_id, grant)
+            heapq.heappush(self._waiting, (priority, next(self._sequence), waiter))
+            OUTBOX_DEPTH.inc(priority.name.lower())
+            self._condition.notify()
+            return waiter
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._drop_idle_buckets()
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _drop_idle_buckets(self) -> None:
+        # a full bucket behaves like a new one
+        self._chats = {
+            chat_id: bucket
+            for chat_id, bucket in self._chats.items()
+            if bucket.available_in(bucket.capacity)
+        }
+
+    def _take(self, chat_id: Union[int, None]) -> float:
+        """Takes the global and the chat's token if both are there.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds
+                to wait before retrying.
+        """
+        bucket = None if chat_id is None else self._chat_bucket(chat_id)
+        wait = bucket.available_in() if bucket else 0.0
+        if wait:
+            return wait
+        wait = self.global_limiter.try_acquire()
+        if wait:
+            return wait
+        if bucket:
+            bucket.try_acquire()
+        return 0.0
+
+    def _record(self, priority: Priority, wait: float) -> None:
+        self.sent[priority] += 1
+        self.total_wait[priority] += wait
+        self.max_wait[priority] = max(self.max_wait[priority], wait)
+        OUTBOX_WAIT.observe(wait, priority.name.lower())
+
+    def _pop_ready(self) -> Tuple[Union[_Waiter, None], float]:
+        """Takes the slot of the most urgent waiter whose chat may get a
+        message.
+
+        Returns:
+            Tuple[Union[_Waiter, None], float]: the waiter, or None and the
+                number of seconds until one may be ready.
+        """
+        wait = self.global_limiter.available_in()
+        if wait:
+            return None, wait
+        skipped = []
+        ready = None
+        wait = float("inf")
+        while self._waiting:
+            entry = heapq.heappop(self._waiting)
+            waiter = entry[2]
+            if waiter.cancelled:
+                OUTBOX_DEPTH.dec(waiter.priority.name.lower())
+                continue
+            chat_wait = self._take(waiter.chat_id)
+            if not chat_wait:
+                ready = waiter
+                break
+            skipped.append(entry)
+            wait = min(wait, chat_wait)
+        for entry in skipped:
+            heapq.heappush(self._waiting, entry)
+        return ready, wait
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if not self._waiting:
+                        self._condition.wait()
+                        continue
+                    waiter, wait = self._pop_ready()
+                    if waiter is not None:
+                        break
+                    self._condition.wait(wait)
+                OUTBOX_DEPTH.dec(waiter.priority.name.lower())
+                self._record(waiter.priority, monotonic() - waiter.enqueued_at)
+            waiter.grant()
+
+    def depth(self) -> Dict[Priority, int]:
+        """Number of waiting messages by priority."""
+        with self._condition:
+            depth = {priority: 0 for priority in Priority}
+            for priority, _, waiter in self._waiting:
+                if not waiter.cancelled:
+                    depth[Priority(priority)] += 1
+            return depth
+
+    def stats(self) -> Json:
+        """Returns queue depth, throughput and wait time statistics by
+        priority."""
+        depth = self.depth()
+        return dict(
+            global_rate=self.global_limiter.rate,
+            chat_rate=self.chat_rate,
+            chat_burst=self.chat_burst,
+            depth=sum(depth.values()),
+            priorities={
+                priority.name.lower(): dict(
+                    depth=depth[priority],
+                    sent=self.sent[priority],
+                    avg_wait=(
+                        self.total_wait[priority] / self.sent[priority]
+                        if self.sent[priority]
+                        else 0.0
+                    ),
+                    max_wait=self.max_wait[priority],
+                )
+                for priority in Priority
+            },
+        )
+
+
+outbox = Outbox()
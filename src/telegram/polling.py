@@ -0,0 +1,118 @@
+import logging
+import threading
+from typing import Any, Callable, Union
+
+from src.telegram import TelegramBot
+from src.telegram.dedup import UpdateDeduplicator
+from src.telegram.update import TelegramBotUpdate
+from src.telegram.update_queue import UpdateQueue
+
+logger = logging.getLogger(__name__)
+
+
+class UpdatePoller:
+    def __init__(
+        self,
+        bot: TelegramBot,
+        handler: Callable[[TelegramBotUpdate], Any],
+        deduplicator: Union[UpdateDeduplicator, None] = None,
+        update_queue: Union[UpdateQueue, None] = None,
+        limit: int = 100,
+        timeout: int = 30,
+    ) -> None:
+        """Pulls updates with getUpdates long polling instead of a webhook.
+
+        Updates are pulled in batches of up to `limit` and every batch is
+        processed before its offset is committed with the next getUpdates
+        call, so an update is only confirmed to Telegram once it has been
+        handled.
+
+        Args:
+            bot (TelegramBot): bot to poll updates for.
+            handler (Callable[[TelegramBotUpdate], Any]): handles one update,
+                normally the same dispatch used by the webhook.
+            deduplicator (UpdateDeduplicator, optional): drops updates that
+                were already received. Defaults to None.
+            update_queue (UpdateQueue, optional): processes the updates of a
+                batch concurrently while keeping per chat order. Defaults to
+                None, handling updates one by one.
+            limit (int, optional): maximum batch size, 1-100. Defaults to 100.
+            timeout (int, optional): long polling timeout in seconds. Defaults
+                to 30.
+        """
+        self.bot = bot
+        self.handler = handler
+        self.deduplicator = deduplicator
+        self.update_queue = update_queue
+        self.limit = limit
+        self.timeout = timeout
+        self.offset: Union[int, None] = None
+        # getUpdates calls that failed in a row, see `backoff`
+        self.failures = 0
+
+    def _handle(self, update: TelegramBotUpdate) -> None:
+        try:
+            self.handler(update)
+        except Exception:
+            logger.exception("failed to process update %s", update.update_id)
+
+    def poll_once(self) -> int:
+        """Pulls and processes one batch of updates.
+
+        Returns:
+            int: number of updates in the batch.
+        """
+        resp = self.bot.get_updates(self.offset, self.limit, self.timeout)
+        if not resp.get("ok"):
+            self.failures += 1
+            logger.warning("getUpdates failed: %s", resp.get("description"))
+            return 0
+        self.failures = 0
+
+        batch = resp.get("result") or []
+        for body in batch:
+            update = TelegramBotUpdate(body)
+            if self.deduplicator and self.deduplicator.is_duplicate(update.update_id):
+                continue
+            if self.update_queue is None or not self.update_queue.submit(update):
+                self._handle(update)
+        if self.update_queue is not None:
+            self.update_queue.join()
+        if batch:
+            self.offset = batch[-1]["update_id"] + 1
+        return len(batch)
+
+    def backoff(self) -> float:
+        """Seconds to wait before the next getUpdates, doubling with every
+        failed call in a row up to 30."""
+        if not self.failures:
+            return 0
+        return min(2.0 ** (self.failures - 1), 30.0)
+
+    def commit(self) -> None:
+        """Confirms processed updates without waiting for new ones."""
+        if self.offset is not None:
+            self.bot.get_updates(self.offset, limit=1, timeout=0)
+
+    def run(self, stop: Union[threading.Event, None] = None) -> None:
+        """Polls until `stop` is set.
+
+        The webhook is removed first, without dropping pending updates, since
+        Telegram does not serve getUpdates while a webhook is set. A failed
+        getUpdates, e.g. a 409 while another poller runs, is retried after
+        `backoff`.
+        """
+        stop = stop or threading.Event()
+        self.bot.delete_webhook(drop_pending_updates=False)
+        logger.info("polling for updates")
+        try:
+            while not stop.is_set():
+                try:
+                    self.poll_once()
+                except Exception:
+                    self.failures += 1
+                    logger.exception("polling failed")
+                if self.failures:
+                    stop.wait(self.backoff())
+        finally:
+            self.commit()
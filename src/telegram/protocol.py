@@ -0,0 +1,215 @@
+"""What the update handlers and the /rasp flow need from a Telegram bot.
+
+They are written once, as coroutines against `Bot`, and run on an event loop
+with `AsyncTelegramBot`, or from a sync worker with `BlockingBot`, whose
+coroutines never suspend and are driven to completion by `run_sync`.
+
+The payloads and results of the bot methods are built here, so both bots
+send and return the same thing.
+"""
+
+from time import monotonic
+from typing import Any, Callable, Coroutine, List, Protocol, Tuple, TypeVar, Union
+
+from src.rest import Json, generate_response_json
+from src.telegram.outbox import Priority
+
+T = TypeVar("T")
+
+# reply markup of a message, e.g. dict(inline_keyboard=[...])
+Markup = Union[Json, str, None]
+
+
+class Bot(Protocol):
+    async def send_message(
+        self,
+        chat_id: int,
+        msg: str,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        """Sends a message, see `TelegramBot.send_message`."""
+
+    async def send_photo(
+        self,
+        chat_id: int,
+        photo_url: str,
+        priority: Priority = Priority.FOLLOW_UP,
+        media_key: Union[str, None] = None,
+    ) -> Json:
+        """Sends a photo by its `file_id` once known, see `TelegramBot.send_photo`."""
+
+    async def send_poll(
+        self,
+        chat_id: int,
+        question: str,
+        options: List[str],
+        allows_multiple_answers: bool = False,
+        open_period: int = 600,
+        is_anonymous: bool = True,
+        markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+        *,
+        protect_content: bool = False,
+    ) -> Json:
+        """Sends a poll, see `TelegramBot.send_poll`."""
+
+    async def answer_callback_query(
+        self,
+        callback_query_id: str,
+        text: Union[str, None] = None,
+        show_alert: bool = False,
+    ) -> Json:
+        """Answers a callback query, at once."""
+
+    async def edit_message_text(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        parse_mode: Union[str, None] = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        """Replaces the text of a message."""
+
+    async def edit_message_reply_markup(
+        self,
+        chat_id: int,
+        message_id: int,
+        reply_markup: Markup = None,
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> Json:
+        """Replaces the reply markup of a message."""
+
+    async def broadcast(
+        self,
+        message: str,
+        chat_ids: List[int],
+        markup: Markup = None,
+        priority: Priority = Priority.ALERT,
+    ) -> List[Json]:
+        """Sends a message to many chats, see `TelegramBot.broadcast`."""
+
+    async def edit_messages(
+        self,
+        text: str,
+        messages: List[Tuple[int, int]],
+        priority: Priority = Priority.FOLLOW_UP,
+    ) -> List[Json]:
+        """Replaces the text of many messages, see `TelegramBot.edit_messages`."""
+
+    async def offload(self, func: Callable[..., T], *args: Any) -> T:
+        """Runs a blocking call, e.g. to Firestore, without blocking the
+        event loop the bot runs on."""
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> None:
+        """Runs a coroutine in the background, e.g. retracting alerts while
+        the volunteer who accepted is answered."""
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """Runs a coroutine of `BlockingBot` calls to completion.
+
+    Raises:
+        RuntimeError: if the coroutine suspends, i.e. awaits an event loop.
+    """
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    coro.close()
+    raise RuntimeError("run_sync() of a coroutine that needs an event loop")
+
+
+def message_payload(chat_id: int, msg: str, markup: Markup) -> Json:
+    payload = dict(
+        chat_id=int(chat_id),
+        text=msg,
+        parse_mode="HTML",
+    )
+    if markup:
+        payload["reply_markup"] = markup
+    return payload
+
+
+def message_result(resp: Json) -> Json:
+    success = bool(resp.get("ok"))
+    if success:
+        try:
+            resp_result = resp.get("result")  # type: ignore
+            resp_chat_id = resp_result.get("chat").get("id")  # type: ignore
+            resp_message_id = resp_result.get("message_id")  # type: ignore
+            data = dict(chat_id=resp_chat_id, message_id=resp_message_id)
+        except AttributeError:
+            data = dict(error="Invalid response from telegram api")
+    else:
+        data = dict(error=resp.get("description"))
+
+    return generate_response_json(success, data)
+
+
+def poll_payload(
+    chat_id: int,
+    question: str,
+    options: List[str],
+    allows_multiple_answers: bool,
+    open_period: int,
+    is_anonymous: bool,
+    protect_content: bool,
+    markup: Markup,
+) -> Json:
+    poll = dict(
+        chat_id=chat_id,
+        question=question,
+        options=options,
+        is_anonymous=is_anonymous,
+        protect_content=protect_content or None,
+        type="regular",
+        allows_multiple_answers=allows_multiple_answers,
+        open_period=open_period,
+        reply_markup=markup,
+    )
+    return {k: v for k, v in poll.items() if v is not None}
+
+
+def callback_answer_payload(
+    callback_query_id: str, text: Union[str, None], show_alert: bool
+) -> Json:
+    json: Json = {
+        "callback_query_id": callback_query_id,
+        "show_alert": show_alert,
+    }
+    if text:
+        json["text"] = text
+    return json
+
+
+def edit_text_payload(
+    chat_id: int, message_id: int, text: str, parse_mode: Union[str, None]
+) -> Json:
+    json: Json = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "text": text,
+    }
+    if parse_mode:
+        json["parse_mode"] = parse_mode
+    return json
+
+
+def broadcast_result(chat_id: int, resp: Json, started_at: float) -> Json:
+    data = resp.get("data") or {}
+    return dict(
+        chat_id=chat_id,
+        message_id=data.get("message_id"),
+        error=data.get("error"),
+        latency=monotonic() - started_at,
+    )
+
+
+def edit_result(chat_id: int, message_id: int, resp: Json) -> Json:
+    return dict(
+        chat_id=chat_id,
+        message_id=message_id,
+        error=None if resp.get("ok") else resp.get("description"),
+    )
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from time import monotonic, sleep
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        """Thread-safe token bucket rate limiter.
+
+        Tokens are refilled continuously at `rate` tokens per second, up to
+        `capacity` tokens. Every caller of `acquire` blocks until a token is
+        available, so all threads sharing a bucket are limited together.
+
+        Args:
+            rate (float): tokens refilled per second.
+            capacity (float, optional): maximum burst size. Defaults to 1.0.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Takes `tokens` from the bucket if possible.
+
+        Args:
+            tokens (float, optional): number of tokens to take. Defaults to 1.0.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds
+                to wait before retrying.
+        """
+        with self._lock:
+            self._refill(monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def available_in(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` could be taken, without taking them."""
+        with self._lock:
+            self._refill(monotonic())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Blocks until `tokens` have been taken from the bucket."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0) -> None:
+        """Waits without blocking the event loop until `tokens` have been
+        taken from the bucket."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
@@ -0,0 +1,388 @@
+import asyncio
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from time import monotonic, sleep
+from typing import Any, Dict, FrozenSet, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from src.config import (
+    TELEGRAM_CONNECT_TIMEOUT,
+    TELEGRAM_MAX_RETRIES,
+    TELEGRAM_POOL_SIZE,
+    TELEGRAM_READ_TIMEOUT,
+)
+from src.rest import Json
+
+logger = logging.getLogger(__name__)
+
+Timeout = Tuple[float, float]
+
+# read timeouts for methods that are slower than a plain text message
+METHOD_TIMEOUTS: Dict[str, Timeout] = {
+    "sendPhoto": (TELEGRAM_CONNECT_TIMEOUT, 30.0),
+    "getUpdates": (TELEGRAM_CONNECT_TIMEOUT, 60.0),
+}
+
+# methods that change nothing visible when repeated, so a call that may have
+# reached Telegram (a read timeout or a 5xx) is sent again; sending any other
+# method twice would e.g. duplicate an alert
+IDEMPOTENT_METHODS: FrozenSet[str] = frozenset(
+    {
+        "getMe",
+        "getUpdates",
+        "setWebhook",
+        "deleteWebhook",
+        "answerCallbackQuery",
+        "editMessageText",
+        "editMessageReplyMarkup",
+    }
+)
+
+
+def error_response(description: str, error_code: int = 503) -> Json:
+    """Builds a response shaped like a failed Telegram API call."""
+    return {"ok": False, "error_code": error_code, "description": description}
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Stops calls to a failing dependency until it has had time to recover.
+
+        After `failure_threshold` consecutive failures the circuit opens and
+        `allow` returns False for `reset_timeout` seconds. Then a single trial
+        call is let through; its outcome closes or re-opens the circuit.
+
+        Args:
+            failure_threshold (int, optional): consecutive failures before the
+                circuit opens. Defaults to 5.
+            reset_timeout (float, optional): seconds to wait before a trial
+                call. Defaults to 30.0.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                return True
+            # a trial call is already in flight
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("telegram circuit opened")
+                self.state = self.OPEN
+                self._opened_at = monotonic()
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+        max_retry_after: float = 30.0,
+        circuit_breaker: Union[CircuitBreaker, None] = None,
+    ) -> None:
+        """Decides which failed Telegram API calls are retried and when.
+
+        Shared by the blocking and async transports, which only differ in how
+        they send a request and wait. Calls that never reached Telegram are
+        retried with exponential backoff, and so are 5xx responses and other
+        errors of `IDEMPOTENT_METHODS`. 429 responses are retried after their
+        `retry_after`. Every outcome is recorded on the circuit breaker.
+
+        Args:
+            max_retries (int, optional): retries after a 429, a failure to
+                connect, or a 5xx of an idempotent method.
+            max_retry_after (float, optional): longest `retry_after` worth
+                waiting for; longer waits are returned to the caller as an
+                error. Defaults to 30.0.
+            circuit_breaker (CircuitBreaker, optional): breaker shared by all
+                calls. Defaults to a new `CircuitBreaker`.
+        """
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+    def allow(self) -> bool:
+        return self.circuit_breaker.allow()
+
+    def backoff(self, attempt: int) -> float:
+        return min(0.5 * 2**attempt, 8.0)
+
+    def after_error(
+        self, method: str, attempt: int, error: Exception, sent: bool = True
+    ) -> Union[float, None]:
+        """Records a call that raised.
+
+        Args:
+            sent (bool, optional): whether the request may have reached
+                Telegram, i.e. the error was not a failure to connect.
+                Defaults to True.
+
+        Returns:
+            Union[float, None]: seconds to wait before retrying, or None to
+                give up.
+        """
+        self.circuit_breaker.record_failure()
+        logger.warning("%s :: %s: %s", method, error.__class__.__name__, error)
+        if attempt >= self.max_retries:
+            return None
+        if sent and method not in IDEMPOTENT_METHODS:
+            return None
+        return self.backoff(attempt)
+
+    def after_response(
+        self, method: str, attempt: int, status: int, resp: Json
+    ) -> Union[float, None]:
+        """Records a call that got a response.
+
+        Returns:
+            Union[float, None]: seconds to wait before retrying, or None to
+                return `resp`.
+        """
+        logger.debug("%s :: %s", method, status)
+        if status >= 500:
+            self.circuit_breaker.record_failure()
+            if attempt >= self.max_retries or method not in IDEMPOTENT_METHODS:
+                return None
+            return self.backoff(attempt)
+
+        self.circuit_breaker.record_success()
+        if status != 429:
+            return None
+        retry_after = (resp.get("parameters") or {}).get("retry_after", 1)
+        if attempt >= self.max_retries or retry_after > self.max_retry_after:
+            return None
+        logger.info("%s :: rate limited for %ss", method, retry_after)
+        return float(retry_after)
+
+
+class Transport(ABC):
+    """Interface used by `TelegramApiWrapper` to reach the Telegram API."""
+
+    @abstractmethod
+    def post(self, url: str, json: Json) -> Json:
+        """Sends a POST request to a Telegram API method url."""
+
+
+class AsyncTransport(ABC):
+    """Interface used by `AsyncTelegramApi` to reach the Telegram API."""
+
+    @abstractmethod
+    async def post(self, url: str, json: Json) -> Json:
+        """Sends a POST request to a Telegram API method url."""
+
+    async def aclose(self) -> None:
+        """Closes the connections of the running event loop."""
+
+
+def not_sent(error: Exception) -> bool:
+    """Whether a failed `requests` call surely never reached Telegram."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(
+        reason, ConnectTimeoutError
+    )
+
+
+class HttpTransport(Transport):
+    def __init__(
+        self,
+        pool_size: int = TELEGRAM_POOL_SIZE,
+        timeout: Timeout = (TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT),
+        method_timeouts: Union[Dict[str, Timeout], None] = None,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+        max_retry_after: float = 30.0,
+        circuit_breaker: Union[CircuitBreaker, None] = None,
+        session: Union[requests.Session, None] = None,
+    ) -> None:
+        """Pooled keep-alive HTTP transport for the Telegram Bot API.
+
+        Args:
+            pool_size (int, optional): connections kept alive to the API.
+            timeout (Timeout, optional): default (connect, read) timeout.
+            method_timeouts (Dict[str, Timeout], optional): per API method
+                overrides of `timeout`. Defaults to `METHOD_TIMEOUTS`.
+            max_retries (int, optional): retries after a 429, a failure to
+                connect, or a 5xx of an idempotent method, see `RetryPolicy`.
+            max_retry_after (float, optional): longest `retry_after` the
+                transport is willing to sleep for. Defaults to 30.0.
+            circuit_breaker (CircuitBreaker, optional): breaker shared by all
+                calls. Defaults to a new `CircuitBreaker`.
+            session (requests.Session, optional): session to send requests
+                with. Defaults to a pooled session per process, as kept-alive
+                connections cannot be shared with a forked child.
+        """
+        self.timeout = timeout
+        self.method_timeouts = (
+            METHOD_TIMEOUTS if method_timeouts is None else method_timeouts
+        )
+        self.retry = RetryPolicy(max_retries, max_retry_after, circuit_breaker)
+        self.pool_size = pool_size
+        self._given_session = session
+        self._session: Union[requests.Session, None] = None
+        self._session_pid = 0
+
+    @property
+    def session(self) -> requests.Session:
+        """The given session, or this process's pooled session."""
+        if self._given_session is not None:
+            return self._given_session
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    def post(self, url: str, json: Json) -> Json:
+        """Sends a POST request, retrying rate limited and failed calls.
+
+        Args:
+            url (str): Telegram API method url.
+            json (Json): request payload.
+
+        Returns:
+            Json: Telegram API response. Failures that could not be retried
+                away are returned as an `ok: false` response instead of
+                raising.
+        """
+        method = url.rsplit("/", 1)[-1]
+        timeout = self.method_timeouts.get(method, self.timeout)
+        attempt = 0
+        while True:
+            if not self.retry.allow():
+                return error_response("Telegram API circuit is open")
+            try:
+                r = self.session.post(url, json=json, timeout=timeout)
+                resp = r.json()
+            except (requests.RequestException, ValueError) as e:
+                delay = self.retry.after_error(method, attempt, e, not not_sent(e))
+                if delay is None:
+                    return error_response(str(e))
+            else:
+                delay = self.retry.after_response(method, attempt, r.status_code, resp)
+                if delay is None:
+                    return resp
+            sleep(delay)
+            attempt += 1
+
+
+class AsyncHttpTransport(AsyncTransport):
+    def __init__(
+        self,
+        pool_size: int = TELEGRAM_POOL_SIZE,
+        timeout: Timeout = (TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT),
+        method_timeouts: Union[Dict[str, Timeout], None] = None,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+        max_retry_after: float = 30.0,
+        circuit_breaker: Union[CircuitBreaker, None] = None,
+        client: Any = None,
+    ) -> None:
+        """`HttpTransport` for an event loop, on a shared `httpx.AsyncClient`.
+
+        Takes the same options and retries calls by the same `RetryPolicy`,
+        but waits with `asyncio.sleep`, so one process can keep hundreds of
+        calls in flight. httpx is imported on first use, as only the ASGI app
+        needs it.
+
+        Args:
+            client (httpx.AsyncClient, optional): client to send requests
+                with. Defaults to a pooled client per event loop, as
+                connections are bound to the loop that opened them.
+            other args: see `HttpTransport`.
+        """
+        self.timeout = timeout
+        self.method_timeouts = (
+            METHOD_TIMEOUTS if method_timeouts is None else method_timeouts
+        )
+        self.retry = RetryPolicy(max_retries, max_retry_after, circuit_breaker)
+        self.pool_size = pool_size
+        self._given_client = client
+        self._client: Any = None
+        self._client_loop: Any = None
+
+    @property
+    def client(self) -> Any:
+        """The given client, or the pooled client of the running loop."""
+        if self._given_client is not None:
+            return self._given_client
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            import httpx
+
+            limits = httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            )
+            self._client = httpx.AsyncClient(limits=limits)
+            self._client_loop = loop
+        return self._client
+
+    def _timeout(self, method: str) -> Any:
+        import httpx
+
+        connect, read = self.method_timeouts.get(method, self.timeout)
+        return httpx.Timeout(read, connect=connect)
+
+    async def post(self, url: str, json: Json) -> Json:
+        """Sends a POST request, retrying like `HttpTransport.post`."""
+        import httpx
+
+        method = url.rsplit("/", 1)[-1]
+        timeout = self._timeout(method)
+        attempt = 0
+        while True:
+            if not self.retry.allow():
+                return error_response("Telegram API circuit is open")
+            try:
+                r = await self.client.post(url, json=json, timeout=timeout)
+                resp = r.json()
+            except (httpx.HTTPError, ValueError) as e:
+                sent = not isinstance(
+                    e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+                )
+                delay = self.retry.after_error(method, attempt, e, sent)
+                if delay is None:
+                    return error_response(str(e))
+            else:
+                delay = self.retry.after_response(method, attempt, r.status_code, resp)
+                if delay is None:
+                    return resp
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        """Closes the pooled client of this transport, if any."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,13 +1,43 @@
 import json
 import logging
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Union
 
+from src.log import BODY
 from src.rest import Json
+from src.telegram.callback_data import decode_callback_data
 
 logger = logging.getLogger(__name__)
 
 
+class TelegramBotUpdateTypes:
+    MESSAGE = "message"
+    EDITED_MESSAGE = "edited_message"
+    CHANNEL_POST = "channel_post"
+    EDITED_CHANNEL_POST = "edited_channel_post"
+    INLINE_QUERY = "inline_query"
+    CHOSEN_INLINE_RESULT = "chosen_inline_result"
+    CALLBACK_QUERY = "callback_query"
+    SHIPPING_QUERY = "shipping_query"
+    PRE_CHECKOUT_QUERY = "pre_checkout_query"
+    POLL = "poll"
+    POLL_ANSWER = "poll_answer"
+
+
+# update types whose payload is a Message in a chat with the bot
+MESSAGE_TYPES = (
+    TelegramBotUpdateTypes.MESSAGE,
+    TelegramBotUpdateTypes.EDITED_MESSAGE,
+)
+# update types whose payload is a Message of a channel the bot is in
+CHANNEL_POST_TYPES = (
+    TelegramBotUpdateTypes.CHANNEL_POST,
+    TelegramBotUpdateTypes.EDITED_CHANNEL_POST,
+)
+
+
 class TelegramBotUpdate:
+    __slots__ = ("raw", "type", "payload", "_callback_data")
+
     def __init__(self, update: Dict[str, Any]):
         """Represents a Telegram Bot Update.
 
@@ -27,6 +57,10 @@ class TelegramBotUpdate:
         - Poll
         - Poll Answer
 
+        Only the type is found up front. Every other field is a property that
+        reads the raw update when it is used, so an update that is dropped
+        (e.g. a duplicate) or routed on its type alone costs one dict scan.
+
         Example Update:
         {
             "update_id": 287379129,
@@ -53,49 +87,125 @@ class TelegramBotUpdate:
         Args:
             update (Dict[str, Any]): Telegram Bot Update.
         """
-        self.message: Union[Dict[str, Any], None] = update.get("message")
-        self.callback_query = update.get("callback_query")
-        self.type = None
-
-        if self.message:
-            self.type = TelegramBotUpdateTypes.MESSAGE
-            self.chat: Dict[str, Any] = self.message.get("chat")
-            self.chat_id = int(self.chat.get("id"))  # type: ignore
-            self.username: str = self.chat.get("username")  # type: ignore
-            self.first_name: str = self.chat.get("first_name")  # type: ignore
-            self.message_id = int(self.message.get("message_id"))
-            self.text: str = self.message.get("text")
-
-        elif self.callback_query:
-            self.type = TelegramBotUpdateTypes.CALLBACK_QUERY
-            self.chat: Dict[str, Any] = (  # type: ignore
-                # format: off
-                self.callback_query.get("message").get("chat")
-                # format: on
-            )
-            self.chat_id = int(self.chat.get("id"))  # type: ignore
-            self.username: str = self.chat.get("username")  # type: ignore
-            self.first_name: str = self.chat.get("first_name")  # type: ignore
-            self.message_id = int(self.callback_query.get("message").get("message_id"))
-            self.callback_data: Json = json.loads(self.callback_query.get("data"))  # type: ignore
-            self.callback_query_id: str = self.callback_query.get("id")  # type: ignore
-            logger.info(f"callback_data: {self.callback_data}")
-
-        logger.info(f"update type: {self}")
+        self.raw = update
+        self.type: Union[str, None] = None
+        # the object of the update's type, e.g. the Message of a message
+        self.payload: Dict[str, Any] = {}
+        self._callback_data: Union[Json, None] = None
+        for key, value in update.items():
+            if key != "update_id" and isinstance(value, dict):
+                self.type, self.payload = key, value
+                break
+        logger.debug("update: %r", self, extra=BODY)
 
     def __repr__(self) -> str:
-        return json.dumps(self.__dict__)
+        return json.dumps(self.raw)
 
+    @property
+    def update_id(self) -> Union[int, None]:
+        return self.raw.get("update_id")
 
-class TelegramBotUpdateTypes:
-    MESSAGE = "message"
-    EDITED_MESSAGE = "edited_message"
-    CHANNEL_POST = "channel_post"
-    EDITED_CHANNEL_POST = "edited_channel_post"
-    INLINE_QUERY = "inline_query"
-    CHOSEN_INLINE_RESULT = "chosen_inline_result"
-    CALLBACK_QUERY = "callback_query"
-    SHIPPING_QUERY = "shipping_query"
-    PRE_CHECKOUT_QUERY = "pre_checkout_query"
-    POLL = "poll"
-    POLL_ANSWER = "poll_answer"
+    @property
+    def message(self) -> Union[Dict[str, Any], None]:
+        """The Message of a message or channel post, or of the button of a
+        callback query."""
+        if self.type in MESSAGE_TYPES + CHANNEL_POST_TYPES:
+            return self.payload
+        if self.type == TelegramBotUpdateTypes.CALLBACK_QUERY:
+            return self.payload.get("message")
+        return None
+
+    @property
+    def edited_message(self) -> Union[Dict[str, Any], None]:
+        return self.raw.get("edited_message")
+
+    @property
+    def callback_query(self) -> Union[Dict[str, Any], None]:
+        return self.raw.get("callback_query")
+
+    @property
+    def chat(self) -> Union[Dict[str, Any], None]:
+        message = self.message
+        return message.get("chat") if message else None
+
+    @property
+    def user(self) -> Union[Dict[str, Any], None]:
+        """The user who sent the update, if any."""
+        return self.payload.get("from") or self.payload.get("user")
+
+    @property
+    def chat_id(self) -> Union[int, None]:
+        chat = self.chat
+        return int(chat["id"]) if chat else None
+
+    @property
+    def user_id(self) -> Union[int, None]:
+        user = self.user
+        return int(user["id"]) if user else None
+
+    @property
+    def username(self) -> Union[str, None]:
+        chat, user = self.chat, self.user
+        if chat and chat.get("username"):
+            return chat["username"]
+        return user.get("username") if user else None
+
+    @property
+    def first_name(self) -> Union[str, None]:
+        chat, user = self.chat, self.user
+        if chat and chat.get("first_name"):
+            return chat["first_name"]
+        return user.get("first_name") if user else None
+
+    @property
+    def is_private(self) -> bool:
+        chat = self.chat
+        return chat is not None and chat.get("type", "private") == "private"
+
+    @property
+    def message_id(self) -> Union[int, None]:
+        message = self.message
+        return int(message["message_id"]) if message else None
+
+    @property
+    def text(self) -> Union[str, None]:
+        message = self.message
+        return message.get("text") if message else None
+
+    @property
+    def location(self) -> Union[Dict[str, float], None]:
+        message = self.message
+        return message.get("location") if message else None
+
+    @property
+    def callback_data(self) -> Json:
+        """Decoded `data` of a callback query; empty for other updates."""
+        if self._callback_data is None:
+            data = self.payload.get("data")
+            self._callback_data = (
+                decode_callback_data(data)
+                if self.type == TelegramBotUpdateTypes.CALLBACK_QUERY and data
+                else {}
+            )
+        return self._callback_data
+
+    @property
+    def callback_query_id(self) -> Union[str, None]:
+        if self.type != TelegramBotUpdateTypes.CALLBACK_QUERY:
+            return None
+        return self.payload.get("id")
+
+    @property
+    def poll_id(self) -> Union[str, None]:
+        if self.type == TelegramBotUpdateTypes.POLL:
+            return self.payload.get("id")
+        if self.type == TelegramBotUpdateTypes.POLL_ANSWER:
+            return self.payload.get("poll_id")
+        return None
+
+    @property
+    def option_ids(self) -> List[int]:
+        """Options chosen in a poll answer; empty when the vote is retracted."""
+        if self.type != TelegramBotUpdateTypes.POLL_ANSWER:
+            return []
+        return self.payload.get("option_ids") or []
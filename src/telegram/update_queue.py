@@ -0,0 +1,159 @@
+import logging
+import os
+import queue
+import threading
+from time import monotonic
+from typing import Any, Callable, List, Tuple, Union
+
+from src.rest import Json
+from src.telegram.update import TelegramBotUpdate
+
+logger = logging.getLogger(__name__)
+
+QueuedUpdate = Tuple[float, TelegramBotUpdate]
+
+
+class UpdateQueue:
+    def __init__(
+        self,
+        handler: Callable[[TelegramBotUpdate], Any],
+        workers: int = 4,
+        maxsize: int = 1000,
+    ) -> None:
+        """Bounded in-process queue of updates served by a pool of workers.
+
+        Every worker owns its own queue and updates are sharded by `chat_id`,
+        or by `user_id` for updates without a chat such as a poll answer, so
+        the updates of one chat are always handled in order by the same
+        worker while different chats are handled concurrently. A private
+        chat's id is its user's id, so both land on the same worker.
+
+        Workers are started lazily on the first `submit` in each process, so
+        the queue can be created at import time before gunicorn forks.
+
+        Args:
+            handler (Callable[[TelegramBotUpdate], Any]): handles one update.
+            workers (int, optional): number of worker threads. Defaults to 4.
+            maxsize (int, optional): maximum number of queued updates across
+                all workers. Defaults to 1000.
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = max(self.workers, maxsize)
+        self._queues: List["queue.Queue[Union[QueuedUpdate, None]]"] = []
+        self._threads: List[threading.Thread] = []
+        self._pid: Union[int, None] = None
+        self._lock = threading.Lock()
+        # guards the counters, updated by every worker
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self) -> None:
+        """Starts the workers unless they already run in this process."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # queues and threads inherited through fork() are unusable
+            self._reset_stats()
+            shard_size = self.maxsize // self.workers
+            self._queues = [queue.Queue(shard_size) for _ in range(self.workers)]
+            self._threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(q,),
+                    name=f"update-worker-{i}",
+                    daemon=True,
+                )
+                for i, q in enumerate(self._queues)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout: Union[float, None] = None) -> None:
+        """Lets the workers finish queued updates and stops them."""
+        if self._pid != os.getpid():
+            return
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def submit(self, update: TelegramBotUpdate) -> bool:
+        """Queues an update for processing.
+
+        Args:
+            update (TelegramBotUpdate): update to process.
+
+        Returns:
+            bool: False if the worker's queue is full and the update was
+                rejected.
+        """
+        self.start()
+        key = getattr(update, "chat_id", None) or getattr(update, "user_id", 0) or 0
+        q = self._queues[hash(key) % self.workers]
+        try:
+            q.put_nowait((monotonic(), update))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def join(self) -> None:
+        """Blocks until every queued update has been processed."""
+        for q in self._queues:
+            q.join()
+
+    def _work(self, q: "queue.Queue[Union[QueuedUpdate, None]]") -> None:
+        while True:
+            item = q.get()
+            if item is None:
+                q.task_done()
+                return
+            enqueued_at, update = item
+            wait = monotonic() - enqueued_at
+            with self._stats_lock:
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            failed = False
+            try:
+                self.handler(update)
+            except Exception:
+                failed = True
+                logger.exception("failed to process update of type %s", update.type)
+            finally:
+                with self._stats_lock:
+                    self.failed += failed
+                    self.processed += 1
+                q.task_done()
+
+    def stats(self) -> Json:
+        """Returns queue depth, throughput and wait time statistics."""
+        depths = [q.qsize() for q in self._queues]
+        with self._stats_lock:
+            return dict(
+                workers=self.workers,
+                maxsize=self.maxsize,
+                depth=sum(depths),
+                shard_depths=depths,
+                enqueued=self.enqueued,
+                processed=self.processed,
+                failed=self.failed,
+                rejected=self.rejected,
+                avg_wait=self.total_wait / self.processed if self.processed else 0.0,
+                max_wait=self.max_wait,
+            )
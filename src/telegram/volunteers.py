@@ -1,17 +1,18 @@
-import json
+import html
+import logging
 from enum import Enum, StrEnum
-from time import time
-from typing import Any, Generator
-
-from google.cloud.firestore import DocumentSnapshot
+from typing import Iterable, List, Tuple, Union
 
+from src.config import PWID_PROFILE_TIMEOUT
 from src.constants import Message
-from src.firebase import db
+from src.firebase import volunteers
+from src.pwid_profiles import pwid_profiles
 from src.rest import Json
 from src.telegram import bot, inline_button_with_callback
+from src.telegram.outbox import Priority
+from src.telegram.protocol import Bot
 
-ALL_USER_STREAM = db.collection("users").stream()
-AVAILABLE_USER_STREAM = db.collection("users").where("available", "==", True).stream()
+logger = logging.getLogger(__name__)
 
 
 class OnboardingState(Enum):
@@ -38,66 +39,88 @@ class LanguagePreference(StrEnum):
 
 
 def broadcast_message_to_stream(
-    user_stream: Generator[DocumentSnapshot, Any, None],
+    user_stream: Iterable[Json],
     message: str,
 ) -> None:
     """Broadcast message to all users in stream
 
     Args:
-        user_stream (Generator[DocumentSnapshot, Any, None]): stream of users
+        user_stream (Iterable[Json]): stream of users, e.g.
+            `volunteers.stream()` or `volunteers.list_available()`
         message (str): message to broadcast
     """
-    users = [user.id for user in user_stream]
-    bot.broadcast(message, users)
+    # a bot can only message the chat a user started with it, not a username
+    chat_ids = [user["chat_id"] for user in user_stream if user.get("chat_id")]
+    bot.broadcast(message, chat_ids, priority=Priority.ONBOARDING)
+
+
+def retraction_messages(request: Json) -> List[Tuple[int, int]]:
+    """Returns the (chat id, message id) of every alert of a claimed help
+    request except the one of the volunteer who claimed it."""
+    accepted_chat_id = str(request.get("claimed_chat_id"))
+    return [
+        (int(chat_id), message_id)
+        for chat_id, message_id in (request.get("recipients") or {}).items()
+        if chat_id != accepted_chat_id
+    ]
 
 
-def select_security_image() -> str:
-    """Select the security image
+def accepted_request_message(request: Union[Json, None]) -> str:
+    """Details of a claimed help request for the volunteer who accepted it.
 
-    Example doc (id = `value`):
-        {
-            "available": True,
-            "updated_at": 1679475161,
-            "value": "SMILE"
-        }
+    The PWID's profile was prefetched when the request was raised, so it
+    normally comes from the cache without a database round trip. A profile
+    that cannot be loaded within `PWID_PROFILE_TIMEOUT` is left out rather
+    than holding up the volunteer.
 
-    Returns:
-        str: name of security image
+    Args:
+        request (Json, optional): claimed help request record, if known.
     """
-    icon_coll = db.collection("icon_names")
-    available_icons = (
-        icon_coll.where("available", "==", True)
-        .order_by("updated_at", direction="ASCENDING")
-        .stream()
+    request = request or {}
+    pwid_id = request.get("pwid_id")
+    try:
+        profile = (
+            pwid_profiles.get(pwid_id, PWID_PROFILE_TIMEOUT) if pwid_id else None
+        ) or {}
+    except Exception:
+        logger.exception("profile of PWID %s is unavailable", pwid_id)
+        profile = {}
+    location = request.get("location")
+    disabilities = profile.get("disabilities") or []
+    if isinstance(disabilities, str):
+        disabilities = [disabilities]
+    unknown = "Unknown"
+    return Message.ACCEPTED_REQUEST.format(
+        html.escape(profile.get("name") or unknown),
+        html.escape(profile.get("caregiver_contact") or unknown),
+        f"Long: {location['long']}, Lat {location['lat']}" if location else unknown,
+        html.escape(", ".join(disabilities) or unknown),
     )
-    icon = next(available_icons, None)
-    if not icon:
-        oldest = next(
-            icon_coll.order_by("updated_at", direction="ASCENDING").stream(), None
-        )
-        if not oldest:
-            return "SMILE"
-        oldest.reference.update(
-            dict(
-                updated_at=int(time()),
-            )
-        )
-        return oldest.get("value")
 
-    icon.reference.update(
-        dict(
-            available=False,
-            updated_at=int(time()),
+
+def retract_broadcast(request: Json, telegram_bot: Bot) -> None:
+    """Replaces every other volunteer's copy of a claimed help request alert
+
+    The alerts are edited concurrently in the background so the volunteer who
+    claimed the request is answered right away.
+
+    Args:
+        request (Json): claimed help request record
+        telegram_bot (Bot): bot editing the alerts
+    """
+    telegram_bot.spawn(
+        telegram_bot.edit_messages(
+            Message.BROADCAST_ACCEPTED, retraction_messages(request)
         )
     )
-    return icon.get("value")
 
 
-def request_volunteer_gender(user_id: str) -> Json:
+async def request_volunteer_gender(user_id: int, telegram_bot: Bot) -> Json:
     """Ask volunteer for their gender
 
     Args:
-        user_id (str): volunteer's user id
+        user_id (int): volunteer's user id
+        telegram_bot (Bot): bot to ask with
     """
     ask_gender_msg = Message.GENDER_REQUEST
     inline_keyboard_row_0_buttons = [
@@ -113,26 +136,51 @@ def request_volunteer_gender(user_id: str) -> Json:
         ),
     ]
     inline_buttons_markup = [inline_keyboard_row_0_buttons]
-    return bot.send_message(
+    return await telegram_bot.send_message(
         chat_id=user_id,
         msg=ask_gender_msg,
         markup=dict(inline_keyboard=inline_buttons_markup),
+        priority=Priority.ONBOARDING,
     )
 
 
-def request_volunteer_language(user_id: str) -> Json:
+async def request_volunteer_language(user_id: int, telegram_bot: Bot) -> Json:
     """Ask volunteer for their prefered language
 
     Args:
-        user_id (str): volunteer's user id
+        user_id (int): volunteer's user id
+        telegram_bot (Bot): bot to ask with
     """
     ask_language_poll_qn = Message.LANGUAGE_POLL_QUESTION
     language_options = LanguagePreference.to_list_str()
-    return bot.send_poll(
+    return await telegram_bot.send_poll(
         chat_id=user_id,
         question=ask_language_poll_qn,
         options=language_options,
         allows_multiple_answers=True,
+        # the answers are the volunteer's preference, see PollAnswerHandler
+        is_anonymous=False,
+        priority=Priority.ONBOARDING,
+    )
+
+
+async def request_volunteer_location(user_id: int, telegram_bot: Bot) -> Json:
+    """Ask volunteer to share their location
+
+    Args:
+        user_id (int): volunteer's user id
+        telegram_bot (Bot): bot to ask with
+    """
+    share_location_button = dict(text="Share Location", request_location=True)
+    return await telegram_bot.send_message(
+        chat_id=user_id,
+        msg=Message.LOCATION_REQUEST,
+        markup=dict(
+            keyboard=[[share_location_button]],
+            resize_keyboard=True,
+            one_time_keyboard=True,
+        ),
+        priority=Priority.ONBOARDING,
     )
 
 
@@ -145,6 +193,5 @@ def get_user_onboarding_state(username: str) -> OnboardingState:
     Returns:
         OnboardingState: onboarding state
     """
-    doc_ref = db.collection("users").document(username)
-    doc_data = doc_ref.get().to_dict() or {}
+    doc_data = volunteers.get(username) or {}
     return OnboardingState(doc_data.get("onboarding_state", OnboardingState.NEW.value))
@@ -0,0 +1,265 @@
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple, Union
+
+from src.geo import GeoIndex
+from src.matching import PreferenceMatcher
+from src.rest import Json
+
+logger = logging.getLogger(__name__)
+
+
+class AvailableVolunteerIndex:
+    def __init__(self) -> None:
+        """In-process index of available volunteers keyed by username.
+
+        The index is filled once from a Firestore query on `available == True`
+        and then kept current by a snapshot listener on the same query.
+        Handlers that change `available` also write through to the index, so
+        the change is visible before the listener catches up.
+
+        Volunteers with a last-known `location` are also kept in a `GeoIndex`
+        so the nearest ones can be found without scanning everybody, and in a
+        `PreferenceMatcher` by their gender and language preferences.
+        """
+        self._volunteers: Dict[str, Json] = {}
+        self._geo = GeoIndex()
+        self._matcher = PreferenceMatcher()
+        self._lock = threading.RLock()
+        self._watch: Any = None
+        self._pid = 0
+        self.started = False
+
+    def __len__(self) -> int:
+        return len(self._volunteers)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._volunteers
+
+    def start(self, query_factory: Callable[[], Any]) -> None:
+        """Fills the index and attaches a snapshot listener, once per process.
+
+        A listener started before fork() has no thread in the child, so a
+        forked worker starts its own.
+
+        Args:
+            query_factory (Callable[[], Any]): returns the Firestore query of
+                available volunteers. Only called the first time.
+        """
+        if self.started and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self.started and self._pid == os.getpid():
+                return
+            query = query_factory()
+            self.load(query.get())
+            self._watch = query.on_snapshot(self.on_snapshot)
+            self._pid = os.getpid()
+            self.started = True
+            logger.info("volunteer index started with %d volunteers", len(self))
+
+    def stop(self) -> None:
+        """Detaches the snapshot listener and empties the index."""
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+            self._watch = None
+            self._volunteers = {}
+            self._geo.clear()
+            self._matcher.clear()
+            self.started = False
+
+    def load(self, docs: Iterable[Any]) -> None:
+        """Replaces the index with the given document snapshots."""
+        with self._lock:
+            self._volunteers = {}
+            self._geo.clear()
+            self._matcher.clear()
+            for doc in docs:
+                self._set(doc.id, doc.to_dict())
+
+    def on_snapshot(self, docs: List[Any], changes: List[Any], read_time: Any) -> None:
+        """Firestore `on_snapshot` callback applying document changes."""
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self._remove(doc.id)
+                else:
+                    self._set(doc.id, doc.to_dict())
+
+    def _set(self, username: str, data: Union[Json, None]) -> None:
+        if not data or not data.get("available"):
+            self._remove(username)
+            return
+        self._volunteers[username] = data
+        self._matcher.add(username, data.get("gender"), data.get("language"))
+        location = data.get("location")
+        if location:
+            self._geo.add(username, location["lat"], location["long"])
+        else:
+            self._geo.remove(username)
+
+    def _remove(self, username: str) -> None:
+        self._volunteers.pop(username, None)
+        self._geo.remove(username)
+        self._matcher.remove(username)
+
+    def update(self, username: str, fields: Json) -> None:
+        """Writes a volunteer document update through to the index.
+
+        Fields are merged into the indexed document. A volunteer who becomes
+        available without being indexed yet is added with the given fields;
+        the snapshot listener fills in the rest of the document.
+
+        Args:
+            username (str): volunteer's username (document id).
+            fields (Json): fields written to the volunteer document.
+        """
+        with self._lock:
+            data = {**self._volunteers.get(username, {}), **fields}
+            self._set(username, data)
+
+    def volunteers(self) -> Dict[str, Json]:
+        """Returns a snapshot of available volunteers keyed by username."""
+        with self._lock:
+            return dict(self._volunteers)
+
+    def nearest(
+        self, lat: float, long: float, k: int, radius_km: float
+    ) -> List[Tuple[float, Json]]:
+        """Finds the `k` nearest available volunteers within `radius_km`.
+
+        Args:
+            lat (float): latitude of the PWID.
+            long (float): longitude of the PWID.
+            k (int): maximum number of volunteers to return.
+            radius_km (float): maximum distance in kilometres.
+
+        Returns:
+            List[Tuple[float, Json]]: (distance in km, volunteer) pairs,
+                closest first.
+        """
+        with self._lock:
+            return [
+                (distance, self._volunteers[username])
+                for distance, username in self._geo.nearest(lat, long, k, radius_km)
+            ]
+
+    def select(
+        self,
+        lat: float,
+        long: float,
+        k: int,
+        radius_km: float,
+        gender: Union[str, None] = None,
+        language: Union[str, None] = None,
+    ) -> List[Json]:
+        """Ranks available volunteers for a PWID's location and needs.
+
+        Volunteers matching every given need come first, closest first,
+        followed by the closest of the remaining volunteers. When nobody with
+        a known location is within `radius_km`, every available volunteer is
+        ranked by needs instead, so a PWID is never left without anyone to ask.
+
+        Args:
+            lat (float): latitude of the PWID.
+            long (float): longitude of the PWID.
+            k (int): maximum number of volunteers to pick by location.
+            radius_km (float): maximum distance in kilometres.
+            gender (str, optional): PWID's gender. Defaults to None.
+            language (str, optional): PWID's language. Defaults to None.
+
+        Returns:
+            List[Json]: ranked volunteers.
+        """
+        with self._lock:
+            matches = self._matcher.predicate(gender, language)
+            usernames = self._rank_nearest(lat, long, k, radius_km, matches)
+            if not usernames:
+                usernames = self._matcher.rank(self._volunteers, gender, language)
+            return [self._volunteers[username] for username in usernames]
+
+    def select_waves(
+        self,
+        lat: float,
+        long: float,
+        sizes: List[int],
+        radius_km: float,
+        growth: float,
+        gender: Union[str, None] = None,
+        language: Union[str, None] = None,
+    ) -> List[List[Json]]:
+        """Ranks available volunteers into alert waves reaching further out.
+
+        Wave i takes up to `sizes[i]` volunteers not alerted before within
+        `radius_km * growth ** i`, ranked like `select`. The wave after the
+        last size takes every other available volunteer, including those
+        without a known location, ranked by needs. Empty waves are left out,
+        so the first wave goes to the nearest volunteers wherever they are.
+
+        Args:
+            lat (float): latitude of the PWID.
+            long (float): longitude of the PWID.
+            sizes (List[int]): maximum number of volunteers of each wave.
+            radius_km (float): maximum distance of the first wave in km.
+            growth (float): factor the radius grows by from wave to wave.
+            gender (str, optional): PWID's gender. Defaults to None.
+            language (str, optional): PWID's language. Defaults to None.
+
+        Returns:
+            List[List[Json]]: ranked volunteers of every wave, in order.
+        """
+        with self._lock:
+            matches = self._matcher.predicate(gender, language)
+            picked: Set[str] = set()
+            waves: List[List[str]] = []
+            for i, size in enumerate(sizes):
+                wave = self._rank_nearest(
+                    lat, long, size, radius_km * growth**i, matches, picked
+                )
+                picked.update(wave)
+                waves.append(wave)
+            ranked = self._matcher.rank(self._volunteers, gender, language)
+            waves.append([username for username in ranked if username not in picked])
+            return [
+                [self._volunteers[username] for username in wave]
+                for wave in waves
+                if wave
+            ]
+
+    def _rank_nearest(
+        self,
+        lat: float,
+        long: float,
+        k: int,
+        radius_km: float,
+        matches: Union[Callable[[str], bool], None],
+        picked: Union[Set[str], None] = None,
+    ) -> List[str]:
+        """Usernames of the `k` nearest volunteers within `radius_km` but
+        `picked`, those `matches` accepts first, closest first."""
+
+        def candidates(
+            predicate: Union[Callable[[str], bool], None],
+        ) -> Union[Callable[[str], bool], None]:
+            if not picked:
+                return predicate
+            if predicate is None:
+                return lambda username: username not in picked
+            return lambda username: username not in picked and predicate(username)
+
+        if matches is None:
+            nearest = self._geo.nearest(lat, long, k, radius_km, candidates(None))
+        else:
+            nearest = self._geo.nearest(lat, long, k, radius_km, candidates(matches))
+            if len(nearest) < k:
+                nearest += self._geo.nearest(
+                    lat,
+                    long,
+                    k - len(nearest),
+                    radius_km,
+                    candidates(lambda username: not matches(username)),  # type: ignore
+                )
+        return [username for _, username in nearest]
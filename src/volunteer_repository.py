@@ -0,0 +1,456 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from enum import Enum
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Union
+
+from src.metrics import FIRESTORE_LATENCY
+from src.rest import Json
+from src.write_behind import WriteBehindBuffer
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import Client, CollectionReference, Query
+
+
+class VolunteerNotFound(Exception):
+    pass
+
+
+def _languages(record: Json) -> List[str]:
+    language = record.get("language")
+    if not language:
+        return []
+    return [language] if isinstance(language, str) else list(language)
+
+
+def _matches(
+    record: Json, gender: Union[str, None], language: Union[str, None]
+) -> bool:
+    if gender and record.get("gender") != gender:
+        return False
+    return not language or language in _languages(record)
+
+
+class VolunteerRepository(ABC):
+    """Stores volunteer documents keyed by Telegram username.
+
+    Example document:
+        {
+            "username": "johndoe",
+            "first_name": "John",
+            "chat_id": 123456789,
+            "available": True,
+            "onboarding_state": 1,
+            "gender": "M",
+            "language": "en",
+            "location": {"lat": 1.29, "long": 103.85, "updated_at": 1679475161},
+            "created_at": 1679475161,
+            "updated_at": 1679475161
+        }
+    """
+
+    @abstractmethod
+    def get(self, username: str) -> Union[Json, None]:
+        """Returns a volunteer document, or None if there is none."""
+
+    @abstractmethod
+    def create(self, username: str, data: Json) -> bool:
+        """Creates a volunteer document unless one already exists.
+
+        Returns:
+            bool: False if the volunteer already exists.
+        """
+
+    @abstractmethod
+    def update(self, username: str, fields: Json) -> None:
+        """Sets the given top-level fields of a volunteer document.
+
+        Raises:
+            VolunteerNotFound: if the volunteer does not exist.
+        """
+
+    @abstractmethod
+    def list_available(
+        self, gender: Union[str, None] = None, language: Union[str, None] = None
+    ) -> List[Json]:
+        """Returns available volunteers, optionally only those with the given
+        gender and language."""
+
+    @abstractmethod
+    def stream(self) -> Iterator[Json]:
+        """Yields every volunteer document."""
+
+    @abstractmethod
+    def available_query(self) -> Any:
+        """Returns the query of available volunteers that
+        `AvailableVolunteerIndex.start` loads and listens to."""
+
+
+class FirestoreVolunteerRepository(VolunteerRepository):
+    def __init__(self, client: "Client", collection: str = "users") -> None:
+        """Volunteers stored in a Firestore collection, one document per
+        username."""
+        self.client = client
+        self.collection_name = collection
+
+    @property
+    def collection(self) -> "CollectionReference":
+        return self.client.collection(self.collection_name)
+
+    @FIRESTORE_LATENCY.timed("users.get")
+    def get(self, username: str) -> Union[Json, None]:
+        return self.collection.document(username).get().to_dict()
+
+    @FIRESTORE_LATENCY.timed("users.create")
+    def create(self, username: str, data: Json) -> bool:
+        from google.api_core.exceptions import AlreadyExists
+
+        try:
+            self.collection.document(username).create(dict(data, username=username))
+        except AlreadyExists:
+            return False
+        return True
+
+    @FIRESTORE_LATENCY.timed("users.update")
+    def update(self, username: str, fields: Json) -> None:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.collection.document(username).update(fields)
+        except NotFound as error:
+            raise VolunteerNotFound(username) from error
+
+    @FIRESTORE_LATENCY.timed("users.available")
+    def list_available(
+        self, gender: Union[str, None] = None, language: Union[str, None] = None
+    ) -> List[Json]:
+        query = self.available_query()
+        if gender:
+            query = query.where("gender", "==", gender)
+        records = (doc.to_dict() for doc in query.stream())
+        # language is a string or a list, which no single filter matches
+        return [
+            record
+            for record in records
+            if record is not None and _matches(record, None, language)
+        ]
+
+    def stream(self) -> Iterator[Json]:
+        for doc in self.collection.stream():
+            record = doc.to_dict()
+            if record is not None:
+                yield record
+
+    def available_query(self) -> "Query":
+        return self.collection.where("available", "==", True)
+
+
+class WriteBehindVolunteerRepository(FirestoreVolunteerRepository):
+    def __init__(
+        self,
+        client: "Client",
+        collection: str = "users",
+        flush_size: int = 100,
+        flush_interval: float = 1.0,
+    ) -> None:
+        """Firestore volunteers whose updates go through a `WriteBehindBuffer`.
+
+        `update` returns at once and the merged updates of each volunteer are
+        committed in batches. Reads in this process apply the pending updates
+        on top of the stored documents. Creating a volunteer is written
+        straight away, as it must fail if the volunteer already exists.
+
+        Updates are no longer checked against missing volunteers; they are
+        logged and dropped when flushed.
+        """
+        super().__init__(client, collection)
+        self.buffer = WriteBehindBuffer(client, collection, flush_size, flush_interval)
+
+    def _apply_pending(self, record: Union[Json, None]) -> Union[Json, None]:
+        if record is None:
+            return None
+        pending = self.buffer.pending(record.get("username", ""))
+        return {**record, **pending} if pending else record
+
+    def get(self, username: str) -> Union[Json, None]:
+        record = super().get(username)
+        pending = self.buffer.pending(username)
+        return {**record, **pending} if record and pending else record
+
+    def update(self, username: str, fields: Json) -> None:
+        self.buffer.update(username, fields)
+
+    def list_available(
+        self, gender: Union[str, None] = None, language: Union[str, None] = None
+    ) -> List[Json]:
+        pending = set(self.buffer.pending_ids())
+        stored = super().list_available()
+        records = [self._apply_pending(record) for record in stored]
+        # volunteers that only a pending update makes available
+        for username in pending - {record.get("username") for record in stored}:
+            records.append(self.get(username))
+        return [
+            record  # type: ignore
+            for record in records
+            if record and record.get("available") and _matches(record, gender, language)
+        ]
+
+    def stream(self) -> Iterator[Json]:
+        for record in super().stream():
+            yield self._apply_pending(record)  # type: ignore
+
+
+class ChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+class LocalAvailableQuery:
+    def __init__(self, repository: "LocalVolunteerRepository") -> None:
+        """Firestore-like query of a local repository's available volunteers.
+
+        `on_snapshot` listeners are called with the change of every write that
+        makes a volunteer available, modifies an available volunteer or makes
+        one unavailable.
+        """
+        self.repository = repository
+
+    @staticmethod
+    def _snapshot(username: str, record: Json) -> Any:
+        return SimpleNamespace(id=username, to_dict=lambda: dict(record))
+
+    def get(self) -> List[Any]:
+        return [
+            self._snapshot(record["username"], record)
+            for record in self.repository.list_available()
+        ]
+
+    def on_snapshot(self, callback: Callable) -> Any:
+        listeners = self.repository._listeners
+        listeners.append(callback)
+        return SimpleNamespace(unsubscribe=lambda: listeners.remove(callback))
+
+
+class LocalVolunteerRepository(VolunteerRepository):
+    def __init__(self) -> None:
+        """Base of the repositories kept by this process, which notify
+        `available_query` listeners of their own writes.
+
+        Writes of another process are never notified, so the app must run a
+        single worker with these repositories; see `gunicorn.conf.py`.
+        """
+        self._listeners: List[Callable] = []
+
+    def available_query(self) -> LocalAvailableQuery:
+        return LocalAvailableQuery(self)
+
+    def _notify(self, username: str, old: Union[Json, None], new: Json) -> None:
+        was = bool(old and old.get("available"))
+        now = bool(new.get("available"))
+        if not (was or now):
+            return
+        if was and now:
+            change_type = ChangeType.MODIFIED
+        elif now:
+            change_type = ChangeType.ADDED
+        else:
+            change_type = ChangeType.REMOVED
+        change = SimpleNamespace(
+            type=change_type, document=LocalAvailableQuery._snapshot(username, new)
+        )
+        for listener in list(self._listeners):
+            listener([], [change], None)
+
+
+class InMemoryVolunteerRepository(LocalVolunteerRepository):
+    def __init__(self) -> None:
+        """Process-local repository, e.g. for tests and benchmarks."""
+        super().__init__()
+        self._volunteers: Dict[str, Json] = {}
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Union[Json, None]:
+        with self._lock:
+            record = self._volunteers.get(username)
+            return dict(record) if record else None
+
+    def create(self, username: str, data: Json) -> bool:
+        record = dict(data, username=username)
+        with self._lock:
+            if username in self._volunteers:
+                return False
+            self._volunteers[username] = record
+        self._notify(username, None, record)
+        return True
+
+    def update(self, username: str, fields: Json) -> None:
+        with self._lock:
+            old = self._volunteers.get(username)
+            if old is None:
+                raise VolunteerNotFound(username)
+            record = self._volunteers[username] = {**old, **fields}
+        self._notify(username, old, record)
+
+    def list_available(
+        self, gender: Union[str, None] = None, language: Union[str, None] = None
+    ) -> List[Json]:
+        with self._lock:
+            return [
+                dict(record)
+                for record in self._volunteers.values()
+                if record.get("available") and _matches(record, gender, language)
+            ]
+
+    def stream(self) -> Iterator[Json]:
+        with self._lock:
+            records = [dict(record) for record in self._volunteers.values()]
+        yield from records
+
+
+class SQLiteVolunteerRepository(LocalVolunteerRepository):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS volunteers (
+            username TEXT PRIMARY KEY,
+            chat_id INTEGER,
+            available INTEGER NOT NULL DEFAULT 0,
+            gender TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS volunteer_languages (
+            username TEXT NOT NULL,
+            language TEXT NOT NULL,
+            PRIMARY KEY (username, language)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS volunteers_available_gender
+            ON volunteers (available, gender);
+        CREATE INDEX IF NOT EXISTS volunteer_languages_language
+            ON volunteer_languages (language, username);
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        """Volunteers stored in a SQLite database file.
+
+        The whole document is kept as JSON, with `available` and `gender`
+        copied into indexed columns and each preferred language into an
+        indexed `volunteer_languages` row, so filtered listings are index
+        lookups instead of scans.
+
+        The database is opened on first use in each process, since a SQLite
+        connection must not be used across fork(); an in-memory database is
+        therefore private to the process that opened it.
+
+        Args:
+            path (str, optional): database file. Defaults to an in-memory
+                database.
+        """
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._conn: Union[sqlite3.Connection, None] = None
+        self._pid: Union[int, None] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of this process, opened on first use."""
+        if self._pid != os.getpid():
+            with self._connect_lock:
+                if self._pid != os.getpid():
+                    # the parent's connection is left alone, it is not ours
+                    conn = sqlite3.connect(
+                        self.path, check_same_thread=False, isolation_level=None
+                    )
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(self.SCHEMA)
+                    self._conn = conn
+                    self._pid = os.getpid()
+        return self._conn  # type: ignore
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _read(self, username: str) -> Union[Json, None]:
+        row = self.connection.execute(
+            "SELECT data FROM volunteers WHERE username = ?", (username,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, record: Json) -> None:
+        username = record["username"]
+        self.connection.execute(
+            "INSERT OR REPLACE INTO volunteers "
+            "(username, chat_id, available, gender, data) VALUES (?, ?, ?, ?, ?)",
+            (
+                username,
+                record.get("chat_id"),
+                int(bool(record.get("available"))),
+                record.get("gender"),
+                json.dumps(record),
+            ),
+        )
+        self.connection.execute(
+            "DELETE FROM volunteer_languages WHERE username = ?", (username,)
+        )
+        self.connection.executemany(
+            "INSERT INTO volunteer_languages (username, language) VALUES (?, ?)",
+            [(username, language) for language in set(_languages(record))],
+        )
+
+    def get(self, username: str) -> Union[Json, None]:
+        with self._lock:
+            return self._read(username)
+
+    def create(self, username: str, data: Json) -> bool:
+        record = dict(data, username=username)
+        with self._transaction():
+            if self._read(username) is not None:
+                return False
+            self._write(record)
+        self._notify(username, None, record)
+        return True
+
+    def update(self, username: str, fields: Json) -> None:
+        with self._transaction():
+            old = self._read(username)
+            if old is None:
+                raise VolunteerNotFound(username)
+            record = {**old, **fields}
+            self._write(record)
+        self._notify(username, old, record)
+
+    def list_available(
+        self, gender: Union[str, None] = None, language: Union[str, None] = None
+    ) -> List[Json]:
+        sql = "SELECT data FROM volunteers WHERE available = 1"
+        parameters: List[str] = []
+        if gender:
+            sql += " AND gender = ?"
+            parameters.append(gender)
+        if language:
+            sql += (
+                " AND username IN "
+                "(SELECT username FROM volunteer_languages WHERE language = ?)"
+            )
+            parameters.append(language)
+        with self._lock:
+            rows = self.connection.execute(sql, parameters).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stream(self) -> Iterator[Json]:
+        with self._lock:
+            rows = self.connection.execute("SELECT data FROM volunteers").fetchall()
+        for row in rows:
+            yield json.loads(row[0])
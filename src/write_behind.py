@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Tuple, Union
+
+from src.metrics import FIRESTORE_LATENCY
+from src.rest import Json
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches of more than 500 writes
+MAX_BATCH_SIZE = 500
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        client: Any,
+        collection: str,
+        flush_size: int = 100,
+        flush_interval: float = 1.0,
+    ) -> None:
+        """Buffers field updates of a Firestore collection and writes them in
+        batches.
+
+        Updates of the same document are merged while they wait, so a burst
+        of updates (e.g. onboarding, where every step also sets `updated_at`)
+        becomes a single write. Pending updates are committed in `WriteBatch`
+        commits by a background thread every `flush_interval` seconds, or as
+        soon as `flush_size` documents are pending.
+
+        The flusher is started lazily on the first update in each process, so
+        the buffer can be created at import time before gunicorn forks.
+        Pending updates should be flushed with `close` on shutdown.
+
+        Args:
+            client (Client): Firestore client.
+            collection (str): collection of the buffered documents.
+            flush_size (int, optional): pending documents that trigger a
+                flush. Defaults to 100.
+            flush_interval (float, optional): longest time in seconds an
+                update waits. Defaults to 1.0.
+        """
+        self.client = client
+        self.collection_name = collection
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Json] = {}
+        # updates being committed, still read through `pending` until they are
+        self._flushing: Dict[str, Json] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Union[threading.Thread, None] = None
+        self._pid: Union[int, None] = None
+        self.flushed = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending.keys() | self._flushing.keys())
+
+    def start(self) -> None:
+        """Starts the flusher unless it already runs in this process."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # updates inherited through fork() are the parent's to write
+            self._pending = {}
+            self._flushing = {}
+            self._closed = False
+            self._wake = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, name=f"{self.collection_name}-flusher", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def update(self, doc_id: str, fields: Json) -> None:
+        """Queues top-level field updates of a document, merged into the
+        updates already pending for it."""
+        self.start()
+        with self._lock:
+            self._pending[doc_id] = {**self._pending.get(doc_id, {}), **fields}
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self._wake.set()
+
+    def pending(self, doc_id: str) -> Union[Json, None]:
+        """Returns the fields pending for a document, if any, including those
+        of a commit in progress."""
+        with self._lock:
+            fields = {**self._flushing.get(doc_id, {}), **self._pending.get(doc_id, {})}
+            return fields or None
+
+    def pending_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._flushing.keys() | self._pending.keys())
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("flushing buffered writes failed")
+
+    def flush(self) -> int:
+        """Commits every pending update now.
+
+        Updates stay visible to `pending` until their batch is committed.
+        Updates of a batch that fails are queued again, under any newer
+        update of the same document, and retried on the next flush. A batch
+        rejected because a document does not exist is retried one document at
+        a time and the updates of missing documents are dropped.
+
+        Returns:
+            int: number of documents written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                writes = list(self._pending.items())
+                self._flushing, self._pending = self._pending, {}
+            written = 0
+            for start in range(0, len(writes), MAX_BATCH_SIZE):
+                batch = writes[start : start + MAX_BATCH_SIZE]
+                try:
+                    written += self._commit(batch)
+                except Exception as e:
+                    logger.warning("requeued %d buffered writes: %s", len(batch), e)
+                    self._done(batch, requeue=True)
+                else:
+                    self._done(batch)
+            self.flushed += written
+            return written
+
+    def _done(self, writes: List[Tuple[str, Json]], requeue: bool = False) -> None:
+        """Ends the commit of `writes`, queueing them again if it failed."""
+        with self._lock:
+            for doc_id, fields in writes:
+                self._flushing.pop(doc_id, None)
+                if requeue:
+                    self._pending[doc_id] = {**fields, **self._pending.get(doc_id, {})}
+
+    @FIRESTORE_LATENCY.timed("write_behind.commit")
+    def _commit(self, writes: List[Tuple[str, Json]]) -> int:
+        from google.api_core.exceptions import NotFound
+
+        collection = self.client.collection(self.collection_name)
+        batch = self.client.batch()
+        for doc_id, fields in writes:
+            batch.update(collection.document(doc_id), fields)
+        try:
+            batch.commit()
+            return len(writes)
+        except NotFound:
+            written = 0
+            for doc_id, fields in writes:
+                try:
+                    collection.document(doc_id).update(fields)
+                    written += 1
+                except NotFound:
+                    self.failed += 1
+                    logger.warning("dropped update of missing %s: %s", doc_id, fields)
+            return written
+
+    def close(self, timeout: Union[float, None] = None) -> None:
+        """Stops the flusher and writes every pending update."""
+        if self._pid != os.getpid():
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
@@ -0,0 +1,11 @@
+import os
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token")
+# handler tests message the same few chats back to back through the shared
+# outbox; tests/src/telegram/test_outbox.py covers the per-chat limit
+os.environ.setdefault("TELEGRAM_CHAT_RATE_LIMIT", "1000")
+
+from tests.fakes import install_fake_firestore  # noqa: E402
+
+# keep the tests offline, whatever credential is configured
+install_fake_firestore()
@@ -0,0 +1,21 @@
+from unittest import mock
+
+import firebase_admin
+import firebase_admin.firestore
+
+from tests.fakes.firestore import FakeFirestore
+from tests.fakes.telegram import FakeTelegramServer
+
+__all__ = ["FakeFirestore", "FakeTelegramServer", "install_fake_firestore"]
+
+fake_db = FakeFirestore()
+
+
+def install_fake_firestore() -> FakeFirestore:
+    """Makes `src.firebase` use `fake_db` instead of connecting to Firebase.
+
+    Must be called before `src.firebase` is first imported.
+    """
+    mock.patch.object(firebase_admin, "initialize_app").start()
+    mock.patch.object(firebase_admin.firestore, "client", return_value=fake_db).start()
+    return fake_db
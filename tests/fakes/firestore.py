@@ -0,0 +1,261 @@
+import copy
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1.transforms import Increment
+
+Json = Dict[str, Any]
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _split_path(path: str) -> List[str]:
+    return [part.strip("`") for part in path.split(".")]
+
+
+def _get_field(data: Json, path: str) -> Any:
+    value: Any = data
+    for part in _split_path(path):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _set_field(data: Json, path: str, value: Any) -> None:
+    *parents, last = _split_path(path)
+    for part in parents:
+        data = data.setdefault(part, {})
+    if isinstance(value, Increment):
+        value = (data.get(last) or 0) + value.value
+    data[last] = value
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Union[Json, None]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Union[Json, None]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        return _get_field(self._data or {}, field)
+
+
+class FakeDocumentReference:
+    def __init__(self, collection: "FakeCollection", id: str) -> None:
+        self.collection = collection
+        self.id = id
+
+    def get(self, **_: Any) -> FakeDocumentSnapshot:
+        with self.collection._lock:
+            data = copy.deepcopy(self.collection._docs.get(self.id))
+        return FakeDocumentSnapshot(self, data)
+
+    def set(self, data: Json, merge: bool = False) -> None:
+        with self.collection._lock:
+            new = copy.deepcopy(self.collection._docs.get(self.id, {})) if merge else {}
+            for key, value in data.items():
+                if isinstance(value, Increment):
+                    value = (new.get(key) or 0) + value.value
+                new[key] = copy.deepcopy(value)
+            self.collection._write(self.id, new)
+
+    def create(self, data: Json) -> None:
+        with self.collection._lock:
+            if self.id in self.collection._docs:
+                raise AlreadyExists(f"{self.id} already exists")
+            self.collection._write(self.id, copy.deepcopy(data))
+
+    def update(self, fields: Json) -> None:
+        with self.collection._lock:
+            if self.id not in self.collection._docs:
+                raise NotFound(f"{self.id} not found")
+            new = copy.deepcopy(self.collection._docs[self.id])
+            for path, value in fields.items():
+                _set_field(new, path, value)
+            self.collection._write(self.id, new)
+
+    def delete(self) -> None:
+        with self.collection._lock:
+            self.collection._write(self.id, None)
+
+
+class FakeWatch:
+    def __init__(self, query: "FakeQuery", callback: Callable) -> None:
+        self.query = query
+        self.callback = callback
+
+    def unsubscribe(self) -> None:
+        self.query.collection._watches.remove(self)
+
+
+class FakeQuery:
+    def __init__(
+        self,
+        collection: "FakeCollection",
+        filters: Tuple[Tuple[str, str, Any], ...] = (),
+        orders: Tuple[Tuple[str, str], ...] = (),
+        fields: Union[List[str], None] = None,
+        count: Union[int, None] = None,
+    ) -> None:
+        self.collection = collection
+        self.filters = filters
+        self.orders = orders
+        self.fields = fields
+        self.count = count
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return FakeQuery(
+            self.collection,
+            self.filters + ((field, op, value),),
+            self.orders,
+            self.fields,
+            self.count,
+        )
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return FakeQuery(
+            self.collection,
+            self.filters,
+            self.orders + ((field, direction),),
+            self.fields,
+            self.count,
+        )
+
+    def select(self, fields: List[str]) -> "FakeQuery":
+        return FakeQuery(self.collection, self.filters, self.orders, fields, self.count)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self.collection, self.filters, self.orders, self.fields, count)
+
+    def matches(self, data: Union[Json, None]) -> bool:
+        return data is not None and all(
+            OPERATORS[op](_get_field(data, field), value)
+            for field, op, value in self.filters
+        )
+
+    def stream(self, **_: Any) -> Iterator[FakeDocumentSnapshot]:
+        with self.collection._lock:
+            docs = [
+                (id, data)
+                for id, data in self.collection._docs.items()
+                if self.matches(data)
+            ]
+        for field, direction in reversed(self.orders):
+            docs.sort(
+                key=lambda doc: _get_field(doc[1], field),
+                reverse=direction == "DESCENDING",
+            )
+        if self.count is not None:
+            docs = docs[: self.count]
+        for id, data in docs:
+            if self.fields is not None:
+                data = {field: _get_field(data, field) for field in self.fields}
+            yield FakeDocumentSnapshot(
+                self.collection.document(id), copy.deepcopy(data)
+            )
+
+    def get(self, **_: Any) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+    def on_snapshot(self, callback: Callable) -> FakeWatch:
+        watch = FakeWatch(self, callback)
+        self.collection._watches.append(watch)
+        changes = [self._change("ADDED", doc) for doc in self.stream()]
+        callback(self.get(), changes, None)
+        return watch
+
+    @staticmethod
+    def _change(type: str, doc: FakeDocumentSnapshot) -> Any:
+        return SimpleNamespace(type=SimpleNamespace(name=type), document=doc)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client: "FakeFirestore", name: str) -> None:
+        super().__init__(self)
+        self.client = client
+        self.name = name
+        self._docs: Dict[str, Json] = {}
+        self._watches: List[FakeWatch] = []
+        self._lock = client._lock
+
+    def document(self, id: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self, str(id))
+
+    def _write(self, id: str, data: Union[Json, None]) -> None:
+        old = self._docs.get(id)
+        if data is None:
+            self._docs.pop(id, None)
+        else:
+            self._docs[id] = data
+        self.client.writes += 1
+        ref = self.document(id)
+        for watch in list(self._watches):
+            was, now = watch.query.matches(old), watch.query.matches(data)
+            if not was and not now:
+                continue
+            change_type = "MODIFIED" if was and now else "ADDED" if now else "REMOVED"
+            snapshot = FakeDocumentSnapshot(ref, copy.deepcopy(data if now else old))
+            watch.callback([], [FakeQuery._change(change_type, snapshot)], None)
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestore") -> None:
+        self.client = client
+        self._writes: List[Tuple[str, FakeDocumentReference, Json]] = []
+
+    def set(self, reference: FakeDocumentReference, data: Json) -> None:
+        self._writes.append(("set", reference, data))
+
+    def update(self, reference: FakeDocumentReference, fields: Json) -> None:
+        self._writes.append(("update", reference, fields))
+
+    def commit(self) -> None:
+        """Applies every write, or none if an updated document is missing."""
+        with self.client._lock:
+            for operation, reference, _ in self._writes:
+                if operation == "update" and not reference.get().exists:
+                    raise NotFound(f"{reference.id} not found")
+            for operation, reference, data in self._writes:
+                getattr(reference, operation)(data)
+            self.client.commits += 1
+
+
+class FakeFirestore:
+    def __init__(self) -> None:
+        """In-memory stand-in for a Firestore client.
+
+        Supports the document, query, batch and snapshot listener calls the
+        app makes. Listeners are notified synchronously on every write.
+        """
+        self._lock = threading.RLock()
+        self._collections: Dict[str, FakeCollection] = {}
+        self.writes = 0
+        self.commits = 0
+
+    def collection(self, name: str) -> FakeCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(self, name)
+            return self._collections[name]
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
@@ -0,0 +1,143 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Set, Union
+
+Json = Dict[str, Any]
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    # clients opening a whole pool of connections at once overflow the
+    # default backlog of 5, and every dropped connect is retried after 1s
+    request_queue_size = 128
+
+
+class FakeTelegramServer:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit_ratio: float = 0.0,
+        retry_after: int = 1,
+        seed: int = 460,
+    ) -> None:
+        """In-process stand-in for the Telegram Bot API.
+
+        Listens on a free localhost port and answers every
+        `POST /bot<token>/<method>` with a successful response after
+        `latency` seconds, except for a `rate_limit_ratio` share of calls
+        which get a 429 with `retry_after`. Point the app at it by setting
+        `TELEGRAM_API_URL` to `url`.
+
+        Args:
+            latency (float, optional): seconds to wait before answering.
+            rate_limit_ratio (float, optional): share of calls, between 0 and 1,
+                answered with 429 Too Many Requests.
+            retry_after (int, optional): `retry_after` of 429 responses.
+            seed (int, optional): seed choosing the rate limited calls.
+        """
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.requests: List[Json] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_id = 0
+        # file_ids of the photos sent so far
+        self.file_ids: Set[str] = set()
+        self._server = FakeHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Union[threading.Thread, None] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeTelegramServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeTelegramServer":
+        return self.start()
+
+    def __exit__(self, *_: Any) -> None:
+        self.stop()
+
+    def respond(self, method: str, body: Json) -> tuple:
+        """Returns the status code and response for a Bot API call."""
+        with self._lock:
+            self.calls[method] += 1
+            self.requests.append(dict(method=method, **body))
+            if self._random.random() < self.rate_limit_ratio:
+                return 429, dict(
+                    ok=False,
+                    error_code=429,
+                    description="Too Many Requests: retry after " f"{self.retry_after}",
+                    parameters=dict(retry_after=self.retry_after),
+                )
+            self._message_id += 1
+            message_id = self._message_id
+        if method == "getUpdates":
+            return 200, dict(ok=True, result=[])
+        if method in ("getMe", "deleteWebhook", "answerCallbackQuery"):
+            return 200, dict(ok=True, result=True)
+        result = dict(
+            message_id=message_id,
+            chat=dict(id=body.get("chat_id")),
+            date=int(time.time()),
+            text=body.get("text"),
+        )
+        if method == "sendPhoto":
+            photo = body.get("photo", "")
+            photo_id = photo
+            if photo.startswith("http"):
+                # a new upload, stored as a thumbnail and the full size
+                photo_id = f"photo-{message_id}"
+                with self._lock:
+                    self.file_ids.add(photo_id)
+            elif photo not in self.file_ids:
+                return 400, dict(
+                    ok=False,
+                    error_code=400,
+                    description="Bad Request: wrong file identifier",
+                )
+            result["photo"] = [
+                dict(file_id=f"{photo_id}-thumb", width=90),
+                dict(file_id=photo_id, width=320),
+            ]
+        return 200, dict(ok=True, result=result)
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, see TCP delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.latency:
+                    time.sleep(server.latency)
+                status, response = server.respond(self.path.rsplit("/", 1)[-1], body)
+                data = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *_: Any) -> None:
+                pass
+
+        return Handler
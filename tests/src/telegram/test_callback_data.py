@@ -0,0 +1,36 @@
+import json
+from unittest import TestCase
+
+from src.telegram.callback_data import (
+    MAX_CALLBACK_DATA_BYTES,
+    decode_callback_data,
+    encode_callback_data,
+)
+
+
+class TestCallbackData(TestCase):
+    def test_round_trip(self) -> None:
+        data = encode_callback_data("request", "accept", "q1W2e3R4")
+        self.assertEqual(data, "r:a:q1W2e3R4")
+        self.assertEqual(
+            decode_callback_data(data),
+            dict(command="request", value="accept", id="q1W2e3R4"),
+        )
+
+    def test_round_trip_without_id(self) -> None:
+        data = encode_callback_data("gender", "female")
+        self.assertEqual(
+            decode_callback_data(data), dict(command="gender", value="female")
+        )
+
+    def test_decodes_legacy_json(self) -> None:
+        legacy = dict(command="request", value="accept", id="q1W2e3R4")
+        self.assertEqual(decode_callback_data(json.dumps(legacy)), legacy)
+
+    def test_rejects_data_over_64_bytes(self) -> None:
+        with self.assertRaises(ValueError):
+            encode_callback_data("request", "accept", "x" * MAX_CALLBACK_DATA_BYTES)
+
+    def test_rejects_separator_in_value(self) -> None:
+        with self.assertRaises(ValueError):
+            encode_callback_data("language", "a:b")
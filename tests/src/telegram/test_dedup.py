@@ -0,0 +1,48 @@
+from unittest import TestCase, mock
+
+from src.telegram.dedup import LocalSeenSet, UpdateDeduplicator
+
+
+class TestLocalSeenSet(TestCase):
+    def test_add(self) -> None:
+        seen = LocalSeenSet()
+        assert seen.add("1")
+        assert not seen.add("1")
+        seen.discard("1")
+        assert seen.add("1")
+
+    def test_bounded_size(self) -> None:
+        seen = LocalSeenSet(maxsize=3)
+        for key in "abcde":
+            seen.add(key)
+        assert len(seen) == 3
+        # the oldest keys were evicted
+        assert seen.add("a")
+
+    @mock.patch("src.telegram.dedup.monotonic")
+    def test_expiry(self, mock_monotonic: mock.Mock) -> None:
+        seen = LocalSeenSet(ttl=10)
+        mock_monotonic.return_value = 100
+        seen.add("1")
+        mock_monotonic.return_value = 109
+        assert not seen.add("1")
+        mock_monotonic.return_value = 111
+        assert seen.add("1")
+
+
+class TestUpdateDeduplicator(TestCase):
+    def test_shared_set_catches_other_workers(self) -> None:
+        # a second LocalSeenSet stands in for the shared Firestore backend
+        shared = LocalSeenSet()
+        worker_1 = UpdateDeduplicator(LocalSeenSet(), shared)
+        worker_2 = UpdateDeduplicator(LocalSeenSet(), shared)
+        assert not worker_1.is_duplicate(42)
+        assert worker_1.is_duplicate(42)
+        assert worker_2.is_duplicate(42)
+        worker_1.forget(42)
+        assert not worker_1.is_duplicate(42)
+
+    def test_missing_update_id(self) -> None:
+        deduplicator = UpdateDeduplicator(LocalSeenSet())
+        assert not deduplicator.is_duplicate(None)
+        assert not deduplicator.is_duplicate(None)
@@ -0,0 +1,67 @@
+from unittest import TestCase, mock
+
+from src.telegram.dispatch import Dispatcher, dispatcher
+from src.telegram.update import TelegramBotUpdate
+
+
+def message(text: str = None, location: bool = False, edited: bool = False):
+    body = {"message_id": 1, "chat": {"id": 1, "username": "user1"}}
+    if text is not None:
+        body["text"] = text
+    if location:
+        body["location"] = {"latitude": 1.3, "longitude": 103.8}
+    key = "edited_message" if edited else "message"
+    return TelegramBotUpdate({"update_id": 1, key: body})
+
+
+def callback(data: str) -> TelegramBotUpdate:
+    return TelegramBotUpdate(
+        {
+            "update_id": 1,
+            "callback_query": {
+                "id": "1",
+                "data": data,
+                "message": {"message_id": 1, "chat": {"id": 1}},
+            },
+        }
+    )
+
+
+class TestDispatcher(TestCase):
+    def setUp(self) -> None:
+        self.dispatcher = Dispatcher()
+        self.start = mock.Mock(return_value="start")
+        self.location = mock.Mock(return_value="location")
+        self.accept = mock.Mock(return_value="accept")
+        self.fallback = mock.Mock(return_value="fallback")
+        self.dispatcher.command("/start")(self.start)
+        self.dispatcher.location()(self.location)
+        self.dispatcher.callback("request")(self.accept)
+        self.dispatcher.fallback(self.fallback)
+
+    def test_routes_command(self) -> None:
+        self.assertEqual(self.dispatcher.dispatch(message("/start")), "start")
+
+    def test_routes_live_location_edits(self) -> None:
+        self.assertEqual(self.dispatcher.dispatch(message(location=True)), "location")
+        self.assertEqual(
+            self.dispatcher.dispatch(message(location=True, edited=True)), "location"
+        )
+
+    def test_routes_callback_by_command(self) -> None:
+        update = callback("r:a:q1W2e3R4")
+        self.assertEqual(self.dispatcher.dispatch(update), "accept")
+        self.accept.assert_called_once_with(update)
+
+    def test_ignores_unknown_messages_and_callbacks(self) -> None:
+        self.assertIsNone(self.dispatcher.dispatch(message("hello")))
+        self.assertIsNone(self.dispatcher.dispatch(callback("g:female")))
+        self.fallback.assert_not_called()
+
+    def test_falls_back_for_other_types(self) -> None:
+        update = TelegramBotUpdate({"update_id": 1, "poll": {"id": "1"}})
+        self.assertEqual(self.dispatcher.dispatch(update), "fallback")
+
+    def test_default_routes(self) -> None:
+        self.assertIn(("callback_query", "language"), dispatcher._routes)
+        self.assertIn(("message", "/start"), dispatcher._routes)
@@ -0,0 +1,206 @@
+import json
+from typing import Any, List
+from unittest import TestCase, mock
+
+from src.constants import Message
+from src.help_requests import InMemoryHelpRequestStore
+from src.pwid_profiles import CachedPwidProfileStore, InMemoryPwidProfileStore
+from src.security_images import icon_url
+from src.telegram import blocking_bot
+from src.telegram.dispatch import dispatch
+from src.telegram.handlers import CallbackQueryHandler
+from src.telegram.media import MediaCache
+from src.telegram.protocol import run_sync
+from src.telegram.update import TelegramBotUpdate
+from src.volunteer_index import AvailableVolunteerIndex
+from src.volunteer_repository import InMemoryVolunteerRepository
+
+
+def callback_query(chat_id: int, data: Any) -> TelegramBotUpdate:
+    return TelegramBotUpdate(
+        {
+            "update_id": chat_id,
+            "callback_query": {
+                "id": str(chat_id),
+                "data": json.dumps(data),
+                "message": {
+                    "message_id": chat_id * 10,
+                    "chat": {"id": chat_id, "username": f"user{chat_id}"},
+                },
+            },
+        }
+    )
+
+
+@mock.patch("src.telegram.TelegramApiWrapper._post_json")
+class TestAcceptVolunteer(TestCase):
+    def setUp(self) -> None:
+        self.store = InMemoryHelpRequestStore()
+        self.volunteers = InMemoryVolunteerRepository()
+        for chat_id in (1, 2, 3):
+            self.volunteers.create(f"user{chat_id}", dict(available=True))
+        for target, value in [
+            ("src.telegram.handlers.help_requests", self.store),
+            ("src.telegram.handlers.volunteers", self.volunteers),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.request = self.store.create("pwid", dict(lat=1.3, long=103.8))
+        self.store.add_recipients(self.request["id"], {1: 10, 2: 20, 3: 30})
+
+    def accept_volunteer(self, update: TelegramBotUpdate) -> Any:
+        return run_sync(CallbackQueryHandler(blocking_bot).accept_volunteer(update))
+
+    def accept(self, chat_id: int) -> TelegramBotUpdate:
+        data = dict(command="request", value="accept", id=self.request["id"])
+        return callback_query(chat_id, data)
+
+    def edited_texts(self, mock_post: mock.Mock) -> Any:
+        return {
+            (c.args[0]["chat_id"], c.args[0]["text"])
+            for c in mock_post.call_args_list
+            if c.args[1].endswith("/editMessageText")
+        }
+
+    def test_first_accept_claims_and_retracts(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True}
+        # retract on this thread rather than in the background
+        with mock.patch.object(blocking_bot, "spawn", run_sync):
+            self.accept_volunteer(self.accept(1))
+        assert self.store.get(self.request["id"])["claimed_by"] == "user1"
+        assert not self.volunteers.get("user1")["available"]
+        assert self.edited_texts(mock_post) == {
+            (2, Message.BROADCAST_ACCEPTED),
+            (3, Message.BROADCAST_ACCEPTED),
+        }
+
+    @mock.patch("src.telegram.handlers.escalations")
+    def test_accept_cancels_escalation(
+        self, mock_escalations: mock.Mock, mock_post: mock.Mock
+    ) -> None:
+        mock_post.return_value = {"ok": True}
+        with mock.patch("src.telegram.handlers.retract_broadcast"):
+            self.accept_volunteer(self.accept(1))
+        mock_escalations.cancel.assert_called_once_with(self.request["id"])
+
+    def test_accepted_message_has_pwid_profile(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True}
+        profiles = CachedPwidProfileStore(InMemoryPwidProfileStore())
+        profiles.set("pwid", dict(name="Jane <Tan>", disabilities=["autism"]))
+        with mock.patch("src.telegram.volunteers.pwid_profiles", profiles), mock.patch(
+            "src.telegram.handlers.retract_broadcast"
+        ):
+            self.accept_volunteer(self.accept(1))
+        texts = [
+            c.args[0]["text"]
+            for c in mock_post.call_args_list
+            if c.args[1].endswith("/sendMessage")
+        ]
+        assert "Name: Jane &lt;Tan&gt;" in texts[0]
+        assert "Caregiver Contact Number: Unknown" in texts[0]
+        assert "Long: 103.8, Lat 1.3" in texts[0]
+        assert "Disabilities: autism" in texts[0]
+
+    def test_accepted_message_without_pwid_profile(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True}
+        profiles = mock.Mock()
+        profiles.get.side_effect = TimeoutError()
+        with mock.patch("src.telegram.volunteers.pwid_profiles", profiles), mock.patch(
+            "src.telegram.handlers.retract_broadcast"
+        ):
+            self.accept_volunteer(self.accept(1))
+        texts = [
+            c.args[0]["text"]
+            for c in mock_post.call_args_list
+            if c.args[1].endswith("/sendMessage")
+        ]
+        assert "Name: Unknown" in texts[0]
+        assert "Long: 103.8, Lat 1.3" in texts[0]
+
+    def test_sends_icon_of_request_by_file_id(self, mock_post: mock.Mock) -> None:
+        def post(json: Any, url: str) -> Any:
+            if not url.endswith("/sendPhoto"):
+                return {"ok": True}
+            sizes = [dict(file_id="thumb", width=90), dict(file_id="star", width=320)]
+            return {"ok": True, "result": {"photo": sizes}}
+
+        mock_post.side_effect = post
+        other = self.store.create("pwid2", dict(lat=1.3, long=103.8))
+        for request in (self.request, other):
+            self.store.set_security_image(request["id"], "STAR")
+        with mock.patch.object(blocking_bot.bot, "media", MediaCache()), mock.patch(
+            "src.telegram.handlers.retract_broadcast"
+        ):
+            self.accept_volunteer(self.accept(1))
+            data = dict(command="request", value="accept", id=other["id"])
+            self.accept_volunteer(callback_query(2, data))
+        photos = [
+            (c.args[0]["chat_id"], c.args[0]["photo"])
+            for c in mock_post.call_args_list
+            if c.args[1].endswith("/sendPhoto")
+        ]
+        # the second volunteer gets the photo Telegram already has
+        assert photos == [(1, icon_url("STAR")), (2, "star")]
+
+    def test_second_accept_is_refused(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True}
+        self.store.claim(self.request["id"], "user1", 1)
+        self.accept_volunteer(self.accept(2))
+        assert self.store.get(self.request["id"])["claimed_by"] == "user1"
+        assert self.edited_texts(mock_post) == {(2, Message.BROADCAST_ACCEPTED)}
+        methods = [c.args[1].rsplit("/", 1)[-1] for c in mock_post.call_args_list]
+        assert "sendPhoto" not in methods
+
+    def test_decline(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True}
+        data = dict(command="request", value="reject", id=self.request["id"])
+        self.accept_volunteer(callback_query(2, data))
+        assert self.store.get(self.request["id"])["claimed_by"] is None
+        assert self.edited_texts(mock_post) == {(2, Message.REQUEST_DECLINED)}
+
+
+def poll_answer(chat_id: int, option_ids: List[int]) -> TelegramBotUpdate:
+    return TelegramBotUpdate(
+        {
+            "update_id": chat_id,
+            "poll_answer": {
+                "poll_id": "1",
+                "user": {"id": chat_id, "is_bot": False, "username": f"user{chat_id}"},
+                "option_ids": option_ids,
+            },
+        }
+    )
+
+
+@mock.patch("src.telegram.TelegramApiWrapper._post_json")
+class TestPollAnswer(TestCase):
+    def setUp(self) -> None:
+        self.volunteers = InMemoryVolunteerRepository()
+        self.volunteers.create("user1", dict(available=False))
+        self.index = AvailableVolunteerIndex()
+        for target, value in [
+            ("src.telegram.handlers.volunteers", self.volunteers),
+            ("src.telegram.handlers.available_index", self.index),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_languages_complete_onboarding(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True}
+        dispatch(poll_answer(1, [0, 2]))
+        volunteer = self.volunteers.get("user1")
+        assert volunteer["available"]
+        assert volunteer["language"] == ["en", "hk"]
+        assert "user1" in self.index.volunteers()
+        first = mock_post.call_args_list[0].args[0]
+        assert (first["chat_id"], first["text"]) == (
+            1,
+            Message.ONBOARD_SUCCESS.format("user1"),
+        )
+
+    def test_retracted_vote_is_ignored(self, mock_post: mock.Mock) -> None:
+        dispatch(poll_answer(1, []))
+        assert not self.volunteers.get("user1")["available"]
+        mock_post.assert_not_called()
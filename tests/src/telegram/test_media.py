@@ -0,0 +1,70 @@
+import asyncio
+from unittest import TestCase, mock
+
+from src.telegram import TelegramBot
+from src.telegram.async_bot import AsyncTelegramBot
+from src.telegram.media import MediaCache
+from src.telegram.outbox import Outbox
+from src.telegram.ratelimit import TokenBucket
+from tests.fakes import FakeFirestore, FakeTelegramServer
+
+PHOTO_URL = "https://example.com/duck.png"
+
+
+class TestMediaCache(TestCase):
+    def test_file_ids_survive_restart(self) -> None:
+        db = FakeFirestore()
+        MediaCache(db).set(PHOTO_URL, "photo-1")
+        restarted = MediaCache(db)
+        assert restarted.get(PHOTO_URL) == "photo-1"
+        restarted.forget(PHOTO_URL)
+        assert MediaCache(db).get(PHOTO_URL) is None
+
+
+class TestSendPhoto(TestCase):
+    def setUp(self) -> None:
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch("src.telegram.TELEGRAM_API_URL", self.server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.media = MediaCache()
+        self.outbox = Outbox(TokenBucket(1e6), 1e6)
+
+    def sent_photos(self) -> list:
+        return [r["photo"] for r in self.server.requests if r["method"] == "sendPhoto"]
+
+    def test_reuses_file_id(self) -> None:
+        bot = TelegramBot("token", outbox=self.outbox, media=self.media)
+        assert bot.send_photo(1, PHOTO_URL)["ok"]
+        assert bot.send_photo(2, PHOTO_URL)["ok"]
+        # the largest size is kept, not the thumbnail
+        assert self.sent_photos() == [PHOTO_URL, "photo-1"]
+
+    def test_resends_url_when_file_id_is_rejected(self) -> None:
+        self.media.set(PHOTO_URL, "photo-of-another-bot")
+        bot = TelegramBot("token", outbox=self.outbox, media=self.media)
+        assert bot.send_photo(1, PHOTO_URL)["ok"]
+        assert self.sent_photos() == ["photo-of-another-bot", PHOTO_URL]
+        assert self.media.get(PHOTO_URL) == "photo-2"
+
+    def test_upload_media_skips_cached_photos(self) -> None:
+        bot = TelegramBot("token", outbox=self.outbox, media=self.media)
+        photos = dict(SMILE=PHOTO_URL, STAR="https://example.com/star.png")
+        assert bot.upload_media(-100, photos) == 2
+        assert bot.upload_media(-100, photos) == 0
+        assert self.server.calls["deleteMessage"] == 2
+        assert bot.send_photo(1, PHOTO_URL, media_key="SMILE")["ok"]
+        assert self.sent_photos()[-1] == "photo-1"
+
+    def test_async_bot_reuses_file_id(self) -> None:
+        async def send_twice() -> None:
+            bot = AsyncTelegramBot("token", outbox=self.outbox, media=self.media)
+            try:
+                await bot.send_photo(1, PHOTO_URL)
+                await bot.send_photo(2, PHOTO_URL)
+            finally:
+                await bot.aclose()
+
+        asyncio.run(send_twice())
+        assert self.sent_photos() == [PHOTO_URL, "photo-1"]
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from time import monotonic, sleep
+from typing import List
+from unittest import TestCase, mock
+
+from src.telegram import TelegramBot
+from src.telegram.outbox import Outbox, Priority
+from src.telegram.ratelimit import TokenBucket
+
+
+def wait_for_depth(outbox: Outbox, depth: int) -> None:
+    deadline = monotonic() + 5
+    while sum(outbox.depth().values()) < depth and monotonic() < deadline:
+        sleep(0.005)
+
+
+class TestOutbox(TestCase):
+    def test_takes_free_slot_at_once(self) -> None:
+        outbox = Outbox(TokenBucket(1000, 10))
+        assert outbox.acquire(Priority.ALERT, 1) == 0.0
+        stats = outbox.stats()
+        assert stats["depth"] == 0
+        assert stats["priorities"]["alert"]["sent"] == 1
+
+    def test_grants_slots_by_priority(self) -> None:
+        outbox = Outbox(TokenBucket(20), chat_rate=1000)
+        outbox.acquire(Priority.FOLLOW_UP, 0)
+        granted: List[Priority] = []
+
+        def send(priority: Priority, chat_id: int) -> None:
+            outbox.acquire(priority, chat_id)
+            granted.append(priority)
+
+        threads = [
+            threading.Thread(target=send, args=(Priority.ONBOARDING, i))
+            for i in range(1, 4)
+        ]
+        for thread in threads:
+            thread.start()
+        wait_for_depth(outbox, 3)
+        threads.append(threading.Thread(target=send, args=(Priority.ALERT, 4)))
+        threads[-1].start()
+        for thread in threads:
+            thread.join(5)
+        # the first onboarding prompt may already hold the next token
+        assert granted.index(Priority.ALERT) <= 1
+        assert outbox.stats()["priorities"]["onboarding"]["max_wait"] > 0
+
+    def test_limits_each_chat(self) -> None:
+        outbox = Outbox(TokenBucket(1000, 1000), chat_rate=5, chat_burst=1)
+        outbox.acquire(Priority.FOLLOW_UP, 1)
+        started_at = monotonic()
+        waits = {}
+
+        def send(chat_id: int) -> None:
+            waits[chat_id] = outbox.acquire(Priority.FOLLOW_UP, chat_id)
+
+        threads = [threading.Thread(target=send, args=(chat_id,)) for chat_id in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        # the second message to chat 1 waits for its bucket, chat 2 does not
+        assert monotonic() - started_at >= 0.15
+        assert waits[2] < 0.1
+
+    def test_acquire_async(self) -> None:
+        outbox = Outbox(TokenBucket(50), chat_rate=1000)
+
+        async def send_all() -> List[float]:
+            return await asyncio.gather(
+                *(outbox.acquire_async(Priority.ALERT, i) for i in range(5))
+            )
+
+        started_at = monotonic()
+        waits = asyncio.run(send_all())
+        assert monotonic() - started_at >= 4 / 50
+        assert waits[0] == 0.0
+        assert outbox.stats()["priorities"]["alert"]["sent"] == 5
+
+
+class TestTelegramBotOutbox(TestCase):
+    @mock.patch("src.telegram.TelegramApiWrapper._post_json")
+    def test_methods_take_a_slot(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True, "result": {}}
+        outbox = mock.Mock()
+        bot = TelegramBot("token", outbox=outbox)
+        bot.send_message(1, "hi", priority=Priority.ONBOARDING)
+        bot.broadcast("help", [2])
+        bot.edit_message_text(3, 4, "taken")
+        bot.answer_callback_query(5)
+        assert outbox.acquire.call_args_list == [
+            mock.call(Priority.ONBOARDING, 1),
+            mock.call(Priority.ALERT, 2),
+            mock.call(Priority.FOLLOW_UP, 3),
+        ]
+        assert mock_post.call_count == 4
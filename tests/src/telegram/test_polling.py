@@ -0,0 +1,83 @@
+from typing import Any, List
+from unittest import TestCase, mock
+
+from src.telegram.dedup import LocalSeenSet, UpdateDeduplicator
+from src.telegram.polling import UpdatePoller
+from src.telegram.update_queue import UpdateQueue
+
+
+def message(update_id: int, chat_id: int) -> Any:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "chat": {"id": chat_id, "username": f"user{chat_id}"},
+            "text": "/start",
+        },
+    }
+
+
+class TestUpdatePoller(TestCase):
+    def setUp(self) -> None:
+        self.bot = mock.Mock()
+        self.handled: List[Any] = []
+
+    def test_commits_offset_after_batch(self) -> None:
+        self.bot.get_updates.side_effect = [
+            {"ok": True, "result": [message(1, 10), message(2, 11)]},
+            {"ok": True, "result": []},
+        ]
+        poller = UpdatePoller(self.bot, self.handled.append)
+        assert poller.poll_once() == 2
+        assert [u.update_id for u in self.handled] == [1, 2]
+        assert poller.offset == 3
+        poller.poll_once()
+        assert self.bot.get_updates.call_args_list[1].args[0] == 3
+
+    def test_drops_duplicates_and_survives_handler_errors(self) -> None:
+        def handle(update: Any) -> None:
+            self.handled.append(update)
+            raise ValueError("boom")
+
+        self.bot.get_updates.return_value = {
+            "ok": True,
+            "result": [message(1, 10), message(1, 10), message(2, 10)],
+        }
+        deduplicator = UpdateDeduplicator(LocalSeenSet())
+        poller = UpdatePoller(self.bot, handle, deduplicator)
+        poller.poll_once()
+        assert [u.update_id for u in self.handled] == [1, 2]
+        assert poller.offset == 3
+
+    def test_batch_on_update_queue(self) -> None:
+        self.bot.get_updates.return_value = {
+            "ok": True,
+            "result": [message(i, i % 3) for i in range(1, 31)],
+        }
+        update_queue = UpdateQueue(self.handled.append, workers=3)
+        poller = UpdatePoller(self.bot, self.handled.append, update_queue=update_queue)
+        poller.poll_once()
+        # the whole batch is processed before the offset moves on
+        assert len(self.handled) == 30
+        assert poller.offset == 31
+        update_queue.stop()
+
+    def test_failed_poll(self) -> None:
+        self.bot.get_updates.return_value = {"ok": False, "description": "Conflict"}
+        poller = UpdatePoller(self.bot, self.handled.append)
+        assert poller.poll_once() == 0
+        assert poller.offset is None
+        assert poller.failures == 1
+
+    def test_run_backs_off_failed_polls(self) -> None:
+        stop = mock.Mock()
+        stop.is_set.side_effect = [False, False, False, True]
+        self.bot.get_updates.side_effect = [
+            {"ok": False, "description": "Conflict"},
+            ConnectionError(),
+            {"ok": True, "result": []},
+        ]
+        poller = UpdatePoller(self.bot, self.handled.append)
+        poller.run(stop)
+        assert [c.args[0] for c in stop.wait.call_args_list] == [1.0, 2.0]
+        assert poller.failures == 0
@@ -0,0 +1,34 @@
+import asyncio
+from unittest import TestCase, mock
+
+from src.telegram import BlockingBot, TelegramBot
+from src.telegram.protocol import run_sync
+
+
+class TestRunSync(TestCase):
+    @mock.patch("src.telegram.TelegramApiWrapper._post_json")
+    def test_runs_blocking_bot_calls(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True, "result": {"message_id": 1}}
+        bot = BlockingBot(TelegramBot("token"))
+
+        async def ask() -> int:
+            sent = await bot.send_poll(1, "?", ["a", "b"])
+            return await bot.offload(lambda: sent["result"]["message_id"] + 1)
+
+        assert run_sync(ask()) == 2
+
+    @mock.patch("src.telegram.TelegramApiWrapper._post_json")
+    def test_send_poll_keeps_positional_markup(self, mock_post: mock.Mock) -> None:
+        mock_post.return_value = {"ok": True}
+        bot = BlockingBot(TelegramBot("token"))
+        markup = dict(inline_keyboard=[])
+        run_sync(bot.send_poll(1, "?", ["a", "b"], False, 60, True, markup))
+        run_sync(bot.send_poll(1, "?", ["a", "b"], protect_content=True))
+        first, second = (c.args[0] for c in mock_post.call_args_list)
+        assert first["reply_markup"] == markup
+        assert "protect_content" not in first
+        assert second["protect_content"] is True
+
+    def test_refuses_coroutines_needing_a_loop(self) -> None:
+        with self.assertRaises(RuntimeError):
+            run_sync(asyncio.sleep(0))
@@ -0,0 +1,52 @@
+from time import monotonic
+from unittest import TestCase, mock
+
+from src.telegram import TelegramBot
+from src.telegram.ratelimit import TokenBucket
+from src.telegram.volunteers import broadcast_message_to_stream
+
+
+def sent_message(json):
+    return {
+        "ok": True,
+        "result": {"message_id": json["chat_id"] * 10, "chat": {"id": json["chat_id"]}},
+    }
+
+
+class TestBroadcast(TestCase):
+    @mock.patch("src.telegram.TelegramApiWrapper.send_message")
+    def test_broadcast_returns_result_per_chat(self, mock_send: mock.Mock) -> None:
+        mock_send.side_effect = sent_message
+        bot = TelegramBot("token", rate_limiter=TokenBucket(1000, 1000))
+        results = bot.broadcast("hello", [1, 2, 3])
+        assert [r["chat_id"] for r in results] == [1, 2, 3]
+        assert [r["message_id"] for r in results] == [10, 20, 30]
+        assert all(r["error"] is None for r in results)
+        assert all(r["latency"] >= 0 for r in results)
+
+    @mock.patch("src.telegram.volunteers.bot")
+    def test_broadcast_to_stream_uses_chat_ids(self, mock_bot: mock.Mock) -> None:
+        users = [
+            dict(username="alice", chat_id=1),
+            dict(username="bob"),
+            dict(username="carol", chat_id=3),
+        ]
+        broadcast_message_to_stream(iter(users), "hello")
+        assert mock_bot.broadcast.call_args.args[:2] == ("hello", [1, 3])
+
+    @mock.patch("src.telegram.TelegramApiWrapper.send_message")
+    def test_broadcast_reports_errors(self, mock_send: mock.Mock) -> None:
+        mock_send.return_value = {"ok": False, "description": "Forbidden"}
+        bot = TelegramBot("token", rate_limiter=TokenBucket(1000, 1000))
+        results = bot.broadcast("hello", [1])
+        assert results[0]["message_id"] is None
+        assert results[0]["error"] == "Forbidden"
+
+    @mock.patch("src.telegram.TelegramApiWrapper.send_message")
+    def test_broadcast_respects_rate_limit(self, mock_send: mock.Mock) -> None:
+        mock_send.side_effect = sent_message
+        bot = TelegramBot("token", rate_limiter=TokenBucket(20))
+        started_at = monotonic()
+        bot.broadcast("hello", list(range(1, 11)))
+        # the first token is available immediately, the other 9 need 1/20s each
+        assert monotonic() - started_at >= 9 / 20
@@ -0,0 +1,121 @@
+import asyncio
+from typing import Any, List
+from unittest import TestCase, mock
+
+import requests
+
+from src.telegram.transport import AsyncHttpTransport, CircuitBreaker, HttpTransport
+from tests.fakes import FakeTelegramServer
+
+URL = "https://api.telegram.org/bottoken/sendMessage"
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: Any) -> None:
+        self.status_code = status_code
+        self.body = body
+
+    def json(self) -> Any:
+        return self.body
+
+
+class FakeSession:
+    def __init__(self, responses: List[Any]) -> None:
+        self.responses = responses
+        self.calls: List[Any] = []
+
+    def post(self, url: str, json: Any, timeout: Any) -> FakeResponse:
+        self.calls.append((url, json, timeout))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestHttpTransport(TestCase):
+    @mock.patch("src.telegram.transport.sleep")
+    def test_retries_after_rate_limit(self, mock_sleep: mock.Mock) -> None:
+        session = FakeSession(
+            [
+                FakeResponse(429, {"ok": False, "parameters": {"retry_after": 3}}),
+                FakeResponse(200, {"ok": True, "result": {}}),
+            ]
+        )
+        transport = HttpTransport(session=session)  # type: ignore
+        assert transport.post(URL, {}) == {"ok": True, "result": {}}
+        mock_sleep.assert_called_once_with(3)
+        assert len(session.calls) == 2
+
+    @mock.patch("src.telegram.transport.sleep")
+    def test_uses_method_timeout(self, _: mock.Mock) -> None:
+        session = FakeSession([FakeResponse(200, {"ok": True})])
+        transport = HttpTransport(
+            timeout=(1, 2),
+            method_timeouts={"sendMessage": (3, 4)},
+            session=session,  # type: ignore
+        )
+        transport.post(URL, {})
+        assert session.calls[0][2] == (3, 4)
+
+    @mock.patch("src.telegram.transport.sleep")
+    def test_circuit_opens_after_failures(self, _: mock.Mock) -> None:
+        session = FakeSession([requests.ConnectTimeout("down")] * 2)
+        transport = HttpTransport(
+            max_retries=1,
+            circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+            session=session,  # type: ignore
+        )
+        assert transport.post(URL, {})["ok"] is False
+        resp = transport.post(URL, {})
+        assert resp["description"] == "Telegram API circuit is open"
+        assert len(session.calls) == 2
+
+    @mock.patch("src.telegram.transport.sleep")
+    def test_resends_only_what_did_not_reach_telegram(self, _: mock.Mock) -> None:
+        session = FakeSession(
+            [
+                requests.ConnectTimeout("connect"),
+                requests.ReadTimeout("read"),
+                FakeResponse(502, {"ok": False}),
+                requests.ReadTimeout("read"),
+                FakeResponse(200, {"ok": True}),
+            ]
+        )
+        transport = HttpTransport(session=session)  # type: ignore
+        # the alert may have been delivered, sending it again would duplicate it
+        assert transport.post(URL, {})["description"] == "read"
+        assert transport.post(URL, {}) == {"ok": False}
+        assert len(session.calls) == 3
+        edit_url = URL.replace("sendMessage", "editMessageText")
+        assert transport.post(edit_url, {}) == {"ok": True}
+        assert len(session.calls) == 5
+
+
+class TestHttpTransportWithFakeServer(TestCase):
+    @mock.patch("src.telegram.transport.sleep")
+    def test_retries_rate_limited_call(self, mock_sleep: mock.Mock) -> None:
+        with FakeTelegramServer(rate_limit_ratio=0.5, retry_after=2) as server:
+            transport = HttpTransport(max_retries=20)
+            resp = transport.post(f"{server.url}/bottoken/sendMessage", {"chat_id": 1})
+        assert resp["ok"]
+        assert resp["result"]["chat"]["id"] == 1
+        assert server.calls["sendMessage"] == mock_sleep.call_count + 1
+
+
+class TestAsyncHttpTransportWithFakeServer(TestCase):
+    @mock.patch("src.telegram.transport.asyncio.sleep", new_callable=mock.AsyncMock)
+    def test_retries_rate_limited_call(self, mock_sleep: mock.AsyncMock) -> None:
+        async def post(url: str) -> Any:
+            transport = AsyncHttpTransport(max_retries=20)
+            try:
+                return await transport.post(
+                    f"{url}/bottoken/sendMessage", {"chat_id": 1}
+                )
+            finally:
+                await transport.aclose()
+
+        with FakeTelegramServer(rate_limit_ratio=0.5, retry_after=2) as server:
+            resp = asyncio.run(post(server.url))
+        assert resp["ok"]
+        assert resp["result"]["chat"]["id"] == 1
+        assert server.calls["sendMessage"] == mock_sleep.await_count + 1
@@ -0,0 +1,110 @@
+from unittest import TestCase
+
+from src.telegram.update import TelegramBotUpdate, TelegramBotUpdateTypes
+
+USER = {"id": 7, "is_bot": False, "first_name": "Alice", "username": "alice"}
+CHAT = {"id": 7, "first_name": "Alice", "username": "alice", "type": "private"}
+MESSAGE = {"message_id": 3, "from": USER, "chat": CHAT, "date": 1, "text": "hi"}
+CHANNEL_POST = {
+    "message_id": 4,
+    "chat": {"id": -100, "title": "news", "type": "channel"},
+    "date": 1,
+    "text": "post",
+}
+PAYLOADS = {
+    TelegramBotUpdateTypes.MESSAGE: MESSAGE,
+    TelegramBotUpdateTypes.EDITED_MESSAGE: MESSAGE,
+    TelegramBotUpdateTypes.CHANNEL_POST: CHANNEL_POST,
+    TelegramBotUpdateTypes.EDITED_CHANNEL_POST: CHANNEL_POST,
+    TelegramBotUpdateTypes.INLINE_QUERY: {
+        "id": "q",
+        "from": USER,
+        "query": "",
+        "offset": "",
+    },
+    TelegramBotUpdateTypes.CHOSEN_INLINE_RESULT: {
+        "result_id": "r",
+        "from": USER,
+        "query": "",
+    },
+    TelegramBotUpdateTypes.CALLBACK_QUERY: {
+        "id": "c",
+        "from": USER,
+        "message": MESSAGE,
+        "chat_instance": "1",
+        "data": "g:female",
+    },
+    TelegramBotUpdateTypes.SHIPPING_QUERY: {
+        "id": "s",
+        "from": USER,
+        "invoice_payload": "",
+        "shipping_address": {},
+    },
+    TelegramBotUpdateTypes.PRE_CHECKOUT_QUERY: {
+        "id": "p",
+        "from": USER,
+        "currency": "SGD",
+        "total_amount": 1,
+        "invoice_payload": "",
+    },
+    TelegramBotUpdateTypes.POLL: {"id": "poll", "question": "?", "options": []},
+    TelegramBotUpdateTypes.POLL_ANSWER: {
+        "poll_id": "poll",
+        "user": USER,
+        "option_ids": [1],
+    },
+}
+
+
+class TestTelegramBotUpdate(TestCase):
+    def test_every_type(self) -> None:
+        for update_type, payload in PAYLOADS.items():
+            with self.subTest(update_type):
+                update = TelegramBotUpdate({"update_id": 1, update_type: payload})
+                self.assertEqual(update.type, update_type)
+                self.assertEqual(update.update_id, 1)
+                self.assertIs(update.payload, payload)
+
+    def test_message_fields(self) -> None:
+        update = TelegramBotUpdate({"update_id": 1, "message": MESSAGE})
+        self.assertEqual(update.chat_id, 7)
+        self.assertEqual(update.username, "alice")
+        self.assertEqual(update.first_name, "Alice")
+        self.assertEqual(update.message_id, 3)
+        self.assertEqual(update.text, "hi")
+        self.assertIsNone(update.location)
+        self.assertTrue(update.is_private)
+        self.assertEqual(update.callback_data, {})
+
+    def test_callback_query_fields(self) -> None:
+        payload = PAYLOADS[TelegramBotUpdateTypes.CALLBACK_QUERY]
+        update = TelegramBotUpdate({"update_id": 1, "callback_query": payload})
+        self.assertEqual(update.chat_id, 7)
+        self.assertEqual(update.message_id, 3)
+        self.assertEqual(update.callback_query_id, "c")
+        self.assertEqual(update.callback_data, dict(command="gender", value="female"))
+
+    def test_poll_answer_fields(self) -> None:
+        payload = PAYLOADS[TelegramBotUpdateTypes.POLL_ANSWER]
+        update = TelegramBotUpdate({"update_id": 1, "poll_answer": payload})
+        self.assertIsNone(update.chat_id)
+        self.assertFalse(update.is_private)
+        self.assertEqual(update.user_id, 7)
+        self.assertEqual(update.username, "alice")
+        self.assertEqual(update.poll_id, "poll")
+        self.assertEqual(update.option_ids, [1])
+
+    def test_channel_post_is_not_private(self) -> None:
+        update = TelegramBotUpdate({"update_id": 1, "channel_post": CHANNEL_POST})
+        self.assertEqual(update.chat_id, -100)
+        self.assertFalse(update.is_private)
+        self.assertIsNone(update.user_id)
+
+    def test_fields_are_parsed_lazily(self) -> None:
+        update = TelegramBotUpdate(
+            {"update_id": 1, "callback_query": {"id": "c", "data": "{not json"}}
+        )
+        self.assertEqual(update.type, TelegramBotUpdateTypes.CALLBACK_QUERY)
+        self.assertFalse(hasattr(update, "__dict__"))
+        with self.assertRaises(ValueError):
+            update.callback_data
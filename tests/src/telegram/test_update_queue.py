@@ -0,0 +1,71 @@
+import threading
+from types import SimpleNamespace
+from typing import Any, List
+from unittest import TestCase
+
+from src.telegram.update_queue import UpdateQueue
+
+
+def update(chat_id: int, step: int) -> Any:
+    return SimpleNamespace(type="message", chat_id=chat_id, step=step)
+
+
+class TestUpdateQueue(TestCase):
+    def test_updates_of_a_chat_are_processed_in_order(self) -> None:
+        handled: List[Any] = []
+        update_queue = UpdateQueue(handled.append, workers=4, maxsize=400)
+        for step in range(50):
+            for chat_id in range(4):
+                assert update_queue.submit(update(chat_id, step))
+        update_queue.join()
+        for chat_id in range(4):
+            steps = [u.step for u in handled if u.chat_id == chat_id]
+            assert steps == list(range(50))
+        stats = update_queue.stats()
+        assert stats["processed"] == stats["enqueued"] == 200
+        assert stats["depth"] == 0
+        update_queue.stop()
+
+    def test_updates_without_chat_are_sharded_by_user(self) -> None:
+        handled: List[Any] = []
+        workers = set()
+
+        def handle(answer: Any) -> None:
+            workers.add(threading.current_thread().name)
+            handled.append(answer)
+
+        update_queue = UpdateQueue(handle, workers=4, maxsize=400)
+        for step in range(50):
+            for user_id in range(1, 5):
+                answer = SimpleNamespace(
+                    type="poll_answer", chat_id=None, user_id=user_id, step=step
+                )
+                assert update_queue.submit(answer)
+        update_queue.join()
+        for user_id in range(1, 5):
+            steps = [u.step for u in handled if u.user_id == user_id]
+            assert steps == list(range(50))
+        # poll answers are spread over the workers, not all on the first one
+        assert len(workers) == 4
+        update_queue.stop()
+
+    def test_rejects_when_full(self) -> None:
+        release = threading.Event()
+        update_queue = UpdateQueue(lambda _: release.wait(), workers=1, maxsize=2)
+        results = [update_queue.submit(update(1, step)) for step in range(5)]
+        # one update is being handled, two are queued, the rest are rejected
+        assert results.count(False) >= 2
+        assert update_queue.stats()["rejected"] == results.count(False)
+        release.set()
+        update_queue.join()
+        update_queue.stop()
+
+    def test_handler_errors_are_counted(self) -> None:
+        def fail(_: Any) -> None:
+            raise ValueError("boom")
+
+        update_queue = UpdateQueue(fail, workers=1)
+        update_queue.submit(update(1, 0))
+        update_queue.join()
+        assert update_queue.stats()["failed"] == 1
+        update_queue.stop()
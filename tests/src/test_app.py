@@ -1,5 +1,7 @@
 from unittest import mock
 
+from src.help_requests import InMemoryHelpRequestStore
+from src.telegram.dedup import LocalSeenSet, UpdateDeduplicator
 from tests.data import rest
 from tests.test_base import BaseTestCase
 
@@ -11,6 +13,14 @@ class TestHealthAPI(BaseTestCase):
         assert response.status_code == 200
 
 
+class TestMetricsAPI(BaseTestCase):
+    def test_metrics(self) -> None:
+        response = self.client.get("/metrics")
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        assert b"# TYPE telegram_request_duration_seconds histogram" in response.data
+
+
 class TestWebhookAPI(BaseTestCase):
     @mock.patch("src.telegram.TelegramApiWrapper.send_message")
     def test_start_command(self, mock_send_message: mock.Mock) -> None:
@@ -21,3 +31,51 @@ class TestWebhookAPI(BaseTestCase):
             headers={"Content-Type": "application/json"},
         )
         assert response.status_code == 200
+
+    @mock.patch("src.app.update_deduplicator", UpdateDeduplicator(LocalSeenSet()))
+    @mock.patch("src.app.dispatch")
+    def test_failed_update_is_processed_when_redelivered(
+        self, mock_dispatch: mock.Mock
+    ) -> None:
+        mock_dispatch.side_effect = [RuntimeError("Firestore is down"), None]
+        with self.assertRaises(RuntimeError):
+            self.client.post("/webhook", json=rest.MockRequests.START_COMMAND)
+        response = self.client.post("/webhook", json=rest.MockRequests.START_COMMAND)
+        assert response.data == b"No response"
+        assert mock_dispatch.call_count == 2
+
+
+class TestHelpRequestsAPI(BaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.store = InMemoryHelpRequestStore()
+        for target, value in [
+            ("src.app.help_requests", self.store),
+            ("src.app.security_images", mock.Mock()),
+            ("src.app.ADMIN_TOKEN", "secret"),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.request_id = self.store.create("pwid", dict(lat=1.3, long=103.8))["id"]
+
+    def test_open_requests_require_admin_token(self) -> None:
+        assert self.client.get("/requests").status_code == 401
+        response = self.client.get("/requests", headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 401
+        response = self.client.get("/requests", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert [record["id"] for record in response.json["data"]] == [self.request_id]
+
+    def test_resolve_requires_admin_token(self) -> None:
+        path = f"/requests/{self.request_id}/resolve"
+        assert self.client.post(path).status_code == 401
+        assert self.store.open_requests()
+        response = self.client.post(path, headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert not self.store.open_requests()
+
+    @mock.patch("src.app.ADMIN_TOKEN", "")
+    def test_routes_are_disabled_without_admin_token(self) -> None:
+        response = self.client.get("/requests", headers={"X-Admin-Token": ""})
+        assert response.status_code == 401
@@ -0,0 +1,168 @@
+import asyncio
+from time import perf_counter
+from typing import Any
+from unittest import IsolatedAsyncioTestCase, mock
+
+import httpx
+
+from src.asgi import app
+from src.help_requests import InMemoryHelpRequestStore
+from src.telegram.async_bot import async_bot
+from src.telegram.dedup import LocalSeenSet, UpdateDeduplicator
+from src.telegram.outbox import Outbox
+from src.telegram.ratelimit import TokenBucket
+from src.volunteer_repository import InMemoryVolunteerRepository
+from tests.data import rest
+from tests.fakes import FakeTelegramServer
+
+RASP = dict(id="pwid", long="103.8", lat="1.3")
+
+
+class TestAsgiApp(IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = FakeTelegramServer(latency=0.2).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.stop()
+
+    async def asyncSetUp(self) -> None:
+        self.server.calls.clear()
+        self.store = InMemoryHelpRequestStore()
+        self.volunteers = InMemoryVolunteerRepository()
+        volunteers = [dict(chat_id=i) for i in range(1, 4)]
+        self.security_images = mock.Mock(**{"allocate.return_value": "SMILE"})
+        for target, value in [
+            ("src.telegram.TELEGRAM_API_URL", self.server.url),
+            ("src.app.help_requests", self.store),
+            ("src.asgi.update_deduplicator", UpdateDeduplicator(LocalSeenSet())),
+            ("src.app.select_volunteer_waves", lambda *args, **kwargs: [volunteers]),
+            ("src.app.security_images", self.security_images),
+            ("src.telegram.handlers.volunteers", self.volunteers),
+            ("src.telegram.async_bot.async_bot.outbox", Outbox(TokenBucket(1e6), 1e6)),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.client.aclose()
+        await async_bot.aclose()
+
+    async def post(self, path: str, json: Any) -> httpx.Response:
+        return await self.client.post(path, json=json)
+
+    async def test_health(self) -> None:
+        response = await self.client.get("/health")
+        assert response.status_code == 200
+        assert response.content == rest.MockResponse.HEALTH
+
+    async def test_unknown_route_and_method(self) -> None:
+        assert (await self.client.get("/nowhere")).status_code == 404
+        assert (await self.client.get("/rasp")).status_code == 405
+
+    async def test_metrics(self) -> None:
+        response = await self.client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain")
+
+    async def test_start_command(self) -> None:
+        response = await self.post("/webhook", rest.MockRequests.START_COMMAND)
+        assert response.status_code == 200
+        assert response.json()["data"]["chat_id"] == 123
+        assert self.volunteers.get("someusername")["chat_id"] == 123
+        assert self.server.calls["sendMessage"] == 1
+
+    async def test_invalid_rasp(self) -> None:
+        response = await self.post("/rasp", dict(id="pwid", long="x", lat="1"))
+        assert response.status_code == 400
+
+    async def test_concurrent_rasp(self) -> None:
+        started_at = perf_counter()
+        responses = await asyncio.gather(
+            *(self.post("/rasp", dict(RASP, id=f"pwid{i}")) for i in range(20))
+        )
+        elapsed = perf_counter() - started_at
+        assert all(response.status_code == 200 for response in responses)
+        data = responses[0].json()["data"]
+        assert data["recipient_count"] == 3
+        assert data["security_image"]["name"] == "SMILE"
+        assert self.store.get(data["request_id"])["recipients"]
+        assert self.server.calls["sendMessage"] == 60
+        # one after the other, the alerts would take 20 * 0.2s
+        assert elapsed < 3.0
+
+    async def test_alerts_of_request_claimed_mid_wave_are_retracted(self) -> None:
+        add_recipients = self.store.add_recipients
+
+        def claimed_first(request_id: str, recipients: Any) -> None:
+            self.store.claim(request_id, "volunteer", 1)
+            add_recipients(request_id, recipients)
+
+        with mock.patch.object(self.store, "add_recipients", claimed_first):
+            response = await self.post("/rasp", RASP)
+        assert response.status_code == 200
+        await async_bot.aclose()
+        # everybody alerted but the volunteer who accepted
+        assert self.server.calls["editMessageText"] == 2
+
+    async def test_repeated_rasp_is_coalesced(self) -> None:
+        first = (await self.post("/rasp", RASP)).json()["data"]
+        assert not first["coalesced"]
+        moved = dict(RASP, lat="1.31")
+        responses = await asyncio.gather(*(self.post("/rasp", moved) for _ in range(3)))
+        for response in responses:
+            data = response.json()["data"]
+            assert data["coalesced"]
+            assert data["request_id"] == first["request_id"]
+            assert data["recipient_count"] == 3
+        assert self.server.calls["sendMessage"] == 3
+        record = self.store.get(first["request_id"])
+        assert record["location"]["lat"] == 1.31
+        assert record["repeat_count"] == 3
+        # repeats show the icon stored on the request, wherever they land
+        assert record["security_image"] == "SMILE"
+        self.security_images.allocate.assert_called_once_with(first["request_id"])
+
+    async def test_rasp_batch(self) -> None:
+        events = [
+            dict(RASP, id="a"),
+            dict(RASP, id="b"),
+            dict(id="a", long="103.9", lat="1.4"),
+            dict(id="c"),
+        ]
+        response = await self.post("/rasp/batch", events)
+        assert response.status_code == 200
+        data = response.json()["data"]
+        results = data["results"]
+        assert [result["success"] for result in results] == [True, True, True, False]
+        assert data["request_count"] == 2
+        assert results[2]["data"]["coalesced"]
+        assert results[2]["data"]["request_id"] == results[0]["data"]["request_id"]
+        assert self.server.calls["sendMessage"] == 6
+        # the requests are raised at the last location of each PWID
+        record = self.store.get(results[0]["data"]["request_id"])
+        assert record["location"]["lat"] == 1.4
+
+    @mock.patch("src.app.ADMIN_TOKEN", "secret")
+    async def test_help_request_routes_require_admin_token(self) -> None:
+        request_id = self.store.create("pwid", dict(lat=1.3, long=103.8))["id"]
+        resolve = f"/requests/{request_id}/resolve"
+        assert (await self.client.get("/requests")).status_code == 401
+        assert (await self.client.post(resolve)).status_code == 401
+        headers = {"X-Admin-Token": "wrong"}
+        assert (await self.client.get("/requests", headers=headers)).status_code == 401
+        headers = {"X-Admin-Token": "secret"}
+        response = await self.client.get("/requests", headers=headers)
+        assert [record["id"] for record in response.json()["data"]] == [request_id]
+        assert (await self.client.post(resolve, headers=headers)).status_code == 200
+        assert not self.store.open_requests()
+
+    async def test_invalid_rasp_batch(self) -> None:
+        assert (await self.post("/rasp/batch", RASP)).status_code == 400
+        with mock.patch("src.asgi.RASP_BATCH_MAX", 1):
+            response = await self.post("/rasp/batch", dict(events=[RASP, RASP]))
+        assert response.status_code == 413
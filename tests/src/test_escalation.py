@@ -0,0 +1,71 @@
+import threading
+from typing import List
+from unittest import TestCase
+
+from src.escalation import EscalationScheduler
+
+
+class Recorder:
+    def __init__(self, waves: int) -> None:
+        self.waves: List[List[int]] = []
+        self.done = threading.Event()
+        self.expected = waves
+
+    def __call__(self, chat_ids: List[int]) -> None:
+        self.waves.append(chat_ids)
+        if len(self.waves) >= self.expected:
+            self.done.set()
+
+
+class TestEscalationScheduler(TestCase):
+    def setUp(self) -> None:
+        self.open = {"a", "b"}
+        # a single worker sends due waves in the order they fell due
+        self.scheduler = EscalationScheduler(
+            interval=0.05, is_open=lambda request_id: request_id in self.open, workers=1
+        )
+
+    def test_sends_waves_in_order(self) -> None:
+        send = Recorder(2)
+        self.scheduler.schedule("a", [[1, 2], [3, 4, 5]], send)
+        self.assertTrue(send.done.wait(2))
+        self.assertEqual(send.waves, [[1, 2], [3, 4, 5]])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_cancel_drops_pending_waves(self) -> None:
+        cancelled, kept = Recorder(1), Recorder(1)
+        self.scheduler.schedule("a", [[1], [2]], cancelled)
+        self.scheduler.schedule("b", [[3]], kept)
+        self.assertTrue(self.scheduler.cancel("a"))
+        self.assertTrue(kept.done.wait(2))
+        self.assertFalse(cancelled.done.wait(0.15))
+        self.assertFalse(self.scheduler.cancel("a"))
+
+    def test_slow_wave_does_not_hold_up_others(self) -> None:
+        release = threading.Event()
+        scheduler = EscalationScheduler(
+            interval=0.05, is_open=lambda request_id: True, workers=2
+        )
+        kept = Recorder(1)
+        scheduler.schedule("a", [[1]], lambda chat_ids: release.wait(2))
+        scheduler.schedule("b", [[2]], kept)
+        self.assertTrue(kept.done.wait(1))
+        release.set()
+
+    def test_sweeps_periodically(self) -> None:
+        swept = threading.Semaphore(0)
+        scheduler = EscalationScheduler(
+            interval=0.05, sweep=swept.release, sweep_interval=0.05
+        )
+        scheduler.start()
+        self.assertTrue(swept.acquire(timeout=2))
+        self.assertTrue(swept.acquire(timeout=2))
+
+    def test_request_claimed_elsewhere_is_not_escalated(self) -> None:
+        claimed, kept = Recorder(1), Recorder(1)
+        self.open.discard("a")
+        self.scheduler.schedule("a", [[1], [2]], claimed)
+        self.scheduler.schedule("b", [[3]], kept)
+        self.assertTrue(kept.done.wait(2))
+        self.assertFalse(claimed.done.wait(0.15))
+        self.assertEqual(len(self.scheduler), 0)
@@ -0,0 +1,39 @@
+import random
+from unittest import TestCase
+
+from src.geo import GeoIndex, haversine_km
+
+
+class TestGeoIndex(TestCase):
+    def setUp(self) -> None:
+        rng = random.Random(460)
+        self.index = GeoIndex()
+        self.points = {}
+        for i in range(2000):
+            lat, long = rng.uniform(1.24, 1.47), rng.uniform(103.6, 104.0)
+            self.points[str(i)] = (lat, long)
+            self.index.add(str(i), lat, long)
+
+    def brute_force(self, lat: float, long: float, k: int, radius_km: float):
+        distances = sorted(
+            (haversine_km(lat, long, *point), key) for key, point in self.points.items()
+        )
+        return [(d, key) for d, key in distances if d <= radius_km][:k]
+
+    def test_haversine(self) -> None:
+        # one degree of latitude is about 111 km
+        assert round(haversine_km(1.0, 103.0, 2.0, 103.0)) == 111
+
+    def test_nearest_matches_brute_force(self) -> None:
+        for lat, long in [(1.3521, 103.8198), (1.29, 103.85), (1.44, 103.7)]:
+            for k, radius_km in [(1, 5), (10, 2), (50, 5), (10, 0.1)]:
+                assert self.index.nearest(lat, long, k, radius_km) == (
+                    self.brute_force(lat, long, k, radius_km)
+                )
+
+    def test_add_moves_and_remove(self) -> None:
+        self.index.add("0", 10.0, 10.0)
+        assert self.index.nearest(10.0, 10.0, 1, 1)[0][1] == "0"
+        self.index.remove("0")
+        assert self.index.nearest(10.0, 10.0, 1, 1) == []
+        assert len(self.index) == 1999
@@ -0,0 +1,156 @@
+import threading
+from typing import List
+from unittest import TestCase, mock
+
+from src.help_requests import (
+    FirestoreHelpRequestStore,
+    HelpRequestState,
+    InMemoryHelpRequestStore,
+    percentile,
+)
+from tests.fakes import FakeFirestore
+
+
+class TestInMemoryHelpRequestStore(TestCase):
+    def setUp(self) -> None:
+        self.store = InMemoryHelpRequestStore()
+        self.request = self.store.create("pwid", dict(lat=1.3, long=103.8))
+
+    def test_request_id_fits_in_callback_data(self) -> None:
+        assert len(self.request["id"]) <= 12
+
+    def test_add_recipients(self) -> None:
+        self.store.add_recipients(self.request["id"], {1: 10, 2: 20})
+        record = self.store.get(self.request["id"])
+        assert record["recipients"] == {"1": 10, "2": 20}  # type: ignore
+        assert record["recipient_count"] == 2  # type: ignore
+
+    def test_first_claim_wins(self) -> None:
+        winners: List[str] = []
+        barrier = threading.Barrier(8)
+
+        def claim(username: str) -> None:
+            barrier.wait()
+            if self.store.claim(self.request["id"], username, 1):
+                winners.append(username)
+
+        threads = [
+            threading.Thread(target=claim, args=(f"volunteer{i}",)) for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(winners) == 1
+        assert self.store.get(self.request["id"])["claimed_by"] == winners[0]
+
+    def test_claim_unknown_request(self) -> None:
+        assert self.store.claim("unknown", "volunteer", 1) is None
+
+    def test_lifecycle(self) -> None:
+        request_id = self.request["id"]
+        assert self.request["state"] == HelpRequestState.BROADCAST
+        assert self.store.resolve("unknown") is None
+        claimed = self.store.claim(request_id, "volunteer", 1)
+        assert claimed["state"] == HelpRequestState.CLAIMED  # type: ignore
+        assert claimed["time_to_accept"] >= 0  # type: ignore
+        resolved = self.store.resolve(request_id)
+        assert resolved["state"] == HelpRequestState.RESOLVED  # type: ignore
+        assert resolved["resolved_at"] >= resolved["claimed_at"]  # type: ignore
+        # finished requests cannot move any further
+        assert self.store.expire(request_id) is None
+        assert self.store.open_requests() == []
+
+    def test_expire_stale(self) -> None:
+        other = self.store.create("pwid", dict(lat=1.3, long=103.8))
+        with mock.patch(
+            "src.help_requests.time", return_value=self.request["created_at"] + 60
+        ):
+            expired = self.store.expire_stale(max_age=30)
+        assert {r["id"] for r in expired} == {self.request["id"], other["id"]}
+        assert self.store.get(self.request["id"])["state"] == HelpRequestState.EXPIRED
+
+    def test_stats(self) -> None:
+        for _ in range(3):
+            request = self.store.create("pwid", dict(lat=1.3, long=103.8))
+            self.store.claim(request["id"], "volunteer", 1)
+        stats = self.store.stats()
+        assert stats["accepted"] == 3
+        assert stats["open"] == 4
+        assert stats["time_to_accept"]["p50"] is not None
+        assert (
+            self.store.stats(since=self.store.get(request["id"])["created_at"] + 1)[
+                "accepted"
+            ]
+            == 0
+        )
+
+    def test_times_to_accept_of_newest_requests(self) -> None:
+        for _ in range(3):
+            request = self.store.create("pwid", dict(lat=1.3, long=103.8))
+            self.store.claim(request["id"], "volunteer", 1)
+        assert len(self.store.times_to_accept(limit=2)) == 2
+
+
+class TestFirestoreHelpRequestStore(TestCase):
+    def test_times_to_accept_is_bounded(self) -> None:
+        store = FirestoreHelpRequestStore(FakeFirestore())  # type: ignore
+        for created_at, time_to_accept in [(10, 1.0), (20, 2.0), (30, None), (40, 4)]:
+            request = store.create("pwid", dict(lat=1.3, long=103.8))
+            store.collection.document(request["id"]).update(
+                dict(created_at=created_at, time_to_accept=time_to_accept)
+            )
+        assert store.times_to_accept(since=15) == [2.0, 4]
+        assert store.times_to_accept(since=0, limit=3) == [2.0, 4]
+
+
+class TestRaiseRequest(TestCase):
+    def setUp(self) -> None:
+        self.store = InMemoryHelpRequestStore()
+
+    def test_repeats_update_open_request(self) -> None:
+        request, created = self.store.raise_request("pwid", dict(lat=1.3), 60)
+        assert created
+        repeat, created = self.store.raise_request("pwid", dict(lat=1.4), 60)
+        assert not created
+        assert repeat["id"] == request["id"]
+        assert repeat["location"] == dict(lat=1.4)
+        assert repeat["repeat_count"] == 1
+        assert self.store.raise_request("other", dict(lat=1.3), 60)[1]
+
+    def test_finished_or_old_requests_are_not_reused(self) -> None:
+        request, _ = self.store.raise_request("pwid", dict(lat=1.3), 60)
+        self.store.resolve(request["id"])
+        assert self.store.raise_request("pwid", dict(lat=1.3), 60)[1]
+        with mock.patch(
+            "src.help_requests.time", return_value=request["created_at"] + 120
+        ):
+            assert self.store.raise_request("pwid", dict(lat=1.3), 60)[1]
+        # without a window every press is a new request
+        assert self.store.raise_request("pwid", dict(lat=1.3))[1]
+
+    def test_concurrent_presses_create_one_request(self) -> None:
+        barrier = threading.Barrier(8)
+        created: List[bool] = []
+
+        def press() -> None:
+            barrier.wait()
+            created.append(self.store.raise_request("pwid", dict(lat=1.3), 60)[1])
+
+        threads = [threading.Thread(target=press) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert created.count(True) == 1
+        assert len(self.store.open_requests()) == 1
+
+
+class TestPercentile(TestCase):
+    def test_percentile(self) -> None:
+        values = [float(i) for i in range(1, 101)]
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+        assert percentile([3.0], 50) == 3
+        assert percentile([], 50) is None
@@ -0,0 +1,90 @@
+import logging
+import threading
+from unittest import TestCase
+
+from src.log import (
+    BODY,
+    BackgroundQueueHandler,
+    RedactingFilter,
+    SamplingFilter,
+    parse_sample_rates,
+    redact,
+)
+
+
+class Recorder(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.messages = []
+        self.threads = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(self.format(record))
+        self.threads.append(threading.current_thread())
+
+
+class Formatted:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __str__(self) -> str:
+        self.count += 1
+        return "formatted"
+
+
+class TestLogging(TestCase):
+    def setUp(self) -> None:
+        self.recorder = Recorder()
+        self.logger = logging.getLogger("tests.log")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(setattr, self.logger, "propagate", True)
+
+    def use(self, handler: logging.Handler) -> None:
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+
+    def test_redacts_personal_data(self) -> None:
+        body = {
+            "update_id": 1,
+            "message": {
+                "chat": {"id": 42, "username": "alice", "type": "private"},
+                "text": "/start",
+            },
+        }
+        redacted = redact(body)
+        chat = redacted["message"]["chat"]
+        self.assertNotIn("alice", str(redacted))
+        self.assertNotIn("42", str(chat))
+        self.assertEqual(chat["type"], "private")
+        self.assertEqual(redacted["update_id"], 1)
+        self.assertEqual(redact(body), redacted)
+        self.assertEqual(body["message"]["chat"]["username"], "alice")
+
+    def test_formats_and_writes_on_listener_thread(self) -> None:
+        self.recorder.addFilter(RedactingFilter())
+        handler = BackgroundQueueHandler(self.recorder)
+        self.use(handler)
+        self.logger.info("request body: %s", {"username": "alice"}, extra=BODY)
+        handler.stop()
+        self.assertEqual(len(self.recorder.messages), 1)
+        self.assertNotIn("alice", self.recorder.messages[0])
+        self.assertIsNot(self.recorder.threads[0], threading.current_thread())
+
+    def test_sampled_out_records_are_not_formatted(self) -> None:
+        self.recorder.addFilter(SamplingFilter(parse_sample_rates("body=0")))
+        self.use(self.recorder)
+        arg = Formatted()
+        self.logger.info("body: %s", arg, extra=BODY)
+        self.logger.info("other: %s", arg)
+        self.logger.warning("body: %s", arg, extra=BODY)
+        self.assertEqual(
+            self.recorder.messages, ["other: formatted", "body: formatted"]
+        )
+        self.assertEqual(arg.count, 2)
+
+    def test_parse_sample_rates(self) -> None:
+        self.assertEqual(
+            parse_sample_rates("body=0.1, src.telegram=0.5"),
+            {"body": 0.1, "src.telegram": 0.5},
+        )
@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from src.matching import PreferenceMatcher
+
+
+class TestPreferenceMatcher(TestCase):
+    def setUp(self) -> None:
+        self.matcher = PreferenceMatcher()
+        self.matcher.add("alice", "F", "en")
+        self.matcher.add("bob", "M", ["en", "cn"])
+        self.matcher.add("carol", "F", ["hk"])
+
+    def test_match(self) -> None:
+        assert self.matcher.match() is None
+        assert self.matcher.match(gender="F") == {"alice", "carol"}
+        assert self.matcher.match(language="en") == {"alice", "bob"}
+        assert self.matcher.match(gender="F", language="en") == {"alice"}
+        assert self.matcher.match(gender="M", language="hk") == set()
+
+    def test_update_and_remove(self) -> None:
+        self.matcher.add("alice", "F", "cn")
+        assert self.matcher.match(language="en") == {"bob"}
+        self.matcher.remove("bob")
+        assert self.matcher.match(language="cn") == {"alice"}
+        assert len(self.matcher) == 2
+
+    def test_rank_keeps_order_within_groups(self) -> None:
+        ranked = self.matcher.rank(["carol", "bob", "alice"], language="en")
+        assert ranked == ["bob", "alice", "carol"]
+
+    def test_predicate(self) -> None:
+        assert self.matcher.predicate() is None
+        matches = self.matcher.predicate(gender="F", language="en")
+        assert [key for key in ["alice", "bob", "carol"] if matches(key)] == ["alice"]
@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+from src.metrics import Counter, Histogram, Registry
+
+
+class TestMetrics(TestCase):
+    def test_counter(self) -> None:
+        counter = Counter("requests_total", "Requests.", ["method"])
+        counter.inc("sendMessage")
+        counter.inc("sendMessage", amount=2)
+        assert counter.value("sendMessage") == 3
+        assert counter.samples() == ['requests_total{method="sendMessage"} 3']
+
+    def test_histogram(self) -> None:
+        histogram = Histogram("latency_seconds", "Latency.", ["op"], buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, "get")
+        assert histogram.count("get") == 4
+        assert histogram.samples() == [
+            'latency_seconds_bucket{op="get",le="0.1"} 2',
+            'latency_seconds_bucket{op="get",le="1"} 3',
+            'latency_seconds_bucket{op="get",le="+Inf"} 4',
+            'latency_seconds_sum{op="get"} 5.65',
+            'latency_seconds_count{op="get"} 4',
+        ]
+
+    def test_timed(self) -> None:
+        histogram = Histogram("latency_seconds", "Latency.", ["op"])
+
+        @histogram.timed("call")
+        def call() -> int:
+            return 1
+
+        assert call() == 1
+        with histogram.time("block"):
+            pass
+        assert histogram.count("call") == histogram.count("block") == 1
+
+    def test_render(self) -> None:
+        registry = Registry()
+        counter = registry.register(Counter("up", "Up."))
+        counter.inc()
+        assert registry.render() == "# HELP up Up.\n# TYPE up counter\nup 1\n"
+
+    def test_escapes_label_values(self) -> None:
+        counter = Counter("errors_total", "Errors.", ["error"])
+        counter.inc('bad "quote"')
+        assert counter.samples() == ['errors_total{error="bad \\"quote\\""} 1']
@@ -0,0 +1,76 @@
+import threading
+from unittest import TestCase, mock
+
+from src.pwid_profiles import CachedPwidProfileStore, InMemoryPwidProfileStore
+
+PROFILE = dict(name="Jane Tan", caregiver_contact="+65 9123 4567")
+
+
+class TestCachedPwidProfileStore(TestCase):
+    def setUp(self) -> None:
+        self.store = InMemoryPwidProfileStore()
+        self.store.set("1", PROFILE)
+        self.get = mock.Mock(wraps=self.store.get)
+        self.store.get = self.get  # type: ignore
+        self.profiles = CachedPwidProfileStore(self.store, maxsize=2, ttl=60)
+
+    def test_get_is_cached(self) -> None:
+        assert self.profiles.get("1")["name"] == "Jane Tan"  # type: ignore
+        assert self.profiles.get("1")["name"] == "Jane Tan"  # type: ignore
+        # a missing profile is cached too
+        assert self.profiles.get("2") is None
+        assert self.profiles.get("2") is None
+        assert self.get.call_count == 2
+
+    def test_prefetch(self) -> None:
+        loaded = threading.Event()
+        release = threading.Event()
+
+        def slow_get(pwid_id: str) -> dict:
+            loaded.set()
+            release.wait(5)
+            return dict(PROFILE, id=pwid_id)
+
+        self.get.side_effect = slow_get
+        self.profiles.prefetch("1")
+        assert loaded.wait(5)
+        self.profiles.prefetch("1")
+        release.set()
+        # waits for the load in flight instead of starting another one
+        assert self.profiles.get("1")["id"] == "1"  # type: ignore
+        assert self.get.call_count == 1
+
+    def test_get_times_out(self) -> None:
+        release = threading.Event()
+
+        def slow_get(pwid_id: str) -> dict:
+            release.wait(5)
+            return dict(PROFILE, id=pwid_id)
+
+        self.get.side_effect = slow_get
+        with self.assertRaises(TimeoutError):
+            self.profiles.get("1", timeout=0.05)
+        release.set()
+        # the load went on in the background and is cached
+        assert self.profiles.get("1")["id"] == "1"  # type: ignore
+        assert self.get.call_count == 1
+
+    def test_expiry_and_eviction(self) -> None:
+        for pwid_id in ("1", "2", "3"):
+            self.profiles.get(pwid_id)
+        assert len(self.profiles) == 2
+        self.profiles.get("1")
+        assert self.get.call_count == 4
+        with mock.patch("src.pwid_profiles.monotonic", return_value=10**9):
+            self.profiles.get("1")
+        assert self.get.call_count == 5
+
+    def test_set_and_invalidate(self) -> None:
+        self.profiles.get("1")
+        self.profiles.set("1", dict(PROFILE, name="Jane Lim"))
+        assert self.profiles.get("1")["name"] == "Jane Lim"  # type: ignore
+        self.store.set("1", dict(PROFILE, name="Jane Ong"))
+        assert self.profiles.get("1")["name"] == "Jane Lim"  # type: ignore
+        assert self.profiles.invalidate("1")
+        assert not self.profiles.invalidate("1")
+        assert self.profiles.get("1")["name"] == "Jane Ong"  # type: ignore
@@ -0,0 +1,80 @@
+from unittest import TestCase, mock
+
+from src.security_images import DEFAULT_ICON, SecurityImageAllocator
+from tests.fakes import FakeFirestore
+
+NOW = 1_700_000_000
+
+
+class TestSecurityImageAllocator(TestCase):
+    def setUp(self) -> None:
+        self.db = FakeFirestore()
+        icons = self.db.collection("icon_names")
+        for value, updated_at in [("STAR", 30), ("SMILE", 10), ("MOON", 20)]:
+            icons.document(value).set(
+                dict(value=value, available=True, updated_at=updated_at)
+            )
+        self.allocator = SecurityImageAllocator(self.db, lease_ttl=60)
+        patcher = mock.patch("src.security_images.time", return_value=NOW)
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.allocator.buffer.close)
+
+    def test_allocates_least_recently_used_first(self) -> None:
+        icons = [self.allocator.allocate(f"request{i}") for i in range(3)]
+        assert icons == ["SMILE", "MOON", "STAR"]
+
+    def test_same_request_keeps_its_icon(self) -> None:
+        icon = self.allocator.allocate("request")
+        assert self.allocator.allocate("request") == icon
+        assert self.allocator.allocate("other") != icon
+
+    def test_icons_include_leased_ones(self) -> None:
+        self.allocator.allocate("request0")
+        assert self.allocator.icons() == ["MOON", "SMILE", "STAR"]
+
+    def test_release_returns_icon_to_pool(self) -> None:
+        self.allocator.allocate("request0")
+        assert self.allocator.release("request0") == "SMILE"
+        assert self.allocator.release("request0") is None
+        assert self.allocator.leases() == {}
+        # released last, so used again last
+        icons = [self.allocator.allocate(f"request{i}") for i in range(1, 4)]
+        assert icons == ["MOON", "STAR", "SMILE"]
+
+    def test_expired_lease_is_freed(self) -> None:
+        self.allocator.allocate("request0")
+        self.allocator.allocate("request1")
+        self.time.return_value = NOW + 60
+        assert self.allocator.allocate("request2") == "STAR"
+        assert self.allocator.leases() == dict(request2="STAR")
+        assert self.allocator.allocate("request3") in ("SMILE", "MOON")
+
+    def test_takes_over_oldest_lease_when_pool_is_empty(self) -> None:
+        for i in range(3):
+            self.time.return_value = NOW + i
+            self.allocator.allocate(f"request{i}")
+        assert self.allocator.allocate("request3") == "SMILE"
+        assert "request0" not in self.allocator.leases()
+
+    def test_recent_lease_of_another_worker_is_kept(self) -> None:
+        self.db.collection("icon_names").document("SMILE").update(
+            dict(available=False, updated_at=NOW - 10)
+        )
+        icons = {self.allocator.allocate(f"request{i}") for i in range(2)}
+        assert icons == {"MOON", "STAR"}
+
+    def test_syncs_back_in_batches(self) -> None:
+        self.allocator.allocate("request0")
+        self.allocator.allocate("request1")
+        self.allocator.release("request0")
+        commits = self.db.commits
+        self.allocator.buffer.flush()
+        assert self.db.commits == commits + 1
+        icons = self.db.collection("icon_names")
+        assert icons.document("SMILE").get().to_dict()["available"]
+        assert not icons.document("MOON").get().to_dict()["available"]
+
+    def test_empty_pool(self) -> None:
+        allocator = SecurityImageAllocator(FakeFirestore())
+        assert allocator.allocate("request") == DEFAULT_ICON
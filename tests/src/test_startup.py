@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from unittest import TestCase, mock
+
+from src import firebase
+
+ROOT = Path(__file__).parents[2]
+# seconds; importing the app used to take about 0.6s, mostly the Firebase SDK
+IMPORT_TIME_BUDGET = 1.0
+
+IMPORT_APP = """
+import sys
+from time import perf_counter
+
+started_at = perf_counter()
+import src.app
+print(perf_counter() - started_at)
+sdks = ("firebase_admin", "google.cloud.firestore")
+print(",".join(sdk for sdk in sdks if sdk in sys.modules))
+"""
+
+
+class TestStartup(TestCase):
+    def test_import_is_fast_and_offline(self) -> None:
+        env = {k: v for k, v in os.environ.items() if k != "TELEGRAM_BOT_TOKEN"}
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_APP],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed, loaded = result.stdout.splitlines()[-2:]
+        assert float(elapsed) < IMPORT_TIME_BUDGET
+        assert loaded == ""
+
+    def test_forked_child_creates_its_own_client(self) -> None:
+        with mock.patch.object(firebase, "_client", object()):
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if firebase._client is None else 1)
+            _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
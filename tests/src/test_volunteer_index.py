@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+from typing import Any, Callable, List, Union
+from unittest import TestCase
+
+from src.rest import Json
+from src.volunteer_index import AvailableVolunteerIndex
+
+
+class FakeDocument:
+    def __init__(self, id: str, data: Union[Json, None]) -> None:
+        self.id = id
+        self.data = data
+
+    def to_dict(self) -> Union[Json, None]:
+        return self.data
+
+
+class FakeQuery:
+    """Stands in for a Firestore query with a snapshot listener."""
+
+    def __init__(self, docs: List[FakeDocument]) -> None:
+        self.docs = docs
+        self.callback: Union[Callable, None] = None
+        self.unsubscribed = False
+
+    def get(self) -> List[FakeDocument]:
+        return self.docs
+
+    def on_snapshot(self, callback: Callable) -> Any:
+        self.callback = callback
+        return SimpleNamespace(unsubscribe=self.unsubscribe)
+
+    def unsubscribe(self) -> None:
+        self.unsubscribed = True
+
+    def emit(self, change_type: str, doc: FakeDocument) -> None:
+        change = SimpleNamespace(type=SimpleNamespace(name=change_type), document=doc)
+        self.callback([], [change], None)  # type: ignore
+
+
+def volunteer(username: str, available: bool = True) -> FakeDocument:
+    return FakeDocument(
+        username, dict(username=username, chat_id=1, available=available)
+    )
+
+
+class TestAvailableVolunteerIndex(TestCase):
+    def setUp(self) -> None:
+        self.query = FakeQuery([volunteer("alice"), volunteer("bob", False)])
+        self.index = AvailableVolunteerIndex()
+        self.index.start(lambda: self.query)
+
+    def test_start_loads_available_volunteers(self) -> None:
+        assert list(self.index.volunteers()) == ["alice"]
+
+    def test_start_only_once(self) -> None:
+        self.index.start(lambda: self.fail("query created twice"))
+
+    def test_listener_changes(self) -> None:
+        self.query.emit("ADDED", volunteer("carol"))
+        self.query.emit("MODIFIED", volunteer("alice", False))
+        assert list(self.index.volunteers()) == ["carol"]
+        self.query.emit("REMOVED", volunteer("carol"))
+        assert self.index.volunteers() == {}
+
+    def test_write_through(self) -> None:
+        self.index.update("alice", dict(available=False))
+        assert "alice" not in self.index
+        self.index.update("bob", dict(available=True, chat_id=2))
+        assert self.index.volunteers()["bob"]["chat_id"] == 2
+
+    def test_stop_unsubscribes(self) -> None:
+        self.index.stop()
+        assert self.query.unsubscribed
+        assert len(self.index) == 0
+
+    def test_nearest(self) -> None:
+        near = dict(available=True, location=dict(lat=1.30, long=103.80))
+        far = dict(available=True, location=dict(lat=1.40, long=103.90))
+        self.index.update("near", near)
+        self.index.update("far", far)
+        result = self.index.nearest(1.30, 103.80, 5, 5)
+        assert [volunteer for _, volunteer in result] == [near]
+        self.index.update("near", dict(available=False))
+        assert self.index.nearest(1.30, 103.80, 5, 5) == []
+
+    def test_select_ranks_matching_volunteers_first(self) -> None:
+        for username, lat, gender in [("a", 1.301, "M"), ("b", 1.302, "F")]:
+            self.index.update(
+                username,
+                dict(
+                    available=True,
+                    gender=gender,
+                    location=dict(lat=lat, long=103.8),
+                ),
+            )
+        select = self.index.select
+        assert [v["gender"] for v in select(1.3, 103.8, 5, 5)] == ["M", "F"]
+        assert [v["gender"] for v in select(1.3, 103.8, 5, 5, "F")] == ["F", "M"]
+        assert [v["gender"] for v in select(1.3, 103.8, 1, 5, "F")] == ["F"]
+        # nobody within range: every available volunteer is ranked by needs
+        far_away = select(10.0, 10.0, 5, 5, "F")
+        assert [v.get("gender") for v in far_away] == ["F", None, "M"]
+
+    def test_select_waves_reach_beyond_the_radius(self) -> None:
+        self.index.stop()
+        located = [("near", 1.301), ("wider", 1.35)]
+        located += [(f"far{i}", 1.5 + i * 0.01) for i in range(50)]
+        for username, lat in located:
+            location = dict(lat=lat, long=103.8)
+            data = dict(username=username, available=True, location=location)
+            self.index.update(username, data)
+        for i in range(200):
+            username = f"unlocated{i}"
+            self.index.update(username, dict(username=username, available=True))
+        waves = [
+            [volunteer["username"] for volunteer in wave]
+            for wave in self.index.select_waves(1.3, 103.8, [5, 15], 5, 2)
+        ]
+        # the second wave doubles the radius, the last one takes everybody left
+        assert waves[:2] == [["near"], ["wider"]]
+        assert len(waves) == 3
+        assert len(waves[2]) == 250
+        assert {"far0", "unlocated0"} <= set(waves[2])
+
+    def test_select_waves_without_anybody_in_range(self) -> None:
+        # the waves in range are empty, so everybody is alerted at once
+        waves = self.index.select_waves(10.0, 10.0, [5, 15], 5, 2, "F")
+        assert [[v["username"] for v in wave] for wave in waves] == [["alice"]]
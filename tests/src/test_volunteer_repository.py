@@ -0,0 +1,108 @@
+from typing import List
+from unittest import TestCase, mock
+
+from src.volunteer_index import AvailableVolunteerIndex
+from src.volunteer_repository import (
+    InMemoryVolunteerRepository,
+    SQLiteVolunteerRepository,
+    VolunteerNotFound,
+    VolunteerRepository,
+)
+
+
+class VolunteerRepositoryTests:
+    repository: VolunteerRepository
+
+    def make_repository(self) -> VolunteerRepository:
+        raise NotImplementedError
+
+    def setUp(self) -> None:
+        self.repository = self.make_repository()
+        self.repository.create("alice", dict(available=True, gender="F", language="en"))
+        self.repository.create(
+            "bob", dict(available=True, gender="M", language=["en", "cn"])
+        )
+        self.repository.create("carol", dict(available=False, gender="F"))
+
+    def usernames(self, records: List) -> List[str]:
+        return sorted(record["username"] for record in records)
+
+    def test_get(self) -> None:
+        assert self.repository.get("alice")["gender"] == "F"  # type: ignore
+        assert self.repository.get("unknown") is None
+
+    def test_create_existing(self) -> None:
+        assert not self.repository.create("alice", dict(available=False))
+        assert self.repository.get("alice")["available"]  # type: ignore
+
+    def test_update(self) -> None:
+        self.repository.update("alice", dict(language="cn", location=dict(lat=1.3)))
+        record = self.repository.get("alice")
+        assert record["language"] == "cn"  # type: ignore
+        assert record["location"] == dict(lat=1.3)  # type: ignore
+        assert record["gender"] == "F"  # type: ignore
+
+    def test_update_unknown(self) -> None:
+        with self.assertRaises(VolunteerNotFound):  # type: ignore
+            self.repository.update("unknown", dict(available=True))
+
+    def test_list_available(self) -> None:
+        available = self.repository.list_available
+        assert self.usernames(available()) == ["alice", "bob"]
+        assert self.usernames(available(gender="F")) == ["alice"]
+        assert self.usernames(available(language="cn")) == ["bob"]
+        assert self.usernames(available(gender="F", language="cn")) == []
+
+    def test_stream(self) -> None:
+        assert self.usernames(self.repository.stream()) == ["alice", "bob", "carol"]
+
+    def test_index_follows_writes(self) -> None:
+        index = AvailableVolunteerIndex()
+        index.start(self.repository.available_query)
+        assert set(index.volunteers()) == {"alice", "bob"}
+        self.repository.update("carol", dict(available=True))
+        self.repository.update("alice", dict(available=False))
+        assert set(index.volunteers()) == {"bob", "carol"}
+        index.stop()
+        self.repository.update("alice", dict(available=True))
+        assert not index.volunteers()
+
+
+class TestInMemoryVolunteerRepository(VolunteerRepositoryTests, TestCase):
+    def make_repository(self) -> VolunteerRepository:
+        return InMemoryVolunteerRepository()
+
+
+class TestSQLiteVolunteerRepository(VolunteerRepositoryTests, TestCase):
+    def make_repository(self) -> VolunteerRepository:
+        return SQLiteVolunteerRepository()
+
+    def query_plan(self, gender: str, language: str) -> str:
+        sql = (
+            "SELECT data FROM volunteers WHERE available = 1 AND gender = ? AND "
+            "username IN (SELECT username FROM volunteer_languages WHERE language = ?)"
+        )
+        rows = self.repository.connection.execute(  # type: ignore
+            f"EXPLAIN QUERY PLAN {sql}", (gender, language)
+        ).fetchall()
+        return " ".join(row[-1] for row in rows)
+
+    def test_list_available_uses_indexes(self) -> None:
+        plan = self.query_plan("F", "en")
+        assert "volunteers_available_gender" in plan
+        assert "volunteer_languages_language" in plan
+
+    def test_connects_in_each_process(self) -> None:
+        repository = SQLiteVolunteerRepository()
+        assert repository._conn is None
+        repository.create("alice", dict(available=True))
+        parent = repository.connection
+        with mock.patch("src.volunteer_repository.os.getpid", return_value=-1):
+            # a forked worker opens its own connection to the database
+            assert repository.connection is not parent
+            assert repository.get("alice") is None
+
+    def test_failed_update_is_rolled_back(self) -> None:
+        with self.assertRaises(TypeError):
+            self.repository.update("alice", dict(location=object()))
+        assert "location" not in self.repository.get("alice")  # type: ignore
@@ -0,0 +1,100 @@
+import threading
+from unittest import TestCase, mock
+
+from google.api_core.exceptions import ServiceUnavailable
+
+from src.volunteer_repository import WriteBehindVolunteerRepository
+from tests.fakes import FakeFirestore
+from tests.fakes.firestore import FakeWriteBatch
+
+
+class TestWriteBehindVolunteerRepository(TestCase):
+    def setUp(self) -> None:
+        self.db = FakeFirestore()
+        # a long interval, so only the tests flush
+        self.repository = WriteBehindVolunteerRepository(
+            self.db, flush_size=100, flush_interval=60
+        )
+        self.buffer = self.repository.buffer
+        self.repository.create("alice", dict(available=False, gender="F"))
+        self.repository.create("bob", dict(available=True, gender="M"))
+        self.addCleanup(self.buffer.close)
+
+    def stored(self, username: str) -> dict:
+        return self.db.collection("users").document(username).get().to_dict()
+
+    def test_updates_are_coalesced(self) -> None:
+        writes = self.db.writes
+        self.repository.update("alice", dict(gender="M", updated_at=1))
+        self.repository.update("alice", dict(language="en", updated_at=2))
+        self.repository.update("bob", dict(updated_at=3))
+        assert self.db.writes == writes
+        assert self.buffer.flush() == 2
+        assert self.db.commits == 1
+        assert self.db.writes == writes + 2
+        assert self.stored("alice") == dict(
+            username="alice", available=False, gender="M", language="en", updated_at=2
+        )
+
+    def test_reads_see_pending_updates(self) -> None:
+        self.repository.update("alice", dict(available=True, language="en"))
+        self.repository.update("bob", dict(available=False))
+        assert self.repository.get("alice")["available"]  # type: ignore
+        assert not self.stored("alice")["available"]
+        available = self.repository.list_available(language="en")
+        assert [record["username"] for record in available] == ["alice"]
+        streamed = {r["username"]: r["available"] for r in self.repository.stream()}
+        assert streamed == dict(alice=True, bob=False)
+
+    def test_flushes_when_full(self) -> None:
+        self.buffer.flush_size = 2
+        flushed = threading.Event()
+        flush = self.buffer.flush
+        self.buffer.flush = lambda: flushed.set() or flush()  # type: ignore
+        self.repository.update("alice", dict(updated_at=1))
+        self.repository.update("bob", dict(updated_at=1))
+        assert flushed.wait(5)
+
+    def test_missing_volunteer_does_not_block_others(self) -> None:
+        self.repository.update("unknown", dict(available=True))
+        self.repository.update("alice", dict(available=True))
+        assert self.buffer.flush() == 1
+        assert self.stored("alice")["available"]
+        assert self.stored("unknown") is None
+        assert self.buffer.failed == 1
+
+    def test_close_flushes(self) -> None:
+        self.repository.update("alice", dict(available=True))
+        self.buffer.close()
+        assert self.stored("alice")["available"]
+        assert len(self.buffer) == 0
+
+    def test_failed_batch_is_requeued(self) -> None:
+        self.repository.update("alice", dict(available=True, updated_at=1))
+        with mock.patch.object(
+            FakeWriteBatch, "commit", side_effect=ServiceUnavailable("down")
+        ):
+            assert self.buffer.flush() == 0
+        self.repository.update("alice", dict(updated_at=2))
+        assert self.buffer.pending("alice") == dict(available=True, updated_at=2)
+        assert self.buffer.flush() == 1
+        assert self.stored("alice")["updated_at"] == 2
+
+    def test_any_failure_is_requeued(self) -> None:
+        self.repository.update("alice", dict(available=True))
+        with mock.patch.object(FakeWriteBatch, "commit", side_effect=TimeoutError()):
+            assert self.buffer.flush() == 0
+        assert self.buffer.pending("alice") == dict(available=True)
+        assert self.buffer.flush() == 1
+
+    def test_reads_see_updates_being_committed(self) -> None:
+        self.repository.update("alice", dict(available=True))
+        seen = []
+
+        def commit(batch: FakeWriteBatch) -> None:
+            seen.append(self.repository.get("alice")["available"])
+
+        with mock.patch.object(FakeWriteBatch, "commit", commit):
+            self.buffer.flush()
+        assert seen == [True]
+        assert self.buffer.pending("alice") is None